@@ -1,31 +1,44 @@
-from fastapi import APIRouter, Depends, Query, status, Body
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Query, Request, status, Body
+from pydantic_core import to_json
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
-from app.db import get_db
+from app.db import get_async_read_db, get_async_write_db
 from app import models
 from app.schemas.campaigns import CampaignLocalOut, CampaignCreate, CampaignUpdate, Advertiser as AdvertiserSchema
 from app.schemas.pagination import PaginatedResponse, SortByField, SortOrder
 from app.cruds import campaigns as crud
+from app.cache import cached_json_response
 
 router = APIRouter(tags=["Local - Campaigns & Advertiser"])
 
-@router.get("/advertisers", response_model=List[AdvertiserSchema])
-def list_advertisers(db: Session = Depends(get_db)):
-    return crud.get_advertisers(db)
+not_modified = {304: {"description": "Not Modified - matches the If-None-Match ETag"}}
 
-@router.get("/campaigns", response_model=PaginatedResponse[CampaignLocalOut])
-def list_local_campaigns(
-    db: Session = Depends(get_db),
-    search: Optional[str] = Query(None, description="Search by title"),
+@router.get("/advertisers", response_model=List[AdvertiserSchema], responses=not_modified)
+async def list_advertisers(request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    async def build():
+        return to_json(await crud.get_advertisers(db))
+    return await cached_json_response(request, db, build)
+
+@router.get("/campaigns", response_model=PaginatedResponse[CampaignLocalOut], responses=not_modified)
+async def list_local_campaigns(
+    request: Request,
+    db: AsyncSession = Depends(get_async_read_db),
+    search: Optional[str] = Query(None, description="Full-text search over title, advertiser and agency name (every word matched as a prefix)"),
     advertiser_id: Optional[str] = Query(None, description="Filter by advertiser ID (exact match)"),
     archived: Optional[bool] = Query(None, description="Filter by archived status"),
-    sort_by: SortByField = Query("created_at", description="Field to sort by"),
+    sort_by: SortByField = Query("created_at", description="Field to sort by ('relevance' ranks search matches)"),
     sort_order: SortOrder = Query("desc", description="Sort order: 'asc' or 'desc'"),
-    page: int = Query(1, ge=1, description="Page number"),
-    per_page: int = Query(20, ge=1, le=100, description="Items per page")
+    page: int = Query(1, ge=1, description="Page number (ignored when cursor is set)"),
+    per_page: int = Query(20, ge=1, le=100, description="Items per page"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from meta.next_cursor for keyset pagination"),
+    include_total: bool = Query(True, description="Count all matching rows (set to false to skip the count query)")
 ):
-    return crud.list_campaigns(db, search, advertiser_id, archived, sort_by, sort_order, page, per_page)
+    async def build():
+        return to_json(await crud.list_campaigns(
+            db, search, advertiser_id, archived, sort_by, sort_order, page, per_page, cursor, include_total
+        ))
+    return await cached_json_response(request, db, build)
 
 @router.post(
     "/campaigns",
@@ -37,16 +50,16 @@ def list_local_campaigns(
         }
     },
 )
-def create_campaign(campaign: CampaignCreate, db: Session = Depends(get_db)):
-    return crud.create_campaign(db, campaign)
+async def create_campaign(campaign: CampaignCreate, db: AsyncSession = Depends(get_async_write_db)):
+    return await crud.create_campaign(db, campaign)
 
 @router.get(
     "/campaigns/{campaign_id}",
     response_model=CampaignLocalOut,
     responses={404: {"description": "Not Found - Campaign not found"}},
 )
-def get_campaign(campaign_id: str, db: Session = Depends(get_db)):
-    return crud.get_campaign_by_id(db, campaign_id)
+async def get_campaign(campaign_id: str, db: AsyncSession = Depends(get_async_read_db)):
+    return await crud.get_campaign_by_id(db, campaign_id)
 
 @router.put(
     "/campaigns/{campaign_id}",
@@ -58,17 +71,17 @@ def get_campaign(campaign_id: str, db: Session = Depends(get_db)):
         404: {"description": "Not Found - Campaign not found"},
     },
 )
-def update_campaign(campaign_id: str, campaign: CampaignUpdate, db: Session = Depends(get_db)):
-    return crud.update_campaign(db, campaign_id, campaign)
+async def update_campaign(campaign_id: str, campaign: CampaignUpdate, db: AsyncSession = Depends(get_async_write_db)):
+    return await crud.update_campaign(db, campaign_id, campaign)
 
 @router.put(
     "/campaigns/{campaign_id}/archive",
     response_model=CampaignLocalOut,
     responses={404: {"description": "Not Found - Campaign not found"}},
 )
-def toggle_campaign_archive(
+async def toggle_campaign_archive(
     campaign_id: str,
     archived: bool = Body(..., embed=True, description="Set to true to archive, false to unarchive"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_write_db)
 ):
-    return crud.archive_campaign(db, campaign_id, archived)
\ No newline at end of file
+    return await crud.archive_campaign(db, campaign_id, archived)
\ No newline at end of file
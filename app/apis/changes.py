@@ -0,0 +1,47 @@
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import Optional, Literal
+
+from app.db import get_db
+from app.changes import list_changes, latest_seq
+from app.change_stream import campaign_events
+from app.schemas.changes import ChangeFeed, ChangeOut
+
+router = APIRouter(tags=["Changes"])
+
+@router.get("/changes", response_model=ChangeFeed)
+def get_changes(
+    db: Session = Depends(get_db),
+    since: int = Query(0, ge=0, description="Return changes with a sequence number greater than this"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of changes to return"),
+    entity: Optional[Literal["campaigns", "advertisers", "agencies"]] = Query(None, description="Only changes to this table")
+):
+    # Fetch one extra row to know whether the consumer should keep polling straight away
+    rows = list_changes(db, since, limit + 1, entity)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "items": [ChangeOut.model_validate(row) for row in rows],
+        "next_since": rows[-1].seq if rows else since,
+        "latest_seq": latest_seq(db),
+        "has_more": has_more,
+    }
+
+@router.get(
+    "/changes/campaigns/stream",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}, "description": "Server-sent `campaign` events; each `data` is a change record"}},
+)
+def stream_campaign_changes(
+    since: Optional[int] = Query(None, ge=0, description="Replay changes after this sequence number (default: only new changes)"),
+    advertiser_id: Optional[str] = Query(None, description="Only campaigns of this advertiser"),
+    archived: Optional[bool] = Query(None, description="Only campaigns with this archived status"),
+    last_event_id: Optional[int] = Header(None, ge=0, description="Sent by EventSource on reconnect; takes precedence over since")
+):
+    start = last_event_id if last_event_id is not None else since
+    return StreamingResponse(
+        campaign_events(start, advertiser_id, archived),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
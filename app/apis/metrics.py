@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from app.metrics import metrics_registry
+
+router = APIRouter(tags=["Metrics"])
+
+# Async so a scrape never waits for a worker thread, even when the threadpool is exhausted
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
@@ -1,25 +1,31 @@
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import JSONResponse
 from typing import List
-import requests
-from app import megaphone_client
+import httpx
+from app.async_megaphone_client import client as megaphone_client
+from app.megaphone_client import rate_limiter
 from app.schemas import remote as schemas
 
 
 router = APIRouter(prefix="/remote", tags=["Remote - Campaigns & Advertisers"])
 
+@router.get("/rate-limit", response_model=schemas.RateLimitStats)
+def fetch_rate_limit_stats():
+    # Per-process counters; the token budget itself is shared across workers
+    return rate_limiter.stats.snapshot()
+
 @router.get("/advertisers", response_model=List[schemas.AdvertiserOut])
-def fetch_remote_advertisers():
+async def fetch_remote_advertisers():
     try:
-        advertisers = megaphone_client.list_advertisers()
+        advertisers = await megaphone_client.list_advertisers()
         return advertisers
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/campaigns", response_model=List[schemas.CampaignOut])
-def fetch_remote_campaigns():
+async def fetch_remote_campaigns():
     try:
-        campaigns = megaphone_client.list_campaigns()
+        campaigns = await megaphone_client.list_campaigns()
         return campaigns
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -31,11 +37,11 @@ def fetch_remote_campaigns():
         400: {"description": "Bad Request - Invalid input."},
     },
 )
-def create_remote_campaign(campaign: schemas.CampaignCreate):
+async def create_remote_campaign(campaign: schemas.CampaignCreate):
     try:
-        result = megaphone_client.create_campaign(campaign.dict(exclude_none=True))
+        result = await megaphone_client.create_campaign(campaign.dict(exclude_none=True))
         return result
-    except requests.exceptions.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         # If Megaphone returns a body
         try:
             error_detail = e.response.json()
@@ -48,11 +54,11 @@ def create_remote_campaign(campaign: schemas.CampaignCreate):
         raise HTTPException(status_code=500, detail=str(e))
     
 @router.get("/campaigns/{campaign_id}", response_model=schemas.CampaignOut)
-def fetch_single_remote_campaign(campaign_id: str):
+async def fetch_single_remote_campaign(campaign_id: str):
     try:
-        result = megaphone_client.get_campaign(campaign_id)
+        result = await megaphone_client.get_campaign(campaign_id)
         return result
-    except requests.exceptions.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         try:
             return JSONResponse(status_code=e.response.status_code, content={"detail": e.response.json()})
         except Exception:
@@ -67,11 +73,11 @@ def fetch_single_remote_campaign(campaign_id: str):
         400: {"description": "Bad Request - Invalid input."},
     },
 )
-def update_remote_campaign(campaign_id: str, campaign: schemas.CampaignUpdate):
+async def update_remote_campaign(campaign_id: str, campaign: schemas.CampaignUpdate):
     try:
-        result = megaphone_client.update_campaign(campaign_id, campaign.dict(exclude_none=True))
+        result = await megaphone_client.update_campaign(campaign_id, campaign.dict(exclude_none=True))
         return result
-    except requests.exceptions.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         try:
             return JSONResponse(status_code=e.response.status_code, content={"detail": e.response.json()})
         except Exception:
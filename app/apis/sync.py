@@ -1,8 +1,13 @@
-from fastapi import APIRouter, Depends
+from typing import List, Optional, Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from app.db import get_db
-from app.cruds.sync import sync_all_campaigns, sync_all_advertisers
-from app.schemas.sync_response import SyncResponse
+from app.models import SyncRun, SyncFailure
+from app.megaphone_client import iter_campaign_pages, iter_advertiser_pages
+from app.cruds.sync import sync_all_campaigns, sync_all_advertisers, retry_failed_campaigns
+from app.cruds.bulk_sync import bulk_sync_all_campaigns, bulk_sync_all_advertisers
+from app.sync_jobs import submit_sync
+from app.schemas.sync_response import SyncResponse, SyncRunOut, SyncJobAccepted, SyncJobOut, SyncFailureOut
 
 router = APIRouter(prefix="/sync", tags=["Sync"])
 
@@ -27,13 +32,78 @@ def generate_sync_response(resource: str, upserted: int, failed: int, deleted: i
         "deleted": deleted
     }
 
-@router.post("/advertisers", response_model=SyncResponse)
-def sync_advertisers(db: Session = Depends(get_db)):
-    res = sync_all_advertisers(db)
-    return generate_sync_response("Advertisers", res.get("upserted"), res.get("failed"), res.get("deleted"))
+# resource -> (page fetcher, per-record sync, bulk sync)
+SYNCERS = {
+    "advertisers": (iter_advertiser_pages, sync_all_advertisers, bulk_sync_all_advertisers),
+    "campaigns": (iter_campaign_pages, sync_all_campaigns, bulk_sync_all_campaigns),
+}
 
-@router.post("/campaigns", response_model=SyncResponse)
-def sync_campaigns(db: Session = Depends(get_db)):
-    res = sync_all_campaigns(db)
-    return generate_sync_response("Campaigns", res.get("upserted"), res.get("failed"), res.get("deleted"))
+def enqueue_resource_sync(resource: str, bulk: bool, incremental: bool, response: Response, retry_failed: bool = False) -> dict:
+    fetch_pages, per_record_sync, bulk_sync = SYNCERS[resource]
 
+    def sync(db, tracker):
+        if retry_failed:
+            return {resource: retry_failed_campaigns(db, progress=tracker.record)}
+        pages = tracker.track(fetch_pages())
+        if incremental:
+            res = bulk_sync(db, incremental=True, pages=pages, progress=tracker.record)
+        elif bulk:
+            res = bulk_sync(db, pages=pages, progress=tracker.record)
+        else:
+            res = per_record_sync(db, pages=pages, progress=tracker.record)
+        return {resource: res}
+
+    # Joins a covering sync already in flight anywhere in the cluster instead of queueing a duplicate
+    job_id, coalesced = submit_sync(resource, incremental, sync, mode="retry" if retry_failed else None)
+    response.headers["Location"] = f"/sync/jobs/{job_id}"
+    return {"job_id": job_id, "status": "running" if coalesced else "queued", "coalesced": coalesced}
+
+@router.post("/advertisers", response_model=SyncJobAccepted, status_code=202)
+def sync_advertisers(
+    response: Response,
+    bulk: bool = Query(False, description="Use batched set-based upserts instead of per-record writes"),
+    incremental: bool = Query(False, description="Only upsert records updated since the last sync (bulk mode, no deletions)")
+):
+    return enqueue_resource_sync("advertisers", bulk, incremental, response)
+
+@router.post("/campaigns", response_model=SyncJobAccepted, status_code=202)
+def sync_campaigns(
+    response: Response,
+    bulk: bool = Query(False, description="Use batched set-based upserts instead of per-record writes"),
+    incremental: bool = Query(False, description="Only upsert records updated since the last sync (bulk mode, no deletions)"),
+    retry_failed: bool = Query(False, description="Only re-fetch and sync the campaigns listed in GET /sync/failures")
+):
+    return enqueue_resource_sync("campaigns", bulk, incremental, response, retry_failed)
+
+@router.get("/jobs/{job_id}", response_model=SyncJobOut)
+def get_sync_job(job_id: int, db: Session = Depends(get_db)):
+    run = db.get(SyncRun, job_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Sync job not found")
+    job = SyncJobOut.model_validate(run)
+    if run.status in ("success", "partial_failure"):
+        label = "Sync" if run.resource == "all" else run.resource.capitalize()
+        job.result = SyncResponse(**generate_sync_response(label, run.upserted, run.failed, run.deleted))
+    return job
+
+@router.get("/runs", response_model=List[SyncRunOut])
+def list_sync_runs(
+    db: Session = Depends(get_db),
+    resource: Optional[Literal["advertisers", "campaigns", "all"]] = Query(None, description="Only runs for this resource"),
+    limit: int = Query(20, ge=1, le=100, description="Most recent runs to return")
+):
+    query = db.query(SyncRun)
+    if resource:
+        query = query.filter(SyncRun.resource == resource)
+    return query.order_by(SyncRun.started_at.desc(), SyncRun.id.desc()).limit(limit).all()
+
+@router.get("/failures", response_model=List[SyncFailureOut])
+def list_sync_failures(
+    db: Session = Depends(get_db),
+    resource: Optional[Literal["advertisers", "campaigns"]] = Query(None, description="Only failures for this resource"),
+    limit: int = Query(100, ge=1, le=1000, description="Most recent failures to return")
+):
+    query = db.query(SyncFailure)
+    if resource:
+        query = query.filter(SyncFailure.resource == resource)
+    return query.order_by(SyncFailure.last_failed_at.desc(), SyncFailure.id.desc()).limit(limit).all()
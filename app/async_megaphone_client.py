@@ -0,0 +1,163 @@
+import time
+import asyncio
+import httpx
+
+from app.megaphone_client import (
+    BASE_URL,
+    ORGANIZATION_ID,
+    FETCH_CONCURRENCY,
+    headers,
+    rate_limiter as shared_rate_limiter,
+    retry_after,
+    next_page_url,
+    remaining_page_urls,
+    PageWindow,
+)
+from app.rate_limiter import TokenBucket
+from app.cache import AsyncReadThroughCache, REMOTE_CACHE_TTL_SECONDS, REMOTE_CACHE_STALE_SECONDS
+from app.metrics import RATE_LIMITER_WAIT, observe_megaphone_call
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class AsyncMegaphoneClient:
+    def __init__(
+        self,
+        base_url: str = BASE_URL,
+        organization_id: str = ORGANIZATION_ID,
+        rate_limiter: TokenBucket = None,
+        concurrency: int = FETCH_CONCURRENCY,
+        transport: httpx.AsyncBaseTransport = None,
+        cache: AsyncReadThroughCache = None,
+    ):
+        self.base_url = base_url
+        self.organization_id = organization_id
+        # Same bucket as the sync client, so both paths stay inside one Megaphone budget
+        self.rate_limiter = rate_limiter or shared_rate_limiter
+        self.concurrency = concurrency
+        self._transport = transport
+        self._client = None
+        self.cache = cache
+
+    @property
+    def org_url(self) -> str:
+        return f"{self.base_url}/organizations/{self.organization_id}"
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created lazily so the pool belongs to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=headers,
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(max_connections=max(self.concurrency, 10), max_keepalive_connections=max(self.concurrency, 10)),
+                timeout=httpx.Timeout(30.0),
+                transport=self._transport,
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        attempt = 0
+        while True:
+            RATE_LIMITER_WAIT.observe(await self.rate_limiter.acquire_async())
+            start = time.perf_counter()
+            try:
+                response = await self._get_client().request(method, url, **kwargs)
+            except httpx.HTTPError:
+                observe_megaphone_call(method, url, "error", time.perf_counter() - start)
+                raise
+            observe_megaphone_call(method, url, response.status_code, time.perf_counter() - start)
+            delay = retry_after(self.rate_limiter, method, response, attempt)
+            if delay is None:
+                return response
+            if response.status_code == 429:
+                await self.rate_limiter.pause_async(delay)
+            else:
+                await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _fetch_page(self, url: str) -> list:
+        return (await self.request("GET", url)).json()
+
+    async def iter_pages(self, url: str):
+        response = await self.request("GET", url)
+        yield response.json()
+        next_url = next_page_url(response)
+        if not next_url:
+            return
+
+        urls = remaining_page_urls(url, response, self.concurrency)
+        if urls is not None:
+            window = PageWindow(urls, self.concurrency, lambda page_url: asyncio.ensure_future(self._fetch_page(page_url)))
+            try:
+                while window:
+                    body = await window.pop()
+                    window.fill()
+                    yield body
+            finally:
+                for task in window.pending:
+                    task.cancel()
+            return
+
+        url = next_url
+        while url:
+            response = await self.request("GET", url)
+            yield response.json()
+            url = next_page_url(response)
+
+    async def fetch_all_paginated(self, url: str) -> list:
+        results = []
+        async for page in self.iter_pages(url):
+            results.extend(page)
+        return results
+
+    async def _cached(self, key, loader):
+        if self.cache is None:
+            return await loader()
+        return await self.cache.get(key, loader)
+
+    async def list_advertisers(self) -> list:
+        url = f"{self.org_url}/advertisers?per_page=100"
+        return await self._cached(("advertisers",), lambda: self.fetch_all_paginated(url))
+
+    async def list_campaigns(self) -> list:
+        url = f"{self.org_url}/campaigns?per_page=100"
+        return await self._cached(("campaigns",), lambda: self.fetch_all_paginated(url))
+
+    async def create_campaign(self, payload: dict) -> dict:
+        if not payload.get("title") or not payload.get("advertiserId"):
+            raise ValueError("Missing required fields: 'title' and 'advertiserId'")
+        response = await self.request("POST", f"{self.org_url}/campaigns", json=payload)
+        campaign = response.json()
+        self._write_through(campaign)
+        return campaign
+
+    async def get_campaign(self, campaign_id: str) -> dict:
+        async def load():
+            response = await self.request("GET", f"{self.org_url}/campaigns/{campaign_id}")
+            return response.json()
+        return await self._cached(("campaign", campaign_id), load)
+
+    async def update_campaign(self, campaign_id: str, payload: dict) -> dict:
+        response = await self.request("PUT", f"{self.org_url}/campaigns/{campaign_id}", json=payload)
+        campaign = response.json()
+        self._write_through(campaign, campaign_id)
+        return campaign
+
+    def _write_through(self, campaign: dict, campaign_id: str = None):
+        if self.cache is None:
+            return
+        self.cache.set(("campaign", campaign_id or campaign.get("id")), campaign)
+        self.cache.invalidate(("campaigns",))
+
+
+# Shared instance used by the async /remote routes; closed in the app lifespan
+client = AsyncMegaphoneClient(cache=AsyncReadThroughCache(REMOTE_CACHE_TTL_SECONDS, REMOTE_CACHE_STALE_SECONDS))
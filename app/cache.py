@@ -0,0 +1,186 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models import CacheGeneration
+from app.change_stream import publish_on_commit
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_MAXSIZE = int(os.getenv("RESPONSE_CACHE_MAXSIZE", "256"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+REMOTE_CACHE_TTL_SECONDS = float(os.getenv("REMOTE_CACHE_TTL_SECONDS", "60"))
+REMOTE_CACHE_STALE_SECONDS = float(os.getenv("REMOTE_CACHE_STALE_SECONDS", "300"))
+REMOTE_CACHE_MAXSIZE = int(os.getenv("REMOTE_CACHE_MAXSIZE", "1024"))
+
+# Bumped by every write to campaigns/advertisers/agencies; stored in the DB so all workers see it
+LOCAL_READS = "local_reads"
+
+
+class CacheEntry:
+    def __init__(self, generation: int, body: bytes):
+        self.generation = generation
+        self.body = body
+        self.etag = f'"{generation}-{hashlib.sha1(body).hexdigest()[:16]}"'
+        self.stored_at = time.monotonic()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = LRUCache(RESPONSE_CACHE_MAXSIZE, RESPONSE_CACHE_TTL_SECONDS)
+
+
+class AsyncReadThroughCache:
+    # Fresh for `ttl` seconds, then served stale for up to `stale_ttl` more while one background
+    # refresh runs. Concurrent misses for the same key share a single in-flight load. Holds at most
+    # `maxsize` keys, least recently used evicted first. Used from the event loop only.
+    def __init__(self, ttl: float, stale_ttl: float, maxsize: int = REMOTE_CACHE_MAXSIZE):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        # key -> (load number, task); a load only stores its value while it is still the key's current one
+        self._inflight = {}
+        self._loads = 0
+
+    async def get(self, key, loader):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self._entries.move_to_end(key)
+                self._load(key, loader)
+                return value
+        return await asyncio.shield(self._load(key, loader))
+
+    def _load(self, key, loader) -> asyncio.Future:
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return inflight[1]
+        self._loads += 1
+        task = asyncio.ensure_future(self._run(key, loader, self._loads))
+        task.add_done_callback(self._log_failure)
+        self._inflight[key] = (self._loads, task)
+        return task
+
+    def _is_current(self, key, load: int) -> bool:
+        inflight = self._inflight.get(key)
+        return inflight is not None and inflight[0] == load
+
+    async def _run(self, key, loader, load: int):
+        try:
+            value = await loader()
+            # A set() or invalidate() since this load started detached it; its data may predate the write
+            if self._is_current(key, load):
+                self._store(key, value)
+            return value
+        finally:
+            if self._is_current(key, load):
+                del self._inflight[key]
+
+    def _store(self, key, value):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _log_failure(task: asyncio.Future):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"[CACHE] Remote refresh failed: {task.exception()}")
+
+    def set(self, key, value):
+        self._inflight.pop(key, None)
+        self._store(key, value)
+
+    def invalidate(self, key):
+        self._inflight.pop(key, None)
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._inflight.clear()
+        self._entries.clear()
+
+
+async def get_generation(db: AsyncSession, name: str = LOCAL_READS) -> int:
+    return (await db.scalar(select(CacheGeneration.generation).filter_by(name=name))) or 0
+
+
+def bump_generation(db: Session, name: str = LOCAL_READS):
+    # Part of the caller's transaction, so readers only see the new generation once the write commits
+    bumped = db.execute(
+        update(CacheGeneration).where(CacheGeneration.name == name).values(generation=CacheGeneration.generation + 1)
+    ).rowcount
+    if not bumped:
+        db.add(CacheGeneration(name=name, generation=1))
+    publish_on_commit(db)
+
+
+def _cache_key(request: Request):
+    return request.url.path, tuple(sorted(request.query_params.multi_items()))
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+async def cached_json_response(request: Request, db: AsyncSession, build) -> Response:
+    # `build()` must be a coroutine returning the serialized JSON body (bytes) for the current data
+    generation = await get_generation(db)
+    key = _cache_key(request)
+    entry = response_cache.get(key)
+    if entry is None or entry.generation != generation:
+        entry = CacheEntry(generation, await build())
+        response_cache.set(key, entry)
+
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
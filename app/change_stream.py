@@ -0,0 +1,138 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app import db as database
+from app.changes import latest_seq, list_campaign_changes
+from app.schemas.changes import ChangeOut
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Writes from other workers are picked up by polling the newest change sequence number;
+# commits in this process wake the stream immediately
+CHANGE_STREAM_POLL_SECONDS = float(os.getenv("CHANGE_STREAM_POLL_SECONDS", "2"))
+CHANGE_STREAM_HEARTBEAT_SECONDS = float(os.getenv("CHANGE_STREAM_HEARTBEAT_SECONDS", "15"))
+CHANGE_STREAM_BATCH = 500
+
+
+class ChangeBroadcaster:
+    # One poller per process reads the latest sequence number, so idle subscribers cost no queries
+    def __init__(self, poll_seconds: float):
+        self.poll_seconds = poll_seconds
+        self.latest = 0
+        self._loop = None
+        self._changed = None
+        self._nudge = None
+        self._poller = None
+        self._subscribers = 0
+
+    def _bind(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._changed = asyncio.Condition()
+            self._nudge = asyncio.Event()
+            self._poller = None
+        if self._poller is None or self._poller.done():
+            self._poller = loop.create_task(self._poll())
+
+    async def _poll(self):
+        while self._subscribers:
+            self._nudge.clear()
+            try:
+                latest = await run_in_threadpool(self._read_latest)
+            except Exception as e:
+                logger.warning(f"[CHANGES] Could not read the latest change: {e}")
+            else:
+                if latest != self.latest:
+                    self.latest = latest
+                    async with self._changed:
+                        self._changed.notify_all()
+            try:
+                await asyncio.wait_for(self._nudge.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def _read_latest() -> int:
+        with database.SessionLocal() as db:
+            return latest_seq(db)
+
+    async def wait(self, seq: int, timeout: float) -> bool:
+        # True once a change after `seq` exists, False on timeout
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: self.latest > seq), timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+    def notify(self):
+        # Called from request and sync threads after a write commits
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._nudge.set)
+
+    @asynccontextmanager
+    async def subscribe(self):
+        self._subscribers += 1
+        self._bind()
+        try:
+            yield
+        finally:
+            self._subscribers -= 1
+
+
+broadcaster = ChangeBroadcaster(CHANGE_STREAM_POLL_SECONDS)
+
+
+def publish_on_commit(db: Session):
+    # Wakes change streams once the caller's transaction commits; dropped on rollback
+    db.info["publish_changes"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session):
+    if session.info.pop("publish_changes", False):
+        broadcaster.notify()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back(session, previous_transaction):
+    session.info.pop("publish_changes", None)
+
+
+def _read_campaign_changes(since, advertiser_id, archived):
+    # Returns (changes, position). Rows the filters skipped count as read, so the next wait starts after them
+    with database.SessionLocal() as db:
+        upto = latest_seq(db)
+        if since is None:
+            return [], upto
+        rows = list_campaign_changes(db, since, upto, CHANGE_STREAM_BATCH, advertiser_id, archived)
+        if len(rows) == CHANGE_STREAM_BATCH:
+            upto = rows[-1].seq
+        return [ChangeOut.model_validate(row) for row in rows], upto
+
+
+def format_event(change: ChangeOut) -> str:
+    return f"id: {change.seq}\nevent: campaign\ndata: {change.model_dump_json()}\n\n"
+
+
+async def campaign_events(since: int = None, advertiser_id: str = None, archived: bool = None):
+    # Server-sent events for campaign changes after `since` (None = only changes from now on)
+    async with broadcaster.subscribe():
+        while True:
+            changes, since = await run_in_threadpool(_read_campaign_changes, since, advertiser_id, archived)
+            for change in changes:
+                yield format_event(change)
+            if len(changes) < CHANGE_STREAM_BATCH:
+                if not await broadcaster.wait(since, CHANGE_STREAM_HEARTBEAT_SECONDS):
+                    # Keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
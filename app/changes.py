@@ -0,0 +1,139 @@
+import logging
+from sqlalchemy import text, or_, and_
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from app.models import Change, Campaign, Advertiser, Agency
+
+logger = logging.getLogger(__name__)
+
+TRACKED_MODELS = [Campaign, Advertiser, Agency]
+# Bookkeeping columns that change on every sync without the record itself changing
+IGNORED_COLUMNS = {"id", "synced_at"}
+
+changes_enabled = False
+
+
+def _tracked_columns(model) -> list:
+    return [c.name for c in model.__table__.columns if c.name not in IGNORED_COLUMNS]
+
+
+def _sqlite_ddl(model) -> list:
+    # Triggers record every write path (ORM, bulk upserts, set-based deletes) in one place
+    table = model.__tablename__
+    columns = _tracked_columns(model)
+    megaphone_id = "megaphone_id" if "megaphone_id" in columns else "NULL"
+    now = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+    differs = " OR ".join(f"old.{c} IS NOT new.{c}" for c in columns)
+    changed = " UNION ALL ".join(f"SELECT '{c}' AS name WHERE old.{c} IS NOT new.{c}" for c in columns)
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_changes_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO changes (entity, entity_id, megaphone_id, op, changed_at)
+            VALUES ('{table}', new.id, new.{megaphone_id}, 'insert', {now});
+        END
+        """.replace("new.NULL", "NULL"),
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_changes_au AFTER UPDATE ON {table}
+        WHEN {differs} BEGIN
+            INSERT INTO changes (entity, entity_id, megaphone_id, op, changed_fields, changed_at)
+            VALUES ('{table}', new.id, new.{megaphone_id}, 'update',
+                    (SELECT json_group_array(name) FROM ({changed})), {now});
+        END
+        """.replace("new.NULL", "NULL"),
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_changes_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO changes (entity, entity_id, megaphone_id, op, changed_at)
+            VALUES ('{table}', old.id, old.{megaphone_id}, 'delete', {now});
+        END
+        """.replace("old.NULL", "NULL"),
+    ]
+
+
+_POSTGRES_FUNCTION = """
+CREATE OR REPLACE FUNCTION record_change() RETURNS trigger AS $$
+DECLARE
+    fields jsonb;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO changes (entity, entity_id, megaphone_id, op, changed_at)
+        VALUES (TG_TABLE_NAME, NEW.id, to_jsonb(NEW) ->> 'megaphone_id', 'insert', now() AT TIME ZONE 'utc');
+        RETURN NEW;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO changes (entity, entity_id, megaphone_id, op, changed_at)
+        VALUES (TG_TABLE_NAME, OLD.id, to_jsonb(OLD) ->> 'megaphone_id', 'delete', now() AT TIME ZONE 'utc');
+        RETURN OLD;
+    END IF;
+    SELECT jsonb_agg(n.key) INTO fields
+    FROM jsonb_each(to_jsonb(NEW)) n
+    WHERE n.key <> ALL(TG_ARGV) AND n.value IS DISTINCT FROM to_jsonb(OLD) -> n.key;
+    IF fields IS NOT NULL THEN
+        INSERT INTO changes (entity, entity_id, megaphone_id, op, changed_fields, changed_at)
+        VALUES (TG_TABLE_NAME, NEW.id, to_jsonb(NEW) ->> 'megaphone_id', 'update', fields::text, now() AT TIME ZONE 'utc');
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def _postgres_ddl(model) -> list:
+    table = model.__tablename__
+    ignored = ", ".join(f"'{c}'" for c in sorted(IGNORED_COLUMNS))
+    return [
+        f"DROP TRIGGER IF EXISTS {table}_changes ON {table}",
+        f"""
+        CREATE TRIGGER {table}_changes AFTER INSERT OR UPDATE OR DELETE ON {table}
+        FOR EACH ROW EXECUTE FUNCTION record_change({ignored})
+        """,
+    ]
+
+
+def init_changes(engine):
+    global changes_enabled
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        ddl = [stmt for model in TRACKED_MODELS for stmt in _sqlite_ddl(model)]
+    elif dialect == "postgresql":
+        ddl = [_POSTGRES_FUNCTION] + [stmt for model in TRACKED_MODELS for stmt in _postgres_ddl(model)]
+    else:
+        logger.warning(f"Change feed triggers are not available on {dialect}; GET /changes will stay empty")
+        return
+    try:
+        with engine.begin() as conn:
+            for stmt in ddl:
+                conn.execute(text(stmt))
+        changes_enabled = True
+    except DBAPIError as e:
+        logger.warning(f"Change feed triggers could not be installed: {e}")
+
+
+def list_changes(db: Session, since: int, limit: int, entity: str = None) -> list:
+    query = db.query(Change).filter(Change.seq > since)
+    if entity:
+        query = query.filter(Change.entity == entity)
+    return query.order_by(Change.seq).limit(limit).all()
+
+
+def latest_seq(db: Session) -> int:
+    return db.query(Change.seq).order_by(Change.seq.desc()).limit(1).scalar() or 0
+
+
+def list_campaign_changes(db: Session, since: int, upto: int, limit: int,
+                          advertiser_id: str = None, archived: bool = None) -> list:
+    # Filters apply to the campaign's current state. Deletes, and updates that move a campaign
+    # into or out of the filtered set, always pass so clients can drop rows they hold.
+    query = db.query(Change).filter(Change.entity == "campaigns", Change.seq > since, Change.seq <= upto)
+    if advertiser_id is not None or archived is not None:
+        matches = []
+        moved = []
+        if advertiser_id is not None:
+            matches.append(Campaign.advertiser_id == advertiser_id)
+            moved.append(Change.changed_fields.like('%"advertiser_id"%'))
+        if archived is not None:
+            matches.append(Campaign.archived == archived)
+            moved.append(Change.changed_fields.like('%"archived"%'))
+        query = query.outerjoin(Campaign, Campaign.id == Change.entity_id).filter(
+            or_(Campaign.id.is_(None), and_(*matches), *moved)
+        )
+    return query.order_by(Change.seq).limit(limit).all()
@@ -0,0 +1,384 @@
+import uuid
+import logging
+from datetime import datetime
+from sqlalchemy import select, insert, update
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.orm import Session
+
+from app.models import Campaign, Advertiser, Agency
+from app.megaphone_client import iter_campaign_pages, iter_advertiser_pages
+from app.cache import bump_generation
+from app.metrics import record_sync_counts
+from app.cruds.sync import (
+    parse_datetime_safe, as_naive_utc, iter_chunks, delete_missing, begin_write, record_failure, clear_failures
+)
+from app.cruds.sync_state import get_sync_state, filter_newer, max_updated_at, advance_watermark
+
+logger = logging.getLogger(__name__)
+
+# Dialects with a native `INSERT ... ON CONFLICT DO UPDATE`
+UPSERT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+AGENCY_UPDATE_COLUMNS = ["name"]
+ADVERTISER_UPDATE_COLUMNS = ["name", "agency_id", "updated_at", "competitive_categories"]
+CAMPAIGN_UPDATE_COLUMNS = [
+    "external_id",
+    "title",
+    "advertiser_id",
+    "total_budget_cents",
+    "total_budget_currency",
+    "total_revenue_cents",
+    "total_revenue_currency",
+    "duration_in_seconds",
+    "copy_needed",
+    "booking_source",
+    "updated_at",
+    "synced_at",
+]
+# Column referencing the parent table's row, remapped once the parent's stored IDs are known
+PARENT_COLUMNS = {Advertiser: "agency_id", Campaign: "advertiser_id"}
+
+
+def _same_value(a, b):
+    if isinstance(a, datetime) or isinstance(b, datetime):
+        return as_naive_utc(a) == as_naive_utc(b)
+    return a == b
+
+
+def drop_unchanged(rows: list, existing: dict, compare_columns: list) -> list:
+    # `existing` rows must have been loaded with every column in `compare_columns`
+    changed = []
+    for r in rows:
+        current = existing.get(r["megaphone_id"])
+        if current is None or any(not _same_value(r[col], getattr(current, col)) for col in compare_columns):
+            changed.append(r)
+    return changed
+
+
+def upsert_rows(db: Session, model, rows: list, existing: dict, update_columns: list) -> dict:
+    # Returns {megaphone_id: id} as stored. On a conflict the row keeps its ID, which differs from
+    # the one minted here when another writer inserted the same megaphone_id since it was looked up.
+    if not rows:
+        return {}
+    table = model.__table__
+    dialect_insert = UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if dialect_insert:
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.megaphone_id],
+            set_={col: stmt.excluded[col] for col in update_columns}
+        ).returning(table.c.megaphone_id, table.c.id)
+        return {megaphone_id: id for megaphone_id, id in db.execute(stmt, rows)}
+
+    # Fallback: plain batched INSERT for new rows, bulk UPDATE by primary key for the rest
+    new_rows = [r for r in rows if r["megaphone_id"] not in existing]
+    changed_rows = [
+        {"id": r["id"], **{col: r[col] for col in update_columns}}
+        for r in rows if r["megaphone_id"] in existing
+    ]
+    if new_rows:
+        db.execute(insert(model), new_rows)
+    if changed_rows:
+        db.execute(update(model), changed_rows)
+    return dict(db.execute(
+        select(model.megaphone_id, model.id).where(model.megaphone_id.in_([r["megaphone_id"] for r in rows]))
+    ).all())
+
+
+def _upsert_remapped(db: Session, model, rows: list, existing: dict, update_columns: list, remap: dict):
+    # `remap` maps IDs minted for parent rows to the IDs actually stored; it is applied to the
+    # parent references before writing and extended with this table's own differences
+    parent_column = PARENT_COLUMNS.get(model)
+    if parent_column:
+        for r in rows:
+            r[parent_column] = remap.get(r[parent_column], r[parent_column])
+    stored = upsert_rows(db, model, rows, existing, update_columns)
+    for r in rows:
+        stored_id = stored.get(r["megaphone_id"], r["id"])
+        if stored_id != r["id"]:
+            remap[r["id"]] = stored_id
+            r["id"] = stored_id
+
+
+def _local_id(existing: dict, megaphone_id: str) -> str:
+    row = existing.get(megaphone_id)
+    return row.id if row else str(uuid.uuid4())
+
+
+def _collect_agency(agencies: dict, existing: dict, agency_data: dict):
+    if not agency_data:
+        return None
+    agency_id = agency_data["id"]
+    if agency_id not in agencies:
+        agencies[agency_id] = {
+            "id": _local_id(existing, agency_id),
+            "megaphone_id": agency_id,
+            "name": agency_data["name"],
+        }
+    else:
+        agencies[agency_id]["name"] = agency_data["name"]
+    return agencies[agency_id]["id"]
+
+
+def _collect_advertiser(advertisers: dict, agencies: dict, existing: dict, existing_agencies: dict, advertiser_data: dict):
+    if not advertiser_data:
+        return None
+    agency_id = _collect_agency(agencies, existing_agencies, advertiser_data.get("agency"))
+    megaphone_id = advertiser_data["id"]
+    row = {
+        "id": advertisers[megaphone_id]["id"] if megaphone_id in advertisers else _local_id(existing, megaphone_id),
+        "megaphone_id": megaphone_id,
+        "name": advertiser_data["name"],
+        "agency_id": agency_id,
+        "created_at": parse_datetime_safe(advertiser_data.get("createdAt")),
+        "updated_at": parse_datetime_safe(advertiser_data.get("updatedAt")),
+        "competitive_categories": advertiser_data.get("competitiveCategories"),
+    }
+    advertisers[megaphone_id] = row
+    return row["id"]
+
+
+def _campaign_row(campaign_data: dict, advertiser_id, existing: dict, now: datetime) -> dict:
+    return {
+        "id": _local_id(existing, campaign_data["id"]),
+        "megaphone_id": campaign_data["id"],
+        "external_id": campaign_data.get("externalId"),
+        "title": campaign_data["title"],
+        "advertiser_id": advertiser_id,
+        "organization_id": campaign_data["organizationId"],
+        "total_budget_cents": campaign_data.get("totalBudgetCents"),
+        "total_budget_currency": campaign_data.get("totalBudgetCurrency"),
+        "total_revenue_cents": campaign_data.get("totalRevenueCents"),
+        "total_revenue_currency": campaign_data.get("totalRevenueCurrency"),
+        "duration_in_seconds": campaign_data.get("durationInSeconds"),
+        "copy_needed": campaign_data.get("copyNeeded", False),
+        "booking_source": campaign_data.get("bookingSource"),
+        "created_at": parse_datetime_safe(campaign_data.get("createdAt")),
+        "updated_at": parse_datetime_safe(campaign_data.get("updatedAt")),
+        "synced_at": now,
+    }
+
+
+def _load_existing(db: Session, model, skip_unchanged: bool, update_columns: list, megaphone_ids) -> dict:
+    # {megaphone_id: row} for just the chunk's records, so memory stays bounded by the chunk size
+    # rather than the table. The comparison columns are only read when unchanged rows are skipped.
+    megaphone_ids = [m for m in set(megaphone_ids) if m is not None]
+    if not megaphone_ids:
+        return {}
+    columns = [model.megaphone_id, model.id]
+    if skip_unchanged:
+        columns += [getattr(model, col) for col in update_columns]
+    rows = db.execute(select(*columns).where(model.megaphone_id.in_(megaphone_ids))).all()
+    return {row[0]: row for row in rows}
+
+
+def load_advertiser_maps(db: Session, remote_advertisers: list, skip_unchanged: bool = False):
+    return (
+        _load_existing(db, Agency, skip_unchanged, AGENCY_UPDATE_COLUMNS, map(_agency_key, remote_advertisers)),
+        _load_existing(db, Advertiser, skip_unchanged, ADVERTISER_UPDATE_COLUMNS, (a.get("id") for a in remote_advertisers)),
+    )
+
+
+def load_campaign_maps(db: Session, remote_campaigns: list, skip_unchanged: bool = False):
+    advertisers = [c.get("advertiser") or {} for c in remote_campaigns]
+    return (
+        *load_advertiser_maps(db, advertisers, skip_unchanged),
+        _load_existing(db, Campaign, skip_unchanged, CAMPAIGN_UPDATE_COLUMNS, (c.get("id") for c in remote_campaigns)),
+    )
+
+
+def _changed(model, rows: dict, existing: dict, update_columns: list, skip_unchanged: bool) -> dict:
+    if not skip_unchanged:
+        return rows
+    compare_columns = [col for col in update_columns if col != "synced_at"]
+    changed = drop_unchanged(list(rows.values()), existing, compare_columns)
+    logger.info(f"[SYNC] {model.__tablename__}: {len(rows) - len(changed)} unchanged, {len(changed)} to write")
+    return {r["megaphone_id"]: r for r in changed}
+
+
+def _write_rows_one_by_one(db: Session, resource: str, tables: list, members: list) -> list:
+    # Each payload's rows go in their own savepoint, as in the per-record sync; rows shared by
+    # several payloads (an advertiser, an agency) are written once
+    written = set()
+    failed = set()
+    remap = {}
+    for payload, keys in members:
+        pending = []
+        savepoint = db.begin_nested()
+        try:
+            for (model, rows, existing, update_columns), key in zip(tables, keys):
+                if key in rows and (model, key) not in written:
+                    _upsert_remapped(db, model, [rows[key]], existing, update_columns, remap)
+                    pending.append((model, key))
+            savepoint.commit()
+        except Exception as e:
+            savepoint.rollback()
+            logger.warning(f"[SYNC ERROR] {resource} megaphone_id={payload.get('id')} could not be written: {e!r}")
+            record_failure(db, resource, payload.get("id"), payload, e)
+            failed.add(payload.get("id"))
+            continue
+        written.update(pending)
+    return failed
+
+
+def _write_rows(db: Session, resource: str, tables: list, members: list) -> list:
+    # `tables` is [(model, rows by megaphone_id, existing map, update columns)], parents first;
+    # `members` pairs each payload with its megaphone_id in each table. Every table is written in
+    # one batched statement. If the batch fails (a constraint on one record, say), it is rolled back
+    # and the chunk is written payload by payload instead. Returns the set of megaphone IDs that failed.
+    begin_write(db)
+    savepoint = db.begin_nested()
+    remap = {}
+    try:
+        for model, rows, existing, update_columns in tables:
+            _upsert_remapped(db, model, list(rows.values()), existing, update_columns, remap)
+        savepoint.commit()
+    except Exception as e:
+        savepoint.rollback()
+        logger.warning(f"[SYNC] Batched {resource} upsert failed, retrying the chunk one record at a time: {e!r}")
+        return _write_rows_one_by_one(db, resource, tables, members)
+    return set()
+
+
+def _build_failed(db: Session, resource: str, payload: dict, error: Exception):
+    logger.warning(f"[SYNC ERROR] {resource} megaphone_id={payload.get('id')}, title={payload.get('title')}")
+    logger.warning(f"Data: {payload}")
+    logger.exception(error)
+    record_failure(db, resource, payload.get("id"), payload, error)
+
+
+def _agency_key(advertiser_data: dict):
+    return (advertiser_data.get("agency") or {}).get("id")
+
+
+def _written(members: list, changed: dict, write_failed: set) -> int:
+    # Unchanged records skipped by `skip_unchanged` are not counted as upserted
+    return sum(1 for payload, _ in members if payload["id"] in changed and payload["id"] not in write_failed)
+
+
+def bulk_upsert_advertisers(db: Session, remote_advertisers: list, skip_unchanged: bool = False):
+    # Failed records are recorded in sync_failures like in the per-record sync
+    existing_agencies, existing = load_advertiser_maps(db, remote_advertisers, skip_unchanged)
+    agencies = {}
+    advertisers = {}
+    members = []
+    failed = 0
+    for a in remote_advertisers:
+        try:
+            _collect_advertiser(advertisers, agencies, existing, existing_agencies, a)
+            members.append((a, (_agency_key(a), a["id"])))
+        except Exception as e:
+            failed += 1
+            _build_failed(db, "advertisers", a, e)
+
+    changed = _changed(Advertiser, advertisers, existing, ADVERTISER_UPDATE_COLUMNS, skip_unchanged)
+    write_failed = _write_rows(db, "advertisers", [
+        (Agency, _changed(Agency, agencies, existing_agencies, AGENCY_UPDATE_COLUMNS, skip_unchanged),
+         existing_agencies, AGENCY_UPDATE_COLUMNS),
+        (Advertiser, changed, existing, ADVERTISER_UPDATE_COLUMNS),
+    ], members)
+    clear_failures(db, "advertisers", [a["id"] for a, _ in members if a["id"] not in write_failed])
+    return _written(members, changed, write_failed), failed + len(write_failed), existing
+
+
+def bulk_upsert_campaigns(db: Session, remote_campaigns: list, skip_unchanged: bool = False):
+    existing_agencies, existing_advertisers, existing = load_campaign_maps(db, remote_campaigns, skip_unchanged)
+    agencies = {}
+    advertisers = {}
+    campaigns = {}
+    members = []
+    failed = 0
+    now = datetime.utcnow()
+    for c in remote_campaigns:
+        try:
+            advertiser_data = c.get("advertiser") or {}
+            advertiser_id = _collect_advertiser(
+                advertisers, agencies, existing_advertisers, existing_agencies, advertiser_data
+            )
+            campaigns[c["id"]] = _campaign_row(c, advertiser_id, existing, now)
+            members.append((c, (_agency_key(advertiser_data), advertiser_data.get("id"), c["id"])))
+        except Exception as e:
+            failed += 1
+            _build_failed(db, "campaigns", c, e)
+
+    changed = _changed(Campaign, campaigns, existing, CAMPAIGN_UPDATE_COLUMNS, skip_unchanged)
+    write_failed = _write_rows(db, "campaigns", [
+        (Agency, _changed(Agency, agencies, existing_agencies, AGENCY_UPDATE_COLUMNS, skip_unchanged),
+         existing_agencies, AGENCY_UPDATE_COLUMNS),
+        (Advertiser, _changed(Advertiser, advertisers, existing_advertisers, ADVERTISER_UPDATE_COLUMNS, skip_unchanged),
+         existing_advertisers, ADVERTISER_UPDATE_COLUMNS),
+        (Campaign, changed, existing, CAMPAIGN_UPDATE_COLUMNS),
+    ], members)
+    clear_failures(db, "campaigns", [c["id"] for c, _ in members if c["id"] not in write_failed])
+    return _written(members, changed, write_failed), failed + len(write_failed), existing
+
+
+def bulk_sync_all_advertisers(db: Session, incremental: bool = False, pages=None, progress=None):
+    # Stream pages in committed chunks; only the seen IDs are kept in memory across chunks, the
+    # existing rows are looked up per chunk. `pages` lets a caller feed pages fetched elsewhere
+    # (see sync_pipeline); `progress(upserted, failed)` is called after each committed chunk
+    watermark = get_sync_state(db, "advertisers").watermark
+    remote_ids = set()
+    latest = None
+    upserted = 0
+    failed = 0
+    for chunk in iter_chunks(pages if pages is not None else iter_advertiser_pages()):
+        remote_ids.update(a.get("id") for a in chunk)
+        latest = max_updated_at(chunk, latest)
+        if incremental:
+            chunk = filter_newer(chunk, watermark)
+        chunk_upserted, chunk_failed, _ = bulk_upsert_advertisers(db, chunk, skip_unchanged=incremental)
+        upserted += chunk_upserted
+        failed += chunk_failed
+        bump_generation(db)
+        db.commit()
+        record_sync_counts("advertisers", "bulk", chunk_upserted, chunk_failed)
+        if progress:
+            progress(chunk_upserted, chunk_failed)
+
+    deleted = 0
+    if not incremental:
+        deleted = delete_missing(db, Advertiser, remote_ids, Advertiser.name)
+
+    # Failed records must be retried, so the watermark only moves after a clean run
+    if failed == 0:
+        advance_watermark(get_sync_state(db, "advertisers"), latest, full=not incremental)
+    bump_generation(db)
+    db.commit()
+    record_sync_counts("advertisers", "bulk", deleted=deleted)
+    return {"upserted": upserted, "failed": failed, "deleted": deleted}
+
+
+def bulk_sync_all_campaigns(db: Session, incremental: bool = False, pages=None, progress=None):
+    watermark = get_sync_state(db, "campaigns").watermark
+    remote_ids = set()
+    latest = None
+    upserted = 0
+    failed = 0
+    for chunk in iter_chunks(pages if pages is not None else iter_campaign_pages()):
+        remote_ids.update(c.get("id") for c in chunk)
+        latest = max_updated_at(chunk, latest)
+        if incremental:
+            chunk = filter_newer(chunk, watermark)
+        chunk_upserted, chunk_failed, _ = bulk_upsert_campaigns(db, chunk, skip_unchanged=incremental)
+        upserted += chunk_upserted
+        failed += chunk_failed
+        bump_generation(db)
+        db.commit()
+        record_sync_counts("campaigns", "bulk", chunk_upserted, chunk_failed)
+        if progress:
+            progress(chunk_upserted, chunk_failed)
+
+    deleted = 0
+    if not incremental:
+        deleted = delete_missing(db, Campaign, remote_ids, Campaign.title)
+
+    if failed == 0:
+        advance_watermark(get_sync_state(db, "campaigns"), latest, full=not incremental)
+    bump_generation(db)
+    db.commit()
+    record_sync_counts("campaigns", "bulk", deleted=deleted)
+    return {"upserted": upserted, "failed": failed, "deleted": deleted}
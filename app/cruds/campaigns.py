@@ -1,94 +1,179 @@
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import desc, asc
+from sqlalchemy import func, select
 from fastapi import HTTPException
-import requests
+import httpx
 from datetime import datetime
 
-from app import models, megaphone_client
+from app import models, search as search_index
+from app.async_megaphone_client import client as megaphone_client
 from app.schemas.campaigns import CampaignLocalOut, CampaignCreate, CampaignUpdate
-from app.schemas.pagination import PaginatedResponse, PaginationMeta
 from app.cruds.sync import sync_campaign
-
-
-def get_advertisers(db: Session):
-    return db.query(models.Advertiser).options(joinedload(models.Advertiser.agency)).all()
-
-
-def list_campaigns(db: Session, search, advertiser_id, archived, sort_by, sort_order, page, per_page):
-    query = db.query(models.Campaign).options(
-        joinedload(models.Campaign.advertiser).joinedload(models.Advertiser.agency)
+from app.cache import bump_generation
+from app.cruds.pagination import encode_cursor, decode_cursor, keyset_order, keyset_filter
+
+
+# List endpoints select plain columns and build response dicts directly; field order follows the
+# response schemas so the JSON matches what CampaignLocalOut / Advertiser would produce
+CAMPAIGN_ITEM_FIELDS = list(CampaignLocalOut.model_fields)
+CAMPAIGN_FIELDS = [name for name in CAMPAIGN_ITEM_FIELDS if name != "advertiser"]
+ADVERTISER_COLUMNS = [
+    models.Advertiser.id.label("advertiser__id"),
+    models.Advertiser.megaphone_id.label("advertiser__megaphone_id"),
+    models.Advertiser.name.label("advertiser__name"),
+    models.Agency.id.label("agency__id"),
+    models.Agency.megaphone_id.label("agency__megaphone_id"),
+    models.Agency.name.label("agency__name"),
+]
+
+
+def _advertiser_item(row) -> dict:
+    if row.advertiser__id is None:
+        return None
+    agency = None
+    if row.agency__id is not None:
+        agency = {"id": row.agency__id, "megaphone_id": row.agency__megaphone_id, "name": row.agency__name}
+    return {
+        "id": row.advertiser__id,
+        "megaphone_id": row.advertiser__megaphone_id,
+        "name": row.advertiser__name,
+        "agency": agency,
+    }
+
+
+def _campaign_item(row) -> dict:
+    return {
+        name: _advertiser_item(row) if name == "advertiser" else getattr(row, name)
+        for name in CAMPAIGN_ITEM_FIELDS
+    }
+
+
+async def get_advertisers(db: AsyncSession) -> list:
+    rows = await db.execute(
+        select(*ADVERTISER_COLUMNS).outerjoin(models.Agency, models.Agency.id == models.Advertiser.agency_id)
     )
-
-    if search:
-        query = query.filter(models.Campaign.title.ilike(f"%{search}%"))
+    return [_advertiser_item(row) for row in rows]
+
+
+async def list_campaigns(db: AsyncSession, search, advertiser_id, archived, sort_by, sort_order, page, per_page, cursor=None, include_total=True) -> dict:
+    # Returns a PaginatedResponse[CampaignLocalOut]-shaped dict, ready for to_json
+    query = select(models.Campaign.id)
+
+    fts_query = search_index.build_fts_query(search) if search and search_index.fts_enabled else None
+    if fts_query:
+        # FTS5 prefix match over campaign title, advertiser name and agency name
+        query = query.join(
+            search_index.campaign_search_keys,
+            search_index.campaign_search_keys.c.campaign_id == models.Campaign.id
+        ).join(
+            search_index.campaign_search,
+            search_index.campaign_search.c.rowid == search_index.campaign_search_keys.c.id
+        ).where(search_index.match_clause(fts_query))
+    elif search:
+        query = query.where(models.Campaign.title.ilike(f"%{search}%"))
 
     if advertiser_id:
-        query = query.filter(models.Campaign.advertiser_id == advertiser_id)
-    
-    if archived is not None:
-        query = query.filter(models.Campaign.archived == archived)
-
-    sort_column = getattr(models.Campaign, sort_by)
-    query = query.order_by(desc(sort_column) if sort_order == "desc" else asc(sort_column))
+        query = query.where(models.Campaign.advertiser_id == advertiser_id)
 
-    total = query.count()
-    db_items = query.offset((page - 1) * per_page).limit(per_page).all()
-    items = [CampaignLocalOut.model_validate(obj, from_attributes=True) for obj in db_items]
-
-    return PaginatedResponse[CampaignLocalOut](
-        items=items,
-        meta=PaginationMeta(page=page, per_page=per_page, total=total)
+    if archived is not None:
+        query = query.where(models.Campaign.archived == archived)
+
+    # Count on the bare filtered query, without the advertiser/agency joins or ORDER BY
+    total = await db.scalar(query.with_only_columns(func.count(models.Campaign.id))) if include_total else None
+
+    if sort_by == "relevance":
+        # bm25 rank is lower for better matches; negate so "desc" means most relevant first
+        sort_column = -search_index.campaign_search.c.rank if fts_query else models.Campaign.created_at
+    else:
+        sort_column = getattr(models.Campaign, sort_by)
+    query = query.with_only_columns(
+        *[getattr(models.Campaign, name) for name in CAMPAIGN_FIELDS],
+        *ADVERTISER_COLUMNS,
+        sort_column.label("sort_value"),
+    ).outerjoin(
+        models.Advertiser, models.Advertiser.id == models.Campaign.advertiser_id
+    ).outerjoin(
+        models.Agency, models.Agency.id == models.Advertiser.agency_id
+    ).order_by(*keyset_order(sort_column, models.Campaign.id, sort_order))
+
+    if cursor:
+        # Keyset pagination: seek past the last row of the previous page instead of OFFSET
+        value, row_id = decode_cursor(cursor, sort_by, sort_order, sort_column)
+        query = query.where(keyset_filter(sort_column, models.Campaign.id, sort_order, value, row_id))
+    else:
+        query = query.offset((page - 1) * per_page)
+
+    rows = (await db.execute(query.limit(per_page + 1))).all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(sort_by, sort_order, rows[-1].sort_value, rows[-1].id)
+
+    return {
+        "items": [_campaign_item(row) for row in rows],
+        "meta": {"page": page, "per_page": per_page, "total": total, "next_cursor": next_cursor},
+    }
+
+
+def _store_remote_campaign(db: Session, remote: dict) -> CampaignLocalOut:
+    # Runs through AsyncSession.run_sync so the upsert is shared with the sync jobs
+    local = sync_campaign(db, remote)
+    bump_generation(db)
+    db.flush()
+    return CampaignLocalOut.model_validate(local, from_attributes=True)
+
+
+def _remote_error(e: httpx.HTTPStatusError) -> HTTPException:
+    try:
+        error_detail = e.response.json()
+    except Exception:
+        error_detail = e.response.text
+    return HTTPException(
+        status_code=e.response.status_code,
+        detail={"error": "Remote API failed", "reason": error_detail}
     )
 
 
-def create_campaign(db: Session, campaign: CampaignCreate):
-    advertiser = db.query(models.Advertiser).filter_by(id=campaign.advertiser_id).first()
+async def create_campaign(db: AsyncSession, campaign: CampaignCreate):
+    advertiser = await db.get(models.Advertiser, campaign.advertiser_id)
     if not advertiser:
         raise HTTPException(status_code=400, detail="Advertiser not found")
     try:
         campaign_data = campaign.model_dump(exclude_none=True)
         campaign_data["advertiserId"] = advertiser.megaphone_id
 
-        remote = megaphone_client.create_campaign(campaign_data)
-
-        local = sync_campaign(db, remote)
-        db.commit()
+        remote = await megaphone_client.create_campaign(campaign_data)
 
-        return CampaignLocalOut.model_validate(local, from_attributes=True)
+        local = await db.run_sync(_store_remote_campaign, remote)
+        await db.commit()
+        return local
 
-    except requests.exceptions.HTTPError as e:
-        db.rollback()
-        try:
-            error_detail = e.response.json()
-        except Exception:
-            error_detail = e.response.text
-        raise HTTPException(
-            status_code=e.response.status_code,
-            detail={"error": "Remote API failed", "reason": error_detail}
-        )
+    except httpx.HTTPStatusError as e:
+        await db.rollback()
+        raise _remote_error(e)
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def get_campaign_by_id(db: Session, campaign_id: str):
-    campaign = db.query(models.Campaign).options(
+async def get_campaign_by_id(db: AsyncSession, campaign_id: str):
+    campaign = await db.scalar(select(models.Campaign).options(
         joinedload(models.Campaign.advertiser).joinedload(models.Advertiser.agency)
-    ).filter(models.Campaign.id == campaign_id).first()
+    ).where(models.Campaign.id == campaign_id))
     if not campaign:
         raise HTTPException(status_code=404, detail="Campaign not found")
     return CampaignLocalOut.model_validate(campaign, from_attributes=True)
 
 
-def update_campaign(db: Session, campaign_id: str, campaign: CampaignUpdate):
-    local_campaign = db.query(models.Campaign).filter_by(id=campaign_id).first()
+async def update_campaign(db: AsyncSession, campaign_id: str, campaign: CampaignUpdate):
+    local_campaign = await db.get(models.Campaign, campaign_id)
     if not local_campaign:
         raise HTTPException(status_code=404, detail="Campaign not found")
 
     advertiser_megaphone_id = None
     if campaign.advertiser_id:
-        advertiser = db.query(models.Advertiser).filter_by(id=campaign.advertiser_id).first()
+        advertiser = await db.get(models.Advertiser, campaign.advertiser_id)
         if not advertiser:
             raise HTTPException(status_code=400, detail="Advertiser not found")
         advertiser_megaphone_id = advertiser.megaphone_id
@@ -98,28 +183,23 @@ def update_campaign(db: Session, campaign_id: str, campaign: CampaignUpdate):
         if advertiser_megaphone_id:
             update_data["advertiserId"] = advertiser_megaphone_id
 
-        remote = megaphone_client.update_campaign(local_campaign.megaphone_id, update_data)
-
-        local = sync_campaign(db, remote)
-        db.commit()
-        return CampaignLocalOut.model_validate(local, from_attributes=True)
-
-    except requests.exceptions.HTTPError as e:
-        db.rollback()
-        try:
-            error_detail = e.response.json()
-        except Exception:
-            error_detail = e.response.text
-        raise HTTPException(
-            status_code=e.response.status_code,
-            detail={"error": "Remote API failed", "reason": error_detail}
-        )
+        remote = await megaphone_client.update_campaign(local_campaign.megaphone_id, update_data)
+
+        local = await db.run_sync(_store_remote_campaign, remote)
+        await db.commit()
+        return local
+
+    except httpx.HTTPStatusError as e:
+        await db.rollback()
+        raise _remote_error(e)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-def archive_campaign(db: Session, campaign_id: str, archived: bool):
-    campaign = db.query(models.Campaign).filter_by(id=campaign_id).first()
+async def archive_campaign(db: AsyncSession, campaign_id: str, archived: bool):
+    campaign = await db.scalar(select(models.Campaign).options(
+        joinedload(models.Campaign.advertiser).joinedload(models.Advertiser.agency)
+    ).where(models.Campaign.id == campaign_id))
     if not campaign:
         raise HTTPException(status_code=404, detail="Campaign not found")
 
@@ -127,9 +207,10 @@ def archive_campaign(db: Session, campaign_id: str, archived: bool):
     campaign.updated_at = datetime.utcnow()
 
     try:
-        db.commit()
+        await db.run_sync(bump_generation)
+        await db.commit()
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to update archived status: {e}")
 
     return CampaignLocalOut.model_validate(campaign, from_attributes=True)
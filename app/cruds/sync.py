@@ -1,11 +1,30 @@
+from sqlalchemy import MetaData, Table, Column, String, select, insert, update, delete, exists
 from sqlalchemy.orm import Session
-from app.models import Campaign, Advertiser, Agency
-from datetime import datetime
+from app.models import Campaign, Advertiser, Agency, SyncFailure
+from datetime import datetime, timezone
+import json
 import logging
-from app.megaphone_client import list_campaigns, list_advertisers
+import requests
+from app.megaphone_client import iter_campaign_pages, iter_advertiser_pages, get_campaign
+from app.cache import bump_generation
+from app.metrics import record_sync_counts
 
 logger = logging.getLogger(__name__)
 
+# Records written per committed chunk while streaming pages from Megaphone
+SYNC_CHUNK_SIZE = 500
+# Rows removed per DELETE statement (also bounds the IN (...) list size)
+DELETE_CHUNK_SIZE = 500
+
+# Megaphone IDs seen during a sync, anti-joined against the local table to find deletions
+seen_ids_metadata = MetaData()
+seen_ids = Table(
+    "sync_seen_ids",
+    seen_ids_metadata,
+    Column("megaphone_id", String, primary_key=True),
+    prefixes=["TEMPORARY"],
+)
+
 def parse_datetime_safe(value):
     if not value:
         return None
@@ -14,11 +33,97 @@ def parse_datetime_safe(value):
     except Exception:
         return None
 
-def sync_agency(db: Session, agency_data: dict) -> Agency:
+def as_naive_utc(value):
+    # SQLite drops tzinfo on DateTime columns, so compare everything as naive UTC
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def iter_chunks(pages, size: int = None):
+    size = size or SYNC_CHUNK_SIZE
+    chunk = []
+    for page in pages:
+        chunk.extend(page)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def delete_by_ids(db: Session, model, ids: list):
+    for i in range(0, len(ids), DELETE_CHUNK_SIZE):
+        chunk = ids[i:i + DELETE_CHUNK_SIZE]
+        if model is Advertiser:
+            db.execute(update(Campaign).where(Campaign.advertiser_id.in_(chunk)).values(advertiser_id=None))
+        db.execute(delete(model).where(model.id.in_(chunk)))
+
+def delete_missing(db: Session, model, remote_ids, label_column) -> int:
+    # Set-based reconciliation: load the seen IDs into a temp table, then delete local rows with no
+    # match in chunks. Only (id, megaphone_id, label) tuples are read, for the audit log.
+    # Take the write lock before the first read, so the deletes never hit a stale SQLite snapshot
+    begin_write(db)
+    conn = db.connection()
+    seen_ids.create(conn, checkfirst=True)
+    db.execute(delete(seen_ids))
+    ids = list(remote_ids)
+    for i in range(0, len(ids), DELETE_CHUNK_SIZE):
+        db.execute(insert(seen_ids), [{"megaphone_id": m} for m in ids[i:i + DELETE_CHUNK_SIZE]])
+    missing = (
+        select(model.id, model.megaphone_id, label_column)
+        .where(~exists().where(seen_ids.c.megaphone_id == model.megaphone_id))
+        .limit(DELETE_CHUNK_SIZE)
+    )
+    label = label_column.key.capitalize()
+    deleted = 0
+    while True:
+        rows = db.execute(missing).all()
+        if not rows:
+            break
+        for row in rows:
+            logger.info(f"[SYNC] {model.__name__} deleted - ID: {row[0]}, Megaphone ID: {row[1]}, {label}: {row[2]}")
+        delete_by_ids(db, model, [row[0] for row in rows])
+        deleted += len(rows)
+    # Only dropped on success: after an error the transaction may be aborted (PostgreSQL), and the
+    # caller's rollback discards the table created in it anyway
+    seen_ids.drop(conn, checkfirst=True)
+    return deleted
+
+class SyncIdentityMap:
+    # Per-run memo of agencies and advertisers keyed by Megaphone ID. Campaign payloads embed their
+    # advertiser, so without it the same advertiser is queried and rewritten once per campaign.
+    def __init__(self):
+        self._entries = {}
+
+    def find(self, model, megaphone_id):
+        entry = self._entries.get((model, megaphone_id))
+        return entry[0] if entry is not None else None
+
+    def applied(self, model, data: dict):
+        # The row already written for exactly this payload during this run, if any
+        entry = self._entries.get((model, data["id"]))
+        if entry is not None and entry[1] == data:
+            return entry[0]
+        return None
+
+    def remember(self, model, data: dict, obj):
+        self._entries[(model, data["id"])] = (obj, data)
+
+    def clear(self):
+        self._entries.clear()
+
+def _find(db: Session, model, megaphone_id, identities):
+    known = identities.find(model, megaphone_id) if identities is not None else None
+    if known is not None:
+        return known
+    return db.query(model).filter_by(megaphone_id=megaphone_id).one_or_none()
+
+def sync_agency(db: Session, agency_data: dict, identities: SyncIdentityMap = None) -> Agency:
     try:
         if not agency_data:
             return None
-        agency = db.query(Agency).filter_by(megaphone_id=agency_data["id"]).one_or_none()
+        if identities is not None and (known := identities.applied(Agency, agency_data)) is not None:
+            return known
+        agency = _find(db, Agency, agency_data["id"], identities)
         if agency:
             agency.name = agency_data["name"]
         else:
@@ -28,6 +133,8 @@ def sync_agency(db: Session, agency_data: dict) -> Agency:
             )
             db.add(agency)
             db.flush()
+        if identities is not None:
+            identities.remember(Agency, agency_data, agency)
         return agency
     except Exception as e:
         logger.warning(f"[SYNC ERROR] agency_id={agency_data.get('id')}, title={agency_data.get('title')}")
@@ -35,12 +142,14 @@ def sync_agency(db: Session, agency_data: dict) -> Agency:
         logger.exception(e)
         return None
 
-def sync_advertiser(db: Session, advertiser_data: dict) -> Advertiser:
+def sync_advertiser(db: Session, advertiser_data: dict, identities: SyncIdentityMap = None, raise_errors: bool = False) -> Advertiser:
     try:
         if not advertiser_data:
             return None
-        advertiser = db.query(Advertiser).filter_by(megaphone_id=advertiser_data["id"]).one_or_none()
-        agency = sync_agency(db, advertiser_data.get("agency"))
+        if identities is not None and (known := identities.applied(Advertiser, advertiser_data)) is not None:
+            return known
+        advertiser = _find(db, Advertiser, advertiser_data["id"], identities)
+        agency = sync_agency(db, advertiser_data.get("agency"), identities)
 
         if advertiser:
             advertiser.name = advertiser_data["name"]
@@ -58,17 +167,21 @@ def sync_advertiser(db: Session, advertiser_data: dict) -> Advertiser:
             )
             db.add(advertiser)
             db.flush()
+        if identities is not None:
+            identities.remember(Advertiser, advertiser_data, advertiser)
         return advertiser
     except Exception as e:
         logger.warning(f"[SYNC ERROR] advertiser_id={advertiser_data.get('id')}, title={advertiser_data.get('title')}")
         logger.warning(f"Data: {advertiser_data}")
         logger.exception(e)
+        if raise_errors:
+            raise
         return None
 
-def sync_campaign(db: Session, campaign_data: dict) -> Campaign:
+def sync_campaign(db: Session, campaign_data: dict, identities: SyncIdentityMap = None, raise_errors: bool = False) -> Campaign:
     try:
         advertiser_data = campaign_data.get("advertiser") or {}
-        advertiser = sync_advertiser(db, advertiser_data)
+        advertiser = sync_advertiser(db, advertiser_data, identities)
 
         created_at = parse_datetime_safe(campaign_data.get("createdAt"))
         updated_at = parse_datetime_safe(campaign_data.get("updatedAt"))
@@ -115,46 +228,149 @@ def sync_campaign(db: Session, campaign_data: dict) -> Campaign:
         logger.warning(f"[SYNC ERROR] campaign_id={campaign_data.get('id')}, title={campaign_data.get('title')}")
         logger.warning(f"Data: {campaign_data}")
         logger.exception(e)
+        if raise_errors:
+            raise
         return None
 
-def sync_all_advertisers(db: Session):
-    remote_advertisers = list_advertisers()
-    remote_ids = set(c["id"] for c in remote_advertisers)
-    upserted = 0
+def record_failure(db: Session, resource: str, megaphone_id: str, payload: dict, error: Exception):
+    # One row per record: a repeat failure updates it, a later clean sync removes it.
+    # `payload` is None when the record could not be fetched; the last payload seen is kept.
+    failure = None
+    if megaphone_id is not None:
+        failure = db.query(SyncFailure).filter_by(resource=resource, megaphone_id=megaphone_id).one_or_none()
+    now = datetime.utcnow()
+    if failure is None:
+        failure = SyncFailure(resource=resource, megaphone_id=megaphone_id, attempts=0, first_failed_at=now)
+        db.add(failure)
+    failure.attempts += 1
+    failure.error = repr(error)
+    failure.last_failed_at = now
+    if payload is not None:
+        failure.payload = json.dumps(payload, default=str)
+
+def clear_failures(db: Session, resource: str, megaphone_ids: list):
+    for i in range(0, len(megaphone_ids), DELETE_CHUNK_SIZE):
+        db.execute(delete(SyncFailure).where(
+            SyncFailure.resource == resource, SyncFailure.megaphone_id.in_(megaphone_ids[i:i + DELETE_CHUNK_SIZE])
+        ))
+
+def begin_write(db: Session):
+    # pysqlite only opens a transaction before DML, so a leading SAVEPOINT would run outside one and
+    # its RELEASE would commit. Open it here, and IMMEDIATE: a deferred transaction keeps the snapshot
+    # of its first read, and upgrading that to a write fails with "database is locked" if another
+    # connection (e.g. the lease heartbeat) has committed since. Call it only once the records to
+    # write are in memory, so the write lock is never held across a Megaphone fetch.
+    conn = db.connection()
+    if conn.dialect.name == "sqlite" and not conn.connection.dbapi_connection.in_transaction:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+def sync_in_savepoint(db: Session, sync_one, payload: dict, identities: SyncIdentityMap):
+    # Each record gets its own savepoint, so a failed flush rolls back that record alone and the
+    # rest of the chunk still commits. Returns (row, error).
+    savepoint = db.begin_nested()
+    try:
+        row = sync_one(db, payload, identities, raise_errors=True)
+        savepoint.commit()
+        return row, None
+    except Exception as e:
+        savepoint.rollback()
+        # Rows remembered inside the rolled-back savepoint may no longer exist
+        identities.clear()
+        return None, e
+
+def sync_chunk(db: Session, resource: str, sync_one, chunk: list, identities: SyncIdentityMap):
+    # Returns (upserted, failed); failures are recorded in sync_failures with their payload
+    begin_write(db)
+    succeeded = []
     failed = 0
-    deleted = 0
-    for a in remote_advertisers:
-        result = sync_advertiser(db, a)
-        if result:
-            upserted += 1
-        else:
+    for payload in chunk:
+        row, error = sync_in_savepoint(db, sync_one, payload, identities)
+        if row is None:
+            megaphone_id = payload.get("id") if isinstance(payload, dict) else None
+            record_failure(db, resource, megaphone_id, payload, error or ValueError("record was not synced"))
             failed += 1
-    local_advertisers = db.query(Advertiser).all()
-    for advertiser in local_advertisers:
-        if advertiser.megaphone_id not in remote_ids:
-            db.delete(advertiser)
-            deleted += 1
-            logger.info(f"[SYNC] Advertiser deleted - ID: {advertiser.id}, Megaphone ID: {advertiser.megaphone_id}, Name: {advertiser.name}")
+        else:
+            succeeded.append(payload["id"])
+    clear_failures(db, resource, succeeded)
+    return len(succeeded), failed
+
+def sync_all_advertisers(db: Session, pages=None, progress=None):
+    remote_ids = set()
+    identities = SyncIdentityMap()
+    upserted = 0
+    failed = 0
+    for chunk in iter_chunks(pages if pages is not None else iter_advertiser_pages()):
+        remote_ids.update(a["id"] for a in chunk)
+        chunk_upserted, chunk_failed = sync_chunk(db, "advertisers", sync_advertiser, chunk, identities)
+        upserted += chunk_upserted
+        failed += chunk_failed
+        bump_generation(db)
+        db.commit()
+        record_sync_counts("advertisers", "per_record", chunk_upserted, chunk_failed)
+        if progress:
+            progress(chunk_upserted, chunk_failed)
+    deleted = delete_missing(db, Advertiser, remote_ids, Advertiser.name)
+    bump_generation(db)
     db.commit()
+    record_sync_counts("advertisers", "per_record", deleted=deleted)
     return {"upserted": upserted, "failed": failed, "deleted": deleted}
 
-def sync_all_campaigns(db: Session):
-    remote_campaigns = list_campaigns()
-    remote_ids = set(c["id"] for c in remote_campaigns)
+def sync_all_campaigns(db: Session, pages=None, progress=None):
+    remote_ids = set()
+    identities = SyncIdentityMap()
     upserted = 0
     failed = 0
-    deleted = 0
-    for c in remote_campaigns:
-        result = sync_campaign(db, c)
-        if result:
-            upserted += 1
-        else:
-            failed += 1
-    local_campaigns = db.query(Campaign).all()
-    for campaign in local_campaigns:
-        if campaign.megaphone_id not in remote_ids:
-            db.delete(campaign)
-            deleted += 1
-            logger.info(f"[SYNC] Campaign deleted - ID: {campaign.id}, Megaphone ID: {campaign.megaphone_id}, Title: {campaign.title}")
+    for chunk in iter_chunks(pages if pages is not None else iter_campaign_pages()):
+        remote_ids.update(c["id"] for c in chunk)
+        chunk_upserted, chunk_failed = sync_chunk(db, "campaigns", sync_campaign, chunk, identities)
+        upserted += chunk_upserted
+        failed += chunk_failed
+        bump_generation(db)
+        db.commit()
+        record_sync_counts("campaigns", "per_record", chunk_upserted, chunk_failed)
+        if progress:
+            progress(chunk_upserted, chunk_failed)
+    deleted = delete_missing(db, Campaign, remote_ids, Campaign.title)
+    bump_generation(db)
     db.commit()
+    record_sync_counts("campaigns", "per_record", deleted=deleted)
     return {"upserted": upserted, "failed": failed, "deleted": deleted}
+
+def retry_failed_campaigns(db: Session, progress=None):
+    # Re-fetches only the campaigns recorded in sync_failures, one get_campaign call each
+    megaphone_ids = [row[0] for row in db.query(SyncFailure.megaphone_id).filter(
+        SyncFailure.resource == "campaigns", SyncFailure.megaphone_id.isnot(None)
+    ).order_by(SyncFailure.id).all()]
+    identities = SyncIdentityMap()
+    upserted = 0
+    failed = 0
+    for i in range(0, len(megaphone_ids), SYNC_CHUNK_SIZE):
+        # Fetch the whole chunk before writing anything, so no transaction stays open across fetches
+        chunk = []
+        gone = []
+        errors = []
+        for megaphone_id in megaphone_ids[i:i + SYNC_CHUNK_SIZE]:
+            try:
+                chunk.append(get_campaign(megaphone_id))
+            except requests.exceptions.HTTPError as e:
+                if e.response is not None and e.response.status_code == 404:
+                    # Gone upstream; the next full sync removes the local row
+                    gone.append(megaphone_id)
+                    continue
+                errors.append((megaphone_id, e))
+            except Exception as e:
+                errors.append((megaphone_id, e))
+        begin_write(db)
+        clear_failures(db, "campaigns", gone)
+        for megaphone_id, error in errors:
+            record_failure(db, "campaigns", megaphone_id, None, error)
+        chunk_upserted, sync_failed = sync_chunk(db, "campaigns", sync_campaign, chunk, identities)
+        chunk_failed = len(errors) + sync_failed
+        upserted += chunk_upserted
+        failed += chunk_failed
+        bump_generation(db)
+        db.commit()
+        record_sync_counts("campaigns", "retry", chunk_upserted, chunk_failed)
+        if progress:
+            progress(chunk_upserted, chunk_failed)
+    return {"upserted": upserted, "failed": failed, "deleted": 0}
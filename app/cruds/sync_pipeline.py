@@ -0,0 +1,124 @@
+import os
+import time
+import queue
+import logging
+import threading
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from app.megaphone_client import iter_advertiser_pages, iter_campaign_pages
+from app.cruds.bulk_sync import bulk_sync_all_advertisers, bulk_sync_all_campaigns
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Pages buffered between each fetcher and the DB writer; bounds memory when fetching outruns writing
+SYNC_QUEUE_PAGES = int(os.getenv("SYNC_QUEUE_PAGES", "8"))
+
+_DONE = object()
+
+
+class _FetchError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _fetch(pages, q: queue.Queue, stop: threading.Event, stage: dict):
+    # Runs in its own thread; both fetchers draw from the shared rate limiter
+    start = time.monotonic()
+    try:
+        for page in pages:
+            if not _put(q, page, stop):
+                return
+        end = _DONE
+    except Exception as e:
+        end = _FetchError(e)
+    # Recorded before the sentinel so the writer sees it once the stage ends
+    stage["fetch_seconds"] = round(time.monotonic() - start, 3)
+    _put(q, end, stop)
+
+
+def _drain(q: queue.Queue, stage: dict):
+    # Feeds queued pages to the bulk sync; time blocked here is time the writer waited on the network
+    waited = 0.0
+    try:
+        while True:
+            start = time.monotonic()
+            item = q.get()
+            waited += time.monotonic() - start
+            if item is _DONE:
+                return
+            if isinstance(item, _FetchError):
+                raise item.error
+            stage["pages"] = stage.get("pages", 0) + 1
+            yield item
+    finally:
+        stage["wait_seconds"] = round(waited, 3)
+
+
+def _run_stage(name: str, sync, db: Session, incremental: bool, q: queue.Queue, stage: dict, progress=None) -> dict:
+    start = time.monotonic()
+    result = sync(db, incremental=incremental, pages=_drain(q, stage), progress=progress)
+    stage["total_seconds"] = round(time.monotonic() - start, 3)
+    stage["write_seconds"] = round(stage["total_seconds"] - stage.get("wait_seconds", 0.0), 3)
+    logger.info(f"[SYNC] {name} stage timings: {stage}")
+    return result
+
+
+def run_sync_pipeline(db: Session, incremental: bool = False, tracker=None) -> dict:
+    # Advertisers and campaigns are downloaded concurrently while the writer commits chunks as
+    # they arrive. Writes stay sequential: every advertiser is committed before any campaign.
+    start = time.monotonic()
+    stop = threading.Event()
+    timings = {"advertisers": {}, "campaigns": {}}
+    advertiser_pages = iter_advertiser_pages()
+    campaign_pages = iter_campaign_pages()
+    progress = tracker.record if tracker is not None else None
+    if tracker is not None:
+        advertiser_pages = tracker.track(advertiser_pages)
+        campaign_pages = tracker.track(campaign_pages)
+    queues = {
+        "advertisers": queue.Queue(maxsize=SYNC_QUEUE_PAGES),
+        "campaigns": queue.Queue(maxsize=SYNC_QUEUE_PAGES),
+    }
+    fetchers = [
+        threading.Thread(
+            target=_fetch,
+            args=(advertiser_pages, queues["advertisers"], stop, timings["advertisers"]),
+            name="sync-fetch-advertisers",
+            daemon=True,
+        ),
+        threading.Thread(
+            target=_fetch,
+            args=(campaign_pages, queues["campaigns"], stop, timings["campaigns"]),
+            name="sync-fetch-campaigns",
+            daemon=True,
+        ),
+    ]
+    for t in fetchers:
+        t.start()
+    try:
+        advertisers = _run_stage(
+            "Advertisers", bulk_sync_all_advertisers, db, incremental, queues["advertisers"], timings["advertisers"], progress
+        )
+        campaigns = _run_stage(
+            "Campaigns", bulk_sync_all_campaigns, db, incremental, queues["campaigns"], timings["campaigns"], progress
+        )
+    finally:
+        # On failure, release fetchers blocked on a full queue
+        stop.set()
+        for t in fetchers:
+            t.join(timeout=5)
+    timings["total_seconds"] = round(time.monotonic() - start, 3)
+    return {"advertisers": advertisers, "campaigns": campaigns, "timings": timings}
@@ -0,0 +1,45 @@
+from datetime import datetime
+from sqlalchemy.orm import Session
+from app.models import SyncState
+from app.cruds.sync import parse_datetime_safe, as_naive_utc
+
+
+def get_sync_state(db: Session, resource: str) -> SyncState:
+    state = db.get(SyncState, resource)
+    if not state:
+        state = SyncState(resource=resource)
+        db.add(state)
+    return state
+
+
+def record_updated_at(record: dict):
+    return as_naive_utc(parse_datetime_safe(record.get("updatedAt")))
+
+
+def filter_newer(records: list, watermark) -> list:
+    # `>=` keeps records sharing the watermark second; unchanged ones are skipped at write time
+    if watermark is None:
+        return list(records)
+    newer = []
+    for r in records:
+        updated_at = record_updated_at(r)
+        if updated_at is None or updated_at >= watermark:
+            newer.append(r)
+    return newer
+
+
+def max_updated_at(records: list, current=None):
+    for r in records:
+        updated_at = record_updated_at(r)
+        if updated_at and (current is None or updated_at > current):
+            current = updated_at
+    return current
+
+
+def advance_watermark(state: SyncState, latest, full: bool):
+    if latest and (state.watermark is None or latest > state.watermark):
+        state.watermark = latest
+    now = datetime.utcnow()
+    state.last_synced_at = now
+    if full:
+        state.last_full_sync_at = now
@@ -1,14 +1,111 @@
-from sqlalchemy import create_engine
+import os
+import time
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from app.models import Base
+from app.search import init_search
+from app.changes import init_changes
+from app.metrics import track_pool
 
-DATABASE_URL = "sqlite:///./campaign.db"
+load_dotenv()
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./campaign.db")
+# Optional read replica for read-only routes; empty = everything uses the primary
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "")
+# After a write, the client's reads go to the primary for this long so it sees its own changes
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+READ_PRIMARY_COOKIE = "read_primary_until"
+
+# Connection pool for server databases (PostgreSQL); sized per worker process
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# SQLite tuning, applied to every new connection
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+
+
+def _sqlite_pragmas(in_memory: bool):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL lets readers keep going while the sync writer holds the write lock
+        if not in_memory:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.close()
+    return set_pragmas
+
+
+# Async drivers used by the local CRUD routes, keyed by backend
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def _engine_options(parsed) -> dict:
+    if parsed.get_backend_name() == "sqlite":
+        return {"connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+def _tune(engine, parsed):
+    if parsed.get_backend_name() == "sqlite":
+        event.listen(engine, "connect", _sqlite_pragmas(parsed.database in (None, "", ":memory:")))
+
+
+def create_db_engine(url: str = DATABASE_URL):
+    parsed = make_url(url)
+    engine = create_engine(parsed, **_engine_options(parsed))
+    _tune(engine, parsed)
+    return engine
+
+
+def create_async_db_engine(url: str = DATABASE_URL, **options):
+    parsed = make_url(url)
+    parsed = parsed.set(drivername=ASYNC_DRIVERS[parsed.get_backend_name()])
+    engine = create_async_engine(parsed, **{**_engine_options(parsed), **options})
+    _tune(engine.sync_engine, parsed)
+    return engine
+
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+track_pool(engine, "primary")
+
+# Local CRUD routes run on the event loop; syncs and the other routes keep the sync engine
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+track_pool(async_engine.sync_engine, "primary_async")
+async_read_engine = None
+AsyncReadSessionLocal = None
+if DATABASE_READ_URL:
+    async_read_engine = create_async_db_engine(DATABASE_READ_URL)
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+    track_pool(async_read_engine.sync_engine, "replica_async")
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    init_search(engine)
+    init_changes(engine)
+
+async def dispose_async_engines():
+    await async_engine.dispose()
+    if async_read_engine is not None:
+        await async_read_engine.dispose()
 
 def get_db():
     db = SessionLocal()
@@ -16,3 +113,34 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def _reads_from_primary(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+async def get_async_read_db(request: Request):
+    # Read-only routes use the replica, except for clients that wrote within READ_YOUR_WRITES_SECONDS
+    session_factory = AsyncReadSessionLocal
+    if session_factory is None or _reads_from_primary(request):
+        session_factory = AsyncSessionLocal
+    async with session_factory() as db:
+        yield db
+
+async def get_async_write_db(response: Response):
+    # Primary session for routes that write; pins the client's reads to the primary for a while
+    if AsyncReadSessionLocal is not None:
+        response.set_cookie(
+            READ_PRIMARY_COOKIE,
+            str(time.time() + READ_YOUR_WRITES_SECONDS),
+            max_age=READ_YOUR_WRITES_SECONDS,
+            httponly=True,
+            samesite="lax",
+        )
+    async with AsyncSessionLocal() as db:
+        yield db
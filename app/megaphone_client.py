@@ -1,14 +1,29 @@
 import os
+import time
 import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 from dotenv import load_dotenv
 from app.schemas.campaigns import CampaignCreate, CampaignUpdate
-from ratelimit import limits, sleep_and_retry
+from app.rate_limiter import TokenBucket, should_retry, retry_delay
+from app.metrics import RATE_LIMITER_WAIT, observe_megaphone_call
 
 load_dotenv()
 
 API_TOKEN = os.getenv("MEGAPHONE_API_TOKEN")
 BASE_URL = os.getenv("MEGAPHONE_BASE_URL")
 ORGANIZATION_ID = os.getenv("MEGAPHONE_ORG_ID")
+# Max pages fetched in parallel; all workers still share the safe_request rate limit
+FETCH_CONCURRENCY = int(os.getenv("MEGAPHONE_FETCH_CONCURRENCY", "4"))
+RATE_LIMIT_CALLS = int(os.getenv("MEGAPHONE_RATE_LIMIT_CALLS", "60"))
+RATE_LIMIT_PERIOD = int(os.getenv("MEGAPHONE_RATE_LIMIT_PERIOD", "60"))
+RATE_LIMIT_BURST = int(os.getenv("MEGAPHONE_RATE_LIMIT_BURST", "10"))
+# Shared by all worker processes on the host; empty means a per-process bucket
+RATE_LIMIT_STATE_PATH = os.getenv("MEGAPHONE_RATE_LIMIT_STATE_PATH", "./megaphone_rate_limit.db") or None
+MAX_RETRIES = int(os.getenv("MEGAPHONE_MAX_RETRIES", "5"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
 
 headers = {
     "Authorization": f'Token token="{API_TOKEN}"',
@@ -16,13 +31,48 @@ headers = {
     "Content-Type": "application/json"
 }
 
-# --- Rate-limited requests wrapper ---
-@sleep_and_retry
-@limits(calls=60, period=60)
-def safe_request(method: str, url: str, **kwargs):
-    response = requests.request(method, url, headers=headers, **kwargs)
+# --- Pooled session: keep-alive connections are reused across calls and page workers ---
+session = requests.Session()
+session.headers.update(headers)
+session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(FETCH_CONCURRENCY, 10)))
+
+rate_limiter = TokenBucket(
+    rate=RATE_LIMIT_CALLS / RATE_LIMIT_PERIOD,
+    capacity=RATE_LIMIT_BURST,
+    state_path=RATE_LIMIT_STATE_PATH
+)
+
+# --- Retry policy shared with the async client ---
+def retry_after(limiter: TokenBucket, method: str, response, attempt: int):
+    # Seconds to wait before retrying `response`, or None once it is final (error statuses raise).
+    # The caller pauses the shared bucket for a 429 and just sleeps for other retryable statuses.
+    if attempt < MAX_RETRIES and should_retry(method, response.status_code):
+        limiter.stats.record_retry(response.status_code)
+        return retry_delay(response, attempt, BACKOFF_BASE_SECONDS, BACKOFF_MAX_SECONDS)
     response.raise_for_status()
-    return response
+    return None
+
+
+# --- Rate-limited requests wrapper with 429 / 5xx backoff ---
+def safe_request(method: str, url: str, **kwargs):
+    attempt = 0
+    while True:
+        RATE_LIMITER_WAIT.observe(rate_limiter.acquire())
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.RequestException:
+            observe_megaphone_call(method, url, "error", time.perf_counter() - start)
+            raise
+        observe_megaphone_call(method, url, response.status_code, time.perf_counter() - start)
+        delay = retry_after(rate_limiter, method, response, attempt)
+        if delay is None:
+            return response
+        if response.status_code == 429:
+            rate_limiter.pause(delay)
+        else:
+            time.sleep(delay)
+        attempt += 1
 
 
 def camelize_dict(d: dict) -> dict:
@@ -35,22 +85,112 @@ def _to_camel(obj: dict) -> dict:
     return camelize_dict(obj)
 
 
-def fetch_all_paginated(url):
-    results = []
+def parse_link_header(link_header: str) -> dict:
+    links = {}
+    if not link_header:
+        return links
+    for link in link_header.split(","):
+        parts = link.split(";")
+        if len(parts) < 2:
+            continue
+        url = parts[0].strip()[1:-1]  # Remove the <> at the beginning and end
+        for param in parts[1:]:
+            key, _, value = param.strip().partition("=")
+            if key == "rel":
+                links[value.strip('"')] = url
+    return links
+
+
+def with_page(url: str, page: int) -> str:
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    query["page"] = [str(page)]
+    return urlunparse(parsed._replace(query=urlencode(query, doseq=True)))
+
+
+def get_last_page(response) -> int:
+    # Prefer rel="last"; fall back to X-Total / X-Per-Page. None means "unknown, follow next links"
+    last_url = parse_link_header(response.headers.get("Link")).get("last")
+    if last_url:
+        page = parse_qs(urlparse(last_url).query).get("page")
+        if page and page[0].isdigit():
+            return int(page[0])
+    total = response.headers.get("X-Total")
+    per_page = response.headers.get("X-Per-Page") or parse_qs(urlparse(str(response.url)).query).get("per_page", [None])[0]
+    if total and per_page and str(total).isdigit() and str(per_page).isdigit() and int(per_page) > 0:
+        return max(1, -(-int(total) // int(per_page)))
+    return None
+
+
+def next_page_url(response):
+    return parse_link_header(response.headers.get("Link")).get("next")
+
+
+def remaining_page_urls(url: str, response, concurrency: int):
+    # URLs of pages 2..N when the first page tells the page count and pages may be fetched in
+    # parallel; None means the pages must be followed one at a time through rel="next" links
+    last_page = get_last_page(response) if concurrency > 1 else None
+    if not last_page:
+        return None
+    return (with_page(url, page) for page in range(2, last_page + 1))
+
+
+class PageWindow:
+    # Sliding window over page fetches, shared by the sync and async clients: at most `size` pages
+    # in flight or waiting to be consumed. `submit(url)` starts a fetch and returns its future/task.
+    def __init__(self, urls, size: int, submit):
+        self._urls = iter(urls)
+        self._submit = submit
+        self.pending = deque()
+        for _ in range(size):
+            self.fill()
+
+    def __bool__(self):
+        return bool(self.pending)
+
+    def pop(self):
+        return self.pending.popleft()
+
+    def fill(self):
+        url = next(self._urls, None)
+        if url is not None:
+            self.pending.append(self._submit(url))
+
+
+def _fetch_page(url: str) -> list:
+    return safe_request("GET", url).json()
+
+
+def iter_pages(url, concurrency: int = None):
+    # Yields one page (list of records) at a time, in page order, as soon as it is available
+    concurrency = FETCH_CONCURRENCY if concurrency is None else concurrency
+    response = safe_request("GET", url)
+    yield response.json()
+    next_url = next_page_url(response)
+    if not next_url:
+        return
+
+    urls = remaining_page_urls(url, response, concurrency)
+    if urls is not None:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            window = PageWindow(urls, concurrency, lambda page_url: executor.submit(_fetch_page, page_url))
+            while window:
+                body = window.pop().result()
+                window.fill()
+                yield body
+        return
+
+    url = next_url
     while url:
         response = safe_request("GET", url)
-        results.extend(response.json())
-        
-        link_header = response.headers.get("Link")
-        next_url = None
-        if link_header:
-            links = link_header.split(",")
-            for link in links:
-                parts = link.split(";")
-                if len(parts) == 2 and 'rel="next"' in parts[1]:
-                    next_url = parts[0].strip()[1:-1]  # Remove the <> at the beginning and end
-                    break
-        url = next_url
+        yield response.json()
+        url = next_page_url(response)
+
+
+def fetch_all_paginated(url, concurrency: int = None):
+    results = []
+    for page in iter_pages(url, concurrency):
+        results.extend(page)
     return results
 
 def list_advertisers():
@@ -61,6 +201,14 @@ def list_campaigns():
     url = f"{BASE_URL}/organizations/{ORGANIZATION_ID}/campaigns?per_page=100"
     return fetch_all_paginated(url)
 
+def iter_advertiser_pages():
+    url = f"{BASE_URL}/organizations/{ORGANIZATION_ID}/advertisers?per_page=100"
+    return iter_pages(url)
+
+def iter_campaign_pages():
+    url = f"{BASE_URL}/organizations/{ORGANIZATION_ID}/campaigns?per_page=100"
+    return iter_pages(url)
+
 def create_campaign_from_model(campaign: CampaignCreate) -> dict:
     return create_campaign(_to_camel(campaign.model_dump(exclude_none=True)))
 
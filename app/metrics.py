@@ -0,0 +1,215 @@
+import os
+import time
+from urllib.parse import urlparse
+from anyio import to_thread
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# prometheus_client picks its value storage from the environment when first imported
+load_dotenv()
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, multiprocess  # noqa: E402
+
+# Prometheus metrics for the hot paths, served by GET /metrics. With several workers, set
+# PROMETHEUS_MULTIPROC_DIR (read by prometheus_client at import) so every worker writes its values
+# there and a scrape of any worker aggregates all of them. Gauges sum over live workers.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Queries are mostly sub-millisecond on SQLite
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5)
+SYNC_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 3600)
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "WITH"}
+
+# --- HTTP server ---
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time until the response starts, per route and status",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Requests being handled, including open streams", multiprocess_mode="livesum",
+)
+
+# --- Megaphone client ---
+MEGAPHONE_REQUESTS = Counter(
+    "megaphone_requests_total", "Megaphone API calls, one per attempt; status is 'error' when no response came back",
+    ["method", "endpoint", "status"],
+)
+MEGAPHONE_REQUEST_DURATION = Histogram(
+    "megaphone_request_duration_seconds", "Megaphone API call latency, per attempt",
+    ["method", "endpoint"], buckets=LATENCY_BUCKETS,
+)
+RATE_LIMITER_WAIT = Histogram(
+    "megaphone_rate_limiter_wait_seconds", "Time a Megaphone call was blocked waiting for a rate limit token",
+    buckets=(0, 0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+# --- Database ---
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Statement execution time", ["operation"], buckets=QUERY_BUCKETS,
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Connections currently checked out of the pool", ["engine"], multiprocess_mode="livesum",
+)
+DB_POOL_SIZE = Gauge("db_pool_size", "Configured pool size", ["engine"], multiprocess_mode="livesum")
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow", "Connections open beyond the pool size (negative while the pool fills)", ["engine"],
+    multiprocess_mode="livesum",
+)
+
+# --- Threads ---
+THREADPOOL_IN_USE = Gauge(
+    "threadpool_threads_in_use", "Worker threads busy with sync routes and run_in_threadpool calls",
+    multiprocess_mode="livesum",
+)
+THREADPOOL_LIMIT = Gauge(
+    "threadpool_threads_limit", "Maximum worker threads for sync routes and run_in_threadpool calls",
+    multiprocess_mode="livesum",
+)
+SYNC_JOBS_QUEUED = Gauge("sync_jobs_queued", "Manual sync jobs waiting for a job thread", multiprocess_mode="livesum")
+SYNC_JOBS_RUNNING = Gauge(
+    "sync_jobs_running", "Manual sync jobs running or waiting for the sync lease", multiprocess_mode="livesum",
+)
+
+# --- Sync ---
+SYNC_RUN_DURATION = Histogram(
+    "sync_run_duration_seconds", "Duration of sync runs led by this process",
+    ["resource", "mode", "status"], buckets=SYNC_BUCKETS,
+)
+SYNC_RECORDS = Counter(
+    "sync_records_total", "Records written by syncs, by outcome", ["resource", "path", "outcome"],
+)
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware. Latency is measured to the start of the response, so a streaming
+    # response (SSE) counts its time to headers here and stays in the in-progress gauge while open.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        observed = False
+
+        def observe(status: int):
+            nonlocal observed
+            observed = True
+            # The matched route template keeps label cardinality bounded
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.labels(scope["method"], route, str(status)).observe(time.perf_counter() - start)
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                observe(message["status"])
+                sample_threadpool()
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        sample_threadpool()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            HTTP_REQUESTS_IN_PROGRESS.dec()
+            if not observed:
+                observe(500)
+
+
+def sample_threadpool():
+    # Must run on the event loop. Sampled per request, so in multiprocess mode every worker
+    # reports its own threadpool rather than only the one serving the scrape.
+    limiter = to_thread.current_default_thread_limiter()
+    THREADPOOL_IN_USE.set(limiter.borrowed_tokens)
+    THREADPOOL_LIMIT.set(limiter.total_tokens)
+
+
+def metrics_registry():
+    # The registry to expose: one that reads every worker's files in multiprocess mode
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def mark_process_dead():
+    # Drops this worker's live gauges from the aggregate on shutdown
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def endpoint_label(url: str) -> str:
+    # /api/organizations/abc/campaigns/123?page=2 -> /organizations/{org_id}/campaigns/{id}
+    parts = [p for p in urlparse(url).path.split("/") if p]
+    if "organizations" not in parts:
+        return "/" + "/".join(parts)
+    parts = parts[parts.index("organizations"):]
+    labeled = []
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            labeled.append(part)
+        else:
+            labeled.append("{org_id}" if i == 1 else "{id}")
+    return "/" + "/".join(labeled)
+
+
+def observe_megaphone_call(method: str, url: str, status, seconds: float):
+    endpoint = endpoint_label(url)
+    MEGAPHONE_REQUESTS.labels(method, endpoint, str(status)).inc()
+    MEGAPHONE_REQUEST_DURATION.labels(method, endpoint).observe(seconds)
+
+
+def record_sync_counts(resource: str, path: str, upserted: int = 0, failed: int = 0, deleted: int = 0):
+    for outcome, count in (("upserted", upserted), ("failed", failed), ("deleted", deleted)):
+        if count:
+            SYNC_RECORDS.labels(resource, path, outcome).inc(count)
+
+
+def _operation(statement: str) -> str:
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return word if word in SQL_OPERATIONS else "OTHER"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_query(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_query_start")
+    if starts:
+        DB_QUERY_DURATION.labels(_operation(statement)).observe(time.perf_counter() - starts.pop())
+
+
+@event.listens_for(Engine, "handle_error")
+def _failed_query(context):
+    # after_cursor_execute does not fire for a failed statement; drop its start time
+    starts = context.connection.info.get("metrics_query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def track_pool(engine: Engine, name: str):
+    # Updated on pool events rather than read at scrape time, since a scrape only runs in one worker.
+    # engine.pool is looked up each time because dispose() replaces it.
+    if not hasattr(engine.pool, "checkedout"):
+        return
+
+    def update(returning: int = 0):
+        pool = engine.pool
+        DB_POOL_CHECKED_OUT.labels(name).set(pool.checkedout() - returning)
+        DB_POOL_SIZE.labels(name).set(pool.size())
+        DB_POOL_OVERFLOW.labels(name).set(pool.overflow())
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        update()
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        # Fires before the connection is back in the pool, so it still counts as checked out
+        update(returning=1)
+
+    update()
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, Text, Index
+from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -51,3 +51,96 @@ class Campaign(Base):
 
     def __repr__(self):
         return f"<Campaign(id={self.id}, title={self.title})>"
+
+class SyncState(Base):
+    __tablename__ = "sync_state"
+    resource = Column(String, primary_key=True)
+    watermark = Column(DateTime, nullable=True)
+    last_synced_at = Column(DateTime, nullable=True)
+    last_full_sync_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<SyncState(resource={self.resource}, watermark={self.watermark})>"
+
+class CacheGeneration(Base):
+    __tablename__ = "cache_generations"
+    name = Column(String, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<CacheGeneration(name={self.name}, generation={self.generation})>"
+
+class SyncLease(Base):
+    __tablename__ = "sync_leases"
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    run_id = Column(Integer, nullable=True)
+    acquired_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<SyncLease(name={self.name}, owner={self.owner}, expires_at={self.expires_at})>"
+
+class SyncRun(Base):
+    __tablename__ = "sync_runs"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    resource = Column(String, nullable=False)  # "advertisers", "campaigns" or "all"
+    mode = Column(String, nullable=False)  # "full" or "incremental"
+    trigger = Column(String, nullable=False)  # "scheduled" or "manual"
+    owner = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="running")  # "queued", "running", "success", "partial_failure", "failed"
+    started_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    pages_fetched = Column(Integer, nullable=False, default=0)
+    upserted = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    deleted = Column(Integer, nullable=False, default=0)
+    details = Column(Text, nullable=True)  # JSON: per-resource counts and stage timings
+    error = Column(Text, nullable=True)
+    coalesced_into = Column(Integer, nullable=True)  # set when this request joined another in-flight run
+
+    __table_args__ = (
+        Index("ix_sync_runs_started_at", "started_at"),
+    )
+
+    def __repr__(self):
+        return f"<SyncRun(id={self.id}, resource={self.resource}, status={self.status})>"
+
+class Change(Base):
+    # Append-only feed written by database triggers (see app/changes.py); seq never repeats
+    __tablename__ = "changes"
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    entity = Column(String, nullable=False)  # table name: "campaigns", "advertisers" or "agencies"
+    entity_id = Column(String(36), nullable=False)
+    megaphone_id = Column(String, nullable=True)
+    op = Column(String, nullable=False)  # "insert", "update" or "delete"
+    changed_fields = Column(Text, nullable=True)  # JSON list of column names, for updates
+    changed_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_changes_entity_seq", "entity", "seq"),
+        {"sqlite_autoincrement": True},
+    )
+
+    def __repr__(self):
+        return f"<Change(seq={self.seq}, entity={self.entity}, op={self.op})>"
+
+class SyncFailure(Base):
+    # Records a per-record sync could not write; removed once the record syncs cleanly
+    __tablename__ = "sync_failures"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    resource = Column(String, nullable=False)  # "advertisers" or "campaigns"
+    megaphone_id = Column(String, nullable=True)
+    payload = Column(Text, nullable=True)  # JSON of the last payload received from Megaphone
+    error = Column(Text, nullable=False)
+    attempts = Column(Integer, nullable=False, default=1)
+    first_failed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_failed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_sync_failures_resource_megaphone_id", "resource", "megaphone_id", unique=True),
+    )
+
+    def __repr__(self):
+        return f"<SyncFailure(resource={self.resource}, megaphone_id={self.megaphone_id}, attempts={self.attempts})>"
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Non-idempotent calls are only retried on 429, where the request was never processed
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+
+class RateLimiterStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.waited = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.throttled = 0
+        self.retries = 0
+
+    def record_acquire(self, waited: float):
+        with self._lock:
+            self.acquired += 1
+            if waited > 0:
+                self.waited += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def record_retry(self, status_code: int):
+        with self._lock:
+            self.retries += 1
+            if status_code == 429:
+                self.throttled += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "acquired": self.acquired,
+                "waited": self.waited,
+                "wait_seconds_total": round(self.wait_seconds_total, 3),
+                "wait_seconds_max": round(self.wait_seconds_max, 3),
+                "throttled": self.throttled,
+                "retries": self.retries,
+            }
+
+
+# Token bucket refilled at `rate` tokens/second, holding at most `capacity` tokens.
+# With `state_path` set the bucket lives in a small SQLite file, so every worker
+# process on the host draws from the same budget; otherwise it is per-process.
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int, state_path: str = None, key: str = "megaphone"):
+        self.rate = rate
+        self.capacity = capacity
+        self.state_path = state_path
+        self.key = key
+        self.stats = RateLimiterStats()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._tokens = float(capacity)
+        self._updated = time.time()
+        self._blocked_until = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.state_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.state_path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_state "
+                "(key TEXT PRIMARY KEY, tokens REAL, updated_at REAL, blocked_until REAL)"
+            )
+        return self._conn
+
+    def _update(self, apply):
+        # `apply(tokens, updated_at, blocked_until, now)` returns (result, tokens, blocked_until)
+        with self._lock:
+            now = time.time()
+            if self.state_path is None:
+                result, self._tokens, self._blocked_until = apply(self._tokens, self._updated, self._blocked_until, now)
+                self._updated = now
+                return result
+
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, updated_at, blocked_until FROM rate_limit_state WHERE key = ?", (self.key,)
+                ).fetchone()
+                tokens, updated_at, blocked_until = row if row else (float(self.capacity), now, 0.0)
+                result, tokens, blocked_until = apply(tokens, updated_at, blocked_until, now)
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_limit_state (key, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?)",
+                    (self.key, tokens, now, blocked_until)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return result
+
+    def _take(self, tokens, updated_at, blocked_until, now):
+        # Nothing refills while paused, so a 429 pause is never followed by a burst
+        tokens = min(self.capacity, tokens + max(0.0, now - max(updated_at, blocked_until)) * self.rate)
+        if now < blocked_until:
+            return blocked_until - now, tokens, blocked_until
+        if tokens >= 1:
+            return 0.0, tokens - 1, blocked_until
+        return (1 - tokens) / self.rate, tokens, blocked_until
+
+    # Takes a token if one is available; otherwise returns the seconds to wait before retrying
+    def try_acquire(self) -> float:
+        return self._update(self._take)
+
+    def acquire(self):
+        waited = 0.0
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                self.stats.record_acquire(waited)
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def _run_async(self, fn, *args):
+        # A file-backed update can wait on another process's lock for up to the connect timeout,
+        # so it runs in a worker thread instead of blocking the event loop
+        if self.state_path is None:
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    async def acquire_async(self):
+        waited = 0.0
+        while True:
+            wait = await self._run_async(self.try_acquire)
+            if wait <= 0:
+                self.stats.record_acquire(waited)
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    # Blocks every caller sharing this bucket for `seconds` (e.g. after a 429) and drops any burst
+    def pause(self, seconds: float):
+        def apply(tokens, updated_at, blocked_until, now):
+            return None, 0.0, max(blocked_until, now + seconds)
+        self._update(apply)
+
+    async def pause_async(self, seconds: float):
+        await self._run_async(self.pause, seconds)
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def should_retry(method: str, status_code: int) -> bool:
+    if status_code == 429:
+        return True
+    return status_code in RETRYABLE_STATUS_CODES and method.upper() in IDEMPOTENT_METHODS
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    # Full jitter: uniform in [0, min(cap, base * 2^attempt)]
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_delay(response, attempt: int, base: float, cap: float) -> float:
+    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+    if retry_after is not None:
+        return min(cap, retry_after)
+    return backoff_delay(attempt, base, cap)
@@ -5,7 +5,7 @@ from app.validators import campaigns as v
 
 class Agency(BaseModel):
     id: str
-    megaphone_id: str
+    megaphone_id: Optional[str] = None  # nullable in the agencies table
     name: str
 
 class Advertiser(BaseModel):
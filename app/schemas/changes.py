@@ -0,0 +1,27 @@
+import json
+from pydantic import BaseModel, ConfigDict, field_validator
+from typing import List, Optional
+from datetime import datetime
+
+class ChangeOut(BaseModel):
+    seq: int
+    entity: str  # "campaigns", "advertisers" or "agencies"
+    entity_id: str
+    megaphone_id: Optional[str] = None
+    op: str  # "insert", "update" or "delete"
+    changed_fields: Optional[List[str]] = None  # only set for updates
+    changed_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+    @field_validator("changed_fields", mode="before")
+    @classmethod
+    def decode_changed_fields(cls, value):
+        # Stored as a JSON array in the changes table
+        return json.loads(value) if isinstance(value, str) else value
+
+class ChangeFeed(BaseModel):
+    items: List[ChangeOut]
+    next_since: int  # pass back as ?since= to continue after the last item
+    latest_seq: int
+    has_more: bool
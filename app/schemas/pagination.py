@@ -1,12 +1,13 @@
 from pydantic import BaseModel, ConfigDict
-from typing import Generic, TypeVar, List, Literal
+from typing import Generic, TypeVar, List, Literal, Optional
 
 T = TypeVar("T")
 
 class PaginationMeta(BaseModel):
     page: int
     per_page: int
-    total: int
+    total: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 class PaginatedResponse(BaseModel, Generic[T]):
     items: List[T]
@@ -29,7 +30,8 @@ SortByField = Literal[
     "copy_needed",
     "booking_source",
     "synced_at",
-    "archived"
+    "archived",
+    "relevance"
 ]
 
 SortOrder = Literal["asc", "desc"]
\ No newline at end of file
@@ -77,3 +77,11 @@ class CampaignOut(CampaignBase):
     copyNeeded: bool
     advertiser: Optional[AdvertiserBase]
     bookingSource: Optional[str] = None
+
+class RateLimitStats(BaseModel):
+    acquired: int
+    waited: int
+    wait_seconds_total: float
+    wait_seconds_max: float
+    throttled: int
+    retries: int
@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
+from typing import Optional
+from datetime import datetime
 
 class SyncResponse(BaseModel):
     status: str  # "success", "partial_failure", "complete_failure"
@@ -6,4 +8,42 @@ class SyncResponse(BaseModel):
     total: int
     upserted: int
     failed: int
-    deleted: int
\ No newline at end of file
+    deleted: int
+
+class SyncRunOut(BaseModel):
+    id: int
+    resource: str
+    mode: str
+    trigger: str
+    owner: str
+    status: str
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    duration_seconds: Optional[float] = None
+    pages_fetched: int
+    upserted: int
+    failed: int
+    deleted: int
+    error: Optional[str] = None
+    coalesced_into: Optional[int] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class SyncJobAccepted(BaseModel):
+    job_id: int
+    status: str
+    coalesced: bool  # True when the request joined a sync that was already running
+
+class SyncJobOut(SyncRunOut):
+    result: Optional[SyncResponse] = None  # set once the job has finished
+
+class SyncFailureOut(BaseModel):
+    resource: str
+    megaphone_id: Optional[str] = None
+    error: str
+    attempts: int
+    first_failed_at: datetime
+    last_failed_at: datetime
+    payload: Optional[str] = None  # JSON of the last payload received from Megaphone
+
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,148 @@
+import re
+import logging
+from sqlalchemy import MetaData, Table, Column, Integer, Float, String, literal_column, text
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+# Kept out of models.Base so create_all/drop_all never touch the FTS5 virtual table
+search_metadata = MetaData()
+campaign_search = Table(
+    "campaign_search",
+    search_metadata,
+    Column("rowid", Integer),
+    Column("title", String),
+    Column("advertiser_name", String),
+    Column("agency_name", String),
+    Column("rank", Float),
+)
+# The index is keyed on this table's INTEGER PRIMARY KEY rather than campaigns.rowid: campaigns has a
+# string primary key, so its implicit rowid may be renumbered by VACUUM
+campaign_search_keys = Table(
+    "campaign_search_keys",
+    search_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("campaign_id", String),
+)
+
+fts_enabled = False
+
+_INDEX_ROW = """
+    SELECT k.id, c.title, a.name, g.name
+    FROM campaigns c
+    JOIN campaign_search_keys k ON k.campaign_id = c.id
+    LEFT JOIN advertisers a ON a.id = c.advertiser_id
+    LEFT JOIN agencies g ON g.id = a.agency_id
+"""
+
+# Search keys of the campaigns matching `where` (a condition on c, the campaigns row)
+_KEYS_WHERE = "SELECT k.id FROM campaign_search_keys k JOIN campaigns c ON c.id = k.campaign_id WHERE {}"
+
+# Recreated on every start, so an existing database picks up changed definitions
+_TRIGGERS = [
+    "campaign_search_ai", "campaign_search_au", "campaign_search_ad",
+    "campaign_search_advertiser_au", "campaign_search_agency_au",
+]
+
+# Triggers keep the index in step with every write path (ORM, bulk upserts, deletes)
+_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS campaign_search USING fts5(
+        title, advertiser_name, agency_name, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS campaign_search_keys (
+        id INTEGER PRIMARY KEY, campaign_id TEXT NOT NULL UNIQUE
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS campaign_search_ai AFTER INSERT ON campaigns BEGIN
+        INSERT OR IGNORE INTO campaign_search_keys (campaign_id) VALUES (new.id);
+        INSERT INTO campaign_search (rowid, title, advertiser_name, agency_name)
+        {_INDEX_ROW} WHERE c.id = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS campaign_search_au AFTER UPDATE OF title, advertiser_id ON campaigns
+    WHEN old.title IS NOT new.title OR old.advertiser_id IS NOT new.advertiser_id BEGIN
+        DELETE FROM campaign_search WHERE rowid = (SELECT id FROM campaign_search_keys WHERE campaign_id = old.id);
+        INSERT INTO campaign_search (rowid, title, advertiser_name, agency_name)
+        {_INDEX_ROW} WHERE c.id = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS campaign_search_ad AFTER DELETE ON campaigns BEGIN
+        DELETE FROM campaign_search WHERE rowid = (SELECT id FROM campaign_search_keys WHERE campaign_id = old.id);
+        DELETE FROM campaign_search_keys WHERE campaign_id = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS campaign_search_advertiser_au AFTER UPDATE OF name, agency_id ON advertisers
+    WHEN old.name IS NOT new.name OR old.agency_id IS NOT new.agency_id BEGIN
+        DELETE FROM campaign_search WHERE rowid IN ({_KEYS_WHERE.format("c.advertiser_id = new.id")});
+        INSERT INTO campaign_search (rowid, title, advertiser_name, agency_name)
+        {_INDEX_ROW} WHERE c.advertiser_id = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS campaign_search_agency_au AFTER UPDATE OF name ON agencies
+    WHEN old.name IS NOT new.name BEGIN
+        DELETE FROM campaign_search WHERE rowid IN (
+            {_KEYS_WHERE.format("c.advertiser_id IN (SELECT id FROM advertisers WHERE agency_id = new.id)")}
+        );
+        INSERT INTO campaign_search (rowid, title, advertiser_name, agency_name)
+        {_INDEX_ROW} WHERE a.agency_id = new.id;
+    END
+    """,
+]
+
+
+def init_search(engine):
+    global fts_enabled
+    if engine.dialect.name != "sqlite":
+        logger.info("Full-text search index requires SQLite FTS5; falling back to ILIKE search")
+        return
+    try:
+        with engine.begin() as conn:
+            for trigger in _TRIGGERS:
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+            for ddl in _DDL:
+                conn.execute(text(ddl))
+            if not search_index_consistent(conn):
+                rebuild_search_index(conn)
+        fts_enabled = True
+    except OperationalError as e:
+        logger.warning(f"Full-text search index unavailable, falling back to ILIKE search: {e}")
+
+
+def search_index_consistent(conn) -> bool:
+    # Every campaign has a key and an index row under that key, and nothing else is indexed.
+    # An index left keyed on campaigns.rowid has no keys, so it is rebuilt.
+    total = conn.execute(text("SELECT count(*) FROM campaigns")).scalar()
+    keyed = conn.execute(text(
+        "SELECT count(*) FROM campaigns c JOIN campaign_search_keys k ON k.campaign_id = c.id "
+        "JOIN campaign_search s ON s.rowid = k.id"
+    )).scalar()
+    keys = conn.execute(text("SELECT count(*) FROM campaign_search_keys")).scalar()
+    indexed = conn.execute(text("SELECT count(*) FROM campaign_search")).scalar()
+    return total == keyed == keys == indexed
+
+
+def rebuild_search_index(conn):
+    conn.execute(text("DELETE FROM campaign_search"))
+    conn.execute(text("DELETE FROM campaign_search_keys"))
+    conn.execute(text("INSERT INTO campaign_search_keys (campaign_id) SELECT id FROM campaigns"))
+    conn.execute(text(f"INSERT INTO campaign_search (rowid, title, advertiser_name, agency_name) {_INDEX_ROW}"))
+
+
+def build_fts_query(search: str):
+    # Every word must match, each as a prefix: "summer pod" -> "summer"* "pod"*
+    terms = re.findall(r"\w+", search)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def match_clause(fts_query: str):
+    return literal_column("campaign_search").op("MATCH")(fts_query)
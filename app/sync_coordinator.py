@@ -0,0 +1,321 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlalchemy import select, update, delete, or_, event
+from sqlalchemy.exc import IntegrityError
+
+from app import db as database
+from app.models import SyncLease, SyncRun
+from app.metrics import SYNC_RUN_DURATION
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# The lease expires unless its holder renews it, so a crashed worker never blocks syncing for long
+SYNC_LEASE_TTL_SECONDS = float(os.getenv("SYNC_LEASE_TTL_SECONDS", "120"))
+SYNC_POLL_SECONDS = 0.5
+# How often a running sync writes its progress (pages, rows so far) to its sync_runs row
+SYNC_PROGRESS_SECONDS = float(os.getenv("SYNC_PROGRESS_SECONDS", "2"))
+
+LEASE_NAME = "sync"
+RESOURCES = ("advertisers", "campaigns")
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SyncBusy(Exception):
+    pass
+
+
+class SyncRunFailed(Exception):
+    pass
+
+
+class SyncLeaseLost(SyncRunFailed):
+    pass
+
+
+class RunTracker:
+    # Counts pages and rows as the sync consumes them; fetchers may run in several threads.
+    # `lease_lost` is set by the heartbeat once another worker may have taken over the sync.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pages_fetched = 0
+        self.upserted = 0
+        self.failed = 0
+        self.lease_lost = threading.Event()
+
+    def check(self):
+        if self.lease_lost.is_set():
+            raise SyncLeaseLost("lease_lost: the sync lease expired or was taken over; run aborted")
+
+    def track(self, pages):
+        for page in pages:
+            self.check()
+            with self._lock:
+                self.pages_fetched += 1
+            yield page
+
+    def record(self, upserted: int, failed: int):
+        with self._lock:
+            self.upserted += upserted
+            self.failed += failed
+
+
+def _expire_run(db, run_id, now: datetime):
+    # Closes a run whose leader stopped renewing the lease; a run that already finished is left alone
+    return db.execute(
+        update(SyncRun)
+        .where(SyncRun.id == run_id, SyncRun.status == "running")
+        .values(status="failed", error="lease_expired", finished_at=now)
+    )
+
+
+def try_acquire_lease(owner: str, ttl: float = None) -> bool:
+    ttl = SYNC_LEASE_TTL_SECONDS if ttl is None else ttl
+    now = datetime.utcnow()
+    with database.SessionLocal() as db:
+        # The previous holder's run is failed in the same transaction as the takeover, and rolled
+        # back with it if the lease turns out to be live
+        _expire_run(db, select(SyncLease.run_id).where(
+            SyncLease.name == LEASE_NAME, SyncLease.expires_at < now, SyncLease.owner != owner
+        ).scalar_subquery(), now)
+        # Take over an expired lease atomically; a live lease held by someone else is left alone
+        res = db.execute(
+            update(SyncLease)
+            .where(SyncLease.name == LEASE_NAME, or_(SyncLease.expires_at < now, SyncLease.owner == owner))
+            .values(owner=owner, run_id=None, acquired_at=now, expires_at=now + timedelta(seconds=ttl))
+        )
+        if res.rowcount == 0:
+            if db.get(SyncLease, LEASE_NAME) is not None:
+                db.rollback()
+                return False
+            db.add(SyncLease(
+                name=LEASE_NAME, owner=owner, acquired_at=now, expires_at=now + timedelta(seconds=ttl)
+            ))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return False
+    return True
+
+
+def renew_lease(owner: str, ttl: float = None, run_id: int = None) -> bool:
+    ttl = SYNC_LEASE_TTL_SECONDS if ttl is None else ttl
+    values = {"expires_at": datetime.utcnow() + timedelta(seconds=ttl)}
+    if run_id is not None:
+        values["run_id"] = run_id
+    with database.SessionLocal() as db:
+        res = db.execute(
+            update(SyncLease).where(SyncLease.name == LEASE_NAME, SyncLease.owner == owner).values(**values)
+        )
+        db.commit()
+        return res.rowcount == 1
+
+
+def release_lease(owner: str):
+    with database.SessionLocal() as db:
+        db.execute(delete(SyncLease).where(SyncLease.name == LEASE_NAME, SyncLease.owner == owner))
+        db.commit()
+
+
+def _covers(run: SyncRun, resource: str, mode: str) -> bool:
+    return run.resource in (resource, "all") and (run.mode == mode or run.mode == "full")
+
+
+def find_inflight_run(resource: str, mode: str):
+    # A run only counts as in flight while its holder keeps the lease alive
+    with database.SessionLocal() as db:
+        row = (
+            db.query(SyncRun)
+            .join(SyncLease, SyncLease.run_id == SyncRun.id)
+            .filter(SyncLease.name == LEASE_NAME, SyncLease.expires_at >= datetime.utcnow())
+            .filter(SyncRun.status == "running")
+            .one_or_none()
+        )
+        if row is not None and _covers(row, resource, mode):
+            return row.id
+    return None
+
+
+def _lease_alive(run_id: int) -> bool:
+    with database.SessionLocal() as db:
+        return db.query(SyncLease).filter(
+            SyncLease.name == LEASE_NAME, SyncLease.run_id == run_id, SyncLease.expires_at >= datetime.utcnow()
+        ).count() > 0
+
+
+def _load_run(run_id: int) -> SyncRun:
+    with database.SessionLocal() as db:
+        run = db.get(SyncRun, run_id)
+        db.expunge(run)
+        return run
+
+
+def wait_for_run(run_id: int) -> SyncRun:
+    while True:
+        alive = _lease_alive(run_id)
+        run = _load_run(run_id)
+        if run.status != "running":
+            return run
+        if not alive:
+            with database.SessionLocal() as db:
+                _expire_run(db, run_id, datetime.utcnow())
+                db.commit()
+            raise SyncRunFailed(f"Sync run {run_id} stopped without finishing")
+        time.sleep(SYNC_POLL_SECONDS)
+
+
+def run_result(run: SyncRun, resource: str) -> dict:
+    if run.status == "failed":
+        raise SyncRunFailed(f"Sync run {run.id} failed: {run.error}")
+    details = json.loads(run.details or "{}")
+    if resource == "all":
+        return details
+    return details.get(resource, {"upserted": 0, "failed": 0, "deleted": 0})
+
+
+def _save_progress(run_id: int, tracker: RunTracker):
+    with database.SessionLocal() as db:
+        db.execute(
+            update(SyncRun).where(SyncRun.id == run_id).values(
+                pages_fetched=tracker.pages_fetched, upserted=tracker.upserted, failed=tracker.failed
+            )
+        )
+        db.commit()
+
+
+def _heartbeat(owner: str, run_id: int, tracker: RunTracker, stop: threading.Event):
+    renewed = time.monotonic()
+    while not stop.wait(min(SYNC_LEASE_TTL_SECONDS / 3, SYNC_PROGRESS_SECONDS)):
+        try:
+            if not renew_lease(owner, run_id=run_id):
+                logger.warning(f"[SYNC] Lost sync lease for run {run_id}; aborting the run")
+                tracker.lease_lost.set()
+                return
+            renewed = time.monotonic()
+            _save_progress(run_id, tracker)
+        except Exception:
+            logger.exception(f"[SYNC] Failed to renew sync lease for run {run_id}")
+            if time.monotonic() - renewed >= SYNC_LEASE_TTL_SECONDS:
+                logger.warning(f"[SYNC] Sync lease for run {run_id} expired before it could be renewed; aborting the run")
+                tracker.lease_lost.set()
+                return
+
+
+def _start_run(owner: str, resource: str, mode: str, trigger: str, run_id: int = None) -> int:
+    with database.SessionLocal() as db:
+        run = db.get(SyncRun, run_id) if run_id is not None else None
+        if run is None:
+            run = SyncRun(resource=resource, mode=mode, trigger=trigger)
+            db.add(run)
+        run.owner = owner
+        run.status = "running"
+        run.started_at = datetime.utcnow()
+        db.commit()
+        run_id = run.id
+    renew_lease(owner, run_id=run_id)
+    return run_id
+
+
+def _record_joined(run_id: int, joined: SyncRun):
+    with database.SessionLocal() as db:
+        run = db.get(SyncRun, run_id)
+        for column in ("status", "finished_at", "pages_fetched", "upserted", "failed", "deleted", "details", "error"):
+            setattr(run, column, getattr(joined, column))
+        if joined.status != "failed" and joined.resource != run.resource:
+            # The joined run covered more resources; the job only reports its own resource's counts
+            counts = run_result(joined, run.resource)
+            run.upserted = counts.get("upserted", 0)
+            run.failed = counts.get("failed", 0)
+            run.deleted = counts.get("deleted", 0)
+            run.status = "partial_failure" if run.failed else "success"
+            run.details = json.dumps({run.resource: counts}, default=str)
+        run.duration_seconds = round((joined.finished_at - run.started_at).total_seconds(), 3) if joined.finished_at else None
+        run.coalesced_into = joined.id
+        db.commit()
+
+
+def _finish_run(run_id: int, started: float, tracker: RunTracker, result: dict = None, error: str = None):
+    with database.SessionLocal() as db:
+        run = db.get(SyncRun, run_id)
+        run.finished_at = datetime.utcnow()
+        run.duration_seconds = round(time.monotonic() - started, 3)
+        run.pages_fetched = tracker.pages_fetched
+        if error is not None:
+            run.status = "failed"
+            run.error = error
+        else:
+            counts = [result[r] for r in RESOURCES if r in result]
+            run.upserted = sum(c.get("upserted", 0) for c in counts)
+            run.failed = sum(c.get("failed", 0) for c in counts)
+            run.deleted = sum(c.get("deleted", 0) for c in counts)
+            run.status = "partial_failure" if run.failed else "success"
+            run.details = json.dumps(result, default=str)
+        db.commit()
+        SYNC_RUN_DURATION.labels(run.resource, run.mode, run.status).observe(run.duration_seconds)
+
+
+def _lead(owner: str, resource: str, mode: str, trigger: str, sync, run_id: int = None) -> dict:
+    started = time.monotonic()
+    tracker = RunTracker()
+    run_id = _start_run(owner, resource, mode, trigger, run_id)
+    stop = threading.Event()
+    heartbeat = threading.Thread(
+        target=_heartbeat, args=(owner, run_id, tracker, stop), name="sync-lease-heartbeat", daemon=True
+    )
+    heartbeat.start()
+    logger.info(f"[SYNC] Run {run_id} started: {mode} {resource} ({trigger})")
+    # The run row is finalised before the lease goes, so joined callers always see the outcome
+    try:
+        try:
+            with database.SessionLocal() as db:
+                # Once the lease is lost, the sync's commits are refused and its pages stop
+                event.listen(db, "before_commit", lambda session: tracker.check())
+                result = sync(db, tracker)
+        except Exception as e:
+            _finish_run(run_id, started, tracker, error=repr(e))
+            raise
+        _finish_run(run_id, started, tracker, result=result)
+    finally:
+        stop.set()
+        release_lease(owner)
+    logger.info(f"[SYNC] Run {run_id} finished in {time.monotonic() - started:.1f}s")
+    return result
+
+
+def run_sync(
+    resource: str, incremental: bool, trigger: str, sync,
+    wait_seconds: float = 0, join: bool = True, run_id: int = None, mode: str = None
+):
+    # `sync(db, tracker)` returns {resource: counts, ...}. Only one run holds the lease cluster-wide;
+    # with `join`, a request already covered by the in-flight run waits for it and returns its counts.
+    # `run_id` reuses a sync_runs row created earlier (a queued job). Raises SyncBusy if the lease
+    # could not be taken within `wait_seconds`. `mode` overrides the label derived from `incremental`
+    # (e.g. "retry"); a full run covers every other mode.
+    mode = mode or ("incremental" if incremental else "full")
+    owner = f"{PROCESS_ID}:{uuid.uuid4().hex[:8]}"
+    deadline = time.monotonic() + wait_seconds
+    while True:
+        inflight = find_inflight_run(resource, mode)
+        if inflight is not None and join:
+            logger.info(f"[SYNC] Joining in-flight run {inflight} for {mode} {resource}")
+            joined = wait_for_run(inflight)
+            if run_id is not None:
+                _record_joined(run_id, joined)
+            return run_result(joined, resource)
+        if try_acquire_lease(owner):
+            break
+        if time.monotonic() >= deadline:
+            raise SyncBusy(f"Another sync is running; {mode} {resource} sync not started")
+        time.sleep(SYNC_POLL_SECONDS)
+
+    result = _lead(owner, resource, mode, trigger, sync, run_id)
+    return result if resource == "all" else result.get(resource)
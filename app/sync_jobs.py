@@ -0,0 +1,152 @@
+import os
+import socket
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlalchemy import update
+
+from app import db as database
+from app.models import SyncLease, SyncRun
+from app.sync_coordinator import run_sync, find_inflight_run, SyncBusy, SyncRunFailed, PROCESS_ID, LEASE_NAME
+from app.metrics import SYNC_JOBS_QUEUED, SYNC_JOBS_RUNNING
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Queued manual syncs wait this long for the cluster-wide lease before the job is marked failed
+SYNC_JOB_WAIT_SECONDS = float(os.getenv("SYNC_JOB_WAIT_SECONDS", "3600"))
+SYNC_JOB_WORKERS = int(os.getenv("SYNC_JOB_WORKERS", "2"))
+
+# Jobs only run one at a time cluster-wide (see sync_coordinator); extra workers just wait for the lease
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SYNC_JOB_WORKERS, thread_name_prefix="sync-job")
+        return _executor
+
+
+def _mark_failed(run_id: int, error: str):
+    with database.SessionLocal() as db:
+        run = db.get(SyncRun, run_id)
+        if run.status in ("queued", "running"):
+            run.status = "failed"
+            run.error = error
+            db.commit()
+
+
+def _run_job(run_id: int, resource: str, incremental: bool, sync, mode: str):
+    SYNC_JOBS_QUEUED.dec()
+    SYNC_JOBS_RUNNING.inc()
+    try:
+        run_sync(resource, incremental, "manual", sync, wait_seconds=SYNC_JOB_WAIT_SECONDS, run_id=run_id, mode=mode)
+    except (SyncBusy, SyncRunFailed) as e:
+        logger.warning(f"[SYNC] Job {run_id} did not complete: {e}")
+        _mark_failed(run_id, str(e))
+    except Exception as e:
+        # run_sync has already recorded the failure on the run row
+        logger.exception(f"[SYNC] Job {run_id} failed")
+        _mark_failed(run_id, repr(e))
+    finally:
+        SYNC_JOBS_RUNNING.dec()
+
+
+def submit_sync(resource: str, incremental: bool, sync, mode: str = None):
+    # Returns (job_id, coalesced). A request the in-flight run already covers gets that run's ID;
+    # otherwise a queued sync_runs row is created and the sync runs on a background thread.
+    mode = mode or ("incremental" if incremental else "full")
+    inflight = find_inflight_run(resource, mode)
+    if inflight is not None:
+        return inflight, True
+    with database.SessionLocal() as db:
+        run = SyncRun(resource=resource, mode=mode, trigger="manual", owner=PROCESS_ID, status="queued")
+        db.add(run)
+        db.commit()
+        run_id = run.id
+    SYNC_JOBS_QUEUED.inc()
+    get_executor().submit(_run_job, run_id, resource, incremental, sync, mode)
+    return run_id, False
+
+
+def _fail_runs(run_ids: list, status: str, error: str) -> int:
+    if not run_ids:
+        return 0
+    with database.SessionLocal() as db:
+        failed = db.execute(
+            update(SyncRun)
+            .where(SyncRun.id.in_(run_ids), SyncRun.status == status)
+            .values(status="failed", error=error, finished_at=datetime.utcnow())
+        ).rowcount
+        db.commit()
+    return failed
+
+
+def _queued_runs():
+    with database.SessionLocal() as db:
+        return db.query(SyncRun.id, SyncRun.owner, SyncRun.started_at).filter(SyncRun.status == "queued").all()
+
+
+def _running_runs():
+    # Each running row with whether its owner still holds a live lease
+    with database.SessionLocal() as db:
+        live = db.query(SyncLease.owner).filter(
+            SyncLease.name == LEASE_NAME, SyncLease.expires_at >= datetime.utcnow()
+        ).scalar()
+        return [
+            (run_id, owner, owner is not None and owner == live)
+            for run_id, owner in db.query(SyncRun.id, SyncRun.owner).filter(SyncRun.status == "running")
+        ]
+
+
+def _owner_gone(owner: str) -> bool:
+    # Only a process on this host can be checked; owners are "<hostname>:<pid>", and a run's lease
+    # owner adds a ":<suffix>"
+    if not owner:
+        return False
+    host, _, rest = owner.partition(":")
+    pid = rest.split(":")[0]
+    if host != socket.gethostname() or not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def fail_orphaned_jobs() -> int:
+    # Called at startup. A queued job whose worker died never runs, so its row would stay "queued"
+    # and status polling would never end. Fails jobs queued by a dead process on this host, and jobs
+    # from any host that have been queued for twice the lease wait, which a live job never reaches
+    # unless the queue ahead of it is stuck. A running row is only alive while its owner holds an
+    # unexpired lease, so one whose owner died or lost the lease is failed as well.
+    cutoff = datetime.utcnow() - timedelta(seconds=2 * SYNC_JOB_WAIT_SECONDS)
+    orphaned = [run_id for run_id, owner, queued_at in _queued_runs() if _owner_gone(owner) or queued_at < cutoff]
+    failed = _fail_runs(orphaned, "queued", "cancelled: the worker that queued this job stopped before it ran")
+    abandoned = [run_id for run_id, owner, leased in _running_runs() if _owner_gone(owner) or not leased]
+    failed += _fail_runs(abandoned, "running", "lease_expired")
+    if failed:
+        logger.warning(f"[SYNC] Marked {failed} orphaned sync job(s) as failed")
+    return failed
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+    # The cancelled jobs never start; fail their rows so anyone polling them gets an answer
+    queued = [run_id for run_id, owner, _ in _queued_runs() if owner == PROCESS_ID]
+    failed = _fail_runs(queued, "queued", "cancelled: the worker shut down before the job ran")
+    if failed:
+        logger.info(f"[SYNC] Cancelled {failed} queued sync job(s) on shutdown")
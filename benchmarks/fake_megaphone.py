@@ -0,0 +1,211 @@
+import json
+import time
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+ORGANIZATION_ID = "bench-org"
+DEFAULT_PER_PAGE = 100
+MAX_PER_PAGE = 500
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _timestamp(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _updated_at(i: int, version: int) -> str:
+    # Each edit moves updatedAt a year past every unedited record, so incremental syncs pick it up
+    return _timestamp(BASE_TIME + timedelta(days=365 * version, seconds=i))
+
+
+class SyntheticOrg:
+    # Deterministic organization: records are built from their index on demand, so a 100k campaign
+    # org costs one page of dicts per request instead of the whole dataset in memory
+    def __init__(self, campaigns: int, advertisers: int = None, agencies: int = None, seed: int = 0):
+        self.campaign_count = campaigns
+        self.advertiser_count = advertisers or max(10, campaigns // 20)
+        self.agency_count = agencies or max(1, self.advertiser_count // 10)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # index -> number of times the record was edited upstream since the org was created
+        self.campaign_versions = {}
+        self.advertiser_versions = {}
+
+    def agency(self, i: int) -> dict:
+        return {"id": f"agency-{i:06d}", "name": f"Agency {i}"}
+
+    def advertiser(self, i: int) -> dict:
+        version = self.advertiser_versions.get(i, 0)
+        agency = self.agency(i % self.agency_count) if i % 4 else None
+        return {
+            "id": f"advertiser-{i:06d}",
+            "name": f"Advertiser {i}" + (f" v{version}" if version else ""),
+            "agency": agency,
+            "competitiveCategories": f"category-{i % 7}",
+            "createdAt": _timestamp(BASE_TIME + timedelta(seconds=i)),
+            "updatedAt": _updated_at(i, version),
+        }
+
+    def campaign(self, i: int) -> dict:
+        version = self.campaign_versions.get(i, 0)
+        return {
+            "id": f"campaign-{i:07d}",
+            "externalId": f"ext-{i}",
+            "title": f"Campaign {i}" + (f" v{version}" if version else ""),
+            "organizationId": ORGANIZATION_ID,
+            "advertiser": self.advertiser(i % self.advertiser_count),
+            "totalBudgetCents": 100000 + i,
+            "totalBudgetCurrency": "USD",
+            "totalRevenueCents": 50000 + i + version,
+            "totalRevenueCurrency": "USD",
+            "durationInSeconds": 30,
+            "copyNeeded": bool(i % 2),
+            "bookingSource": "bench",
+            "createdAt": _timestamp(BASE_TIME + timedelta(seconds=i)),
+            "updatedAt": _updated_at(i, version),
+        }
+
+    def touch(self, fraction: float) -> int:
+        # Edits a random `fraction` of campaigns and advertisers so an incremental sync has work to do
+        with self._lock:
+            campaigns = self._random.sample(range(self.campaign_count), int(self.campaign_count * fraction))
+            for i in campaigns:
+                self.campaign_versions[i] = self.campaign_versions.get(i, 0) + 1
+            advertisers = self._random.sample(range(self.advertiser_count), int(self.advertiser_count * fraction))
+            for i in advertisers:
+                self.advertiser_versions[i] = self.advertiser_versions.get(i, 0) + 1
+        return len(campaigns) + len(advertisers)
+
+
+class FakeMegaphone:
+    # Local stand-in for the Megaphone API: paginated list endpoints with Link / X-Total headers,
+    # single-campaign reads, per-request latency and a share of 429 responses with Retry-After.
+    # Test hooks live under /_bench (POST /_bench/touch?fraction=, GET /_bench/stats).
+    def __init__(
+        self, org: SyntheticOrg, latency_ms: float = 0, jitter_ms: float = 0,
+        throttle_rate: float = 0, retry_after: float = 0.05, seed: int = 0
+    ):
+        self.org = org
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        server = self
+
+        class Handler(_Handler):
+            fake = server
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-megaphone", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "throttled": self.throttled}
+
+    def _admit(self) -> bool:
+        # False means this request gets a 429
+        with self._lock:
+            self.requests += 1
+            throttle = self.throttle_rate and self._random.random() < self.throttle_rate
+            if throttle:
+                self.throttled += 1
+            delay = self.latency_ms + (self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay:
+            time.sleep(delay / 1000)
+        return not throttle
+
+    def page(self, resource: str, page: int, per_page: int):
+        total = self.org.campaign_count if resource == "campaigns" else self.org.advertiser_count
+        build = self.org.campaign if resource == "campaigns" else self.org.advertiser
+        start = (page - 1) * per_page
+        return [build(i) for i in range(start, min(start + per_page, total))], total
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so the client's pooled keep-alive connections are reused as in production
+    protocol_version = "HTTP/1.1"
+    fake: FakeMegaphone = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body, headers: dict = None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        parts = parsed.path.strip("/").split("/")
+        if parts == ["_bench", "stats"]:
+            return self._send(200, self.fake.stats())
+        if len(parts) < 3 or parts[0] != "organizations" or parts[1] != ORGANIZATION_ID:
+            return self._send(404, {"error": "Not found"})
+        if not self.fake._admit():
+            return self._send(429, {"error": "Too many requests"}, {"Retry-After": str(self.fake.retry_after)})
+
+        if len(parts) == 4 and parts[2] == "campaigns":
+            index = int(parts[3].rpartition("-")[2]) if parts[3].startswith("campaign-") else -1
+            if not 0 <= index < self.fake.org.campaign_count:
+                return self._send(404, {"error": "Campaign not found"})
+            return self._send(200, self.fake.org.campaign(index))
+        if len(parts) != 3 or parts[2] not in ("advertisers", "campaigns"):
+            return self._send(404, {"error": "Not found"})
+
+        query = parse_qs(parsed.query)
+        page = max(1, int(query.get("page", ["1"])[0]))
+        per_page = min(MAX_PER_PAGE, max(1, int(query.get("per_page", [DEFAULT_PER_PAGE])[0])))
+        records, total = self.fake.page(parts[2], page, per_page)
+        last_page = max(1, -(-total // per_page))
+        url = f"{self.fake.base_url}{parsed.path}?per_page={per_page}"
+        links = []
+        if page < last_page:
+            links.append(f'<{url}&page={page + 1}>; rel="next"')
+        links.append(f'<{url}&page={last_page}>; rel="last"')
+        self._send(200, records, {"Link": ", ".join(links), "X-Total": str(total), "X-Per-Page": str(per_page)})
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        if parsed.path == "/_bench/touch":
+            fraction = float(parse_qs(parsed.query).get("fraction", ["0.01"])[0])
+            return self._send(200, {"touched": self.fake.org.touch(fraction)})
+        self._send(404, {"error": "Not found"})
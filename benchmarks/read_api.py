@@ -0,0 +1,496 @@
+import os
+import sys
+import math
+import time
+import uuid
+import random
+import socket
+import asyncio
+import logging
+import sqlite3
+import argparse
+import subprocess
+from typing import get_args
+from datetime import datetime, timedelta
+from contextlib import asynccontextmanager, contextmanager
+
+import httpx
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from main import app
+from app import models
+from app.db import create_db_engine, create_async_db_engine, get_async_read_db
+from app.search import init_search
+from app.changes import init_changes
+from app.cache import response_cache
+from app.cruds.pagination import encode_cursor, keyset_order
+from app.schemas.pagination import SortByField
+from benchmarks.results import RESULTS_DIR, new_report, write_report, load_report
+
+# Latency and throughput of the local read API (GET /campaigns, GET /advertisers) on a synthetic
+# dataset seeded through app.models. Each query shape is driven by concurrent clients in-process
+# (httpx over ASGI) and/or against a uvicorn server, and its SELECTs are run through
+# EXPLAIN QUERY PLAN. The response cache is off unless --cache is given, so every request hits the DB.
+#
+#   python -m benchmarks.read_api --size 100000 --concurrency 16 --show-plans
+#   python -m benchmarks.read_api --targets uvicorn --workers 4 --baseline bench_results/read_api-<commit>.json
+#   python -m benchmarks.read_api --compare old.json new.json
+
+TARGETS = ("inprocess", "uvicorn")
+PER_PAGE = 20
+SEED_BATCH = 5000
+BASE_TIME = datetime(2023, 1, 1)
+TITLE_WORDS = [
+    "summer", "winter", "spring", "autumn", "launch", "brand", "holiday", "podcast",
+    "sports", "finance", "travel", "health", "music", "news", "retail", "auto",
+]
+CURRENCIES = ["USD", "EUR", "GBP", "CAD"]
+BOOKING_SOURCES = ["direct", "programmatic", "house", None]
+SERVER_START_SECONDS = 30
+
+# main configures INFO logging; httpx would log every benchmark request
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+# --- Dataset ---
+
+def _database_path(url: str) -> str:
+    return make_url(url).database
+
+
+def _campaign_row(rng: random.Random, i: int, advertiser_ids: list, new_id) -> dict:
+    created_at = BASE_TIME + timedelta(minutes=rng.randrange(2 * 365 * 24 * 60))
+    return {
+        "id": new_id(),
+        "megaphone_id": f"campaign-{i:07d}",
+        "external_id": f"ext-{i}",
+        "title": f"{rng.choice(TITLE_WORDS).title()} {rng.choice(TITLE_WORDS)} campaign {i}",
+        "advertiser_id": rng.choice(advertiser_ids) if rng.random() > 0.02 else None,
+        "organization_id": f"org-{rng.randrange(3)}",
+        "total_budget_cents": rng.randrange(1000, 10_000_000),
+        "total_budget_currency": rng.choice(CURRENCIES),
+        "total_revenue_cents": rng.randrange(0, 5_000_000) if rng.random() > 0.2 else None,
+        "total_revenue_currency": rng.choice(CURRENCIES),
+        "duration_in_seconds": rng.choice([15, 30, 60, None]),
+        "copy_needed": rng.random() < 0.3,
+        "booking_source": rng.choice(BOOKING_SOURCES),
+        "created_at": created_at,
+        "updated_at": created_at + timedelta(days=rng.randrange(90)),
+        "synced_at": BASE_TIME + timedelta(days=800, seconds=i),
+        "archived": rng.random() < 0.1,
+    }
+
+
+def seed_database(url: str, size: int, seed: int = 0):
+    # `size` campaigns, one advertiser per 20 campaigns and one agency per 10 advertisers. Inserts go
+    # through the FTS and change-feed triggers, as synced rows do.
+    rng = random.Random(seed)
+
+    def new_id():
+        return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+    engine = create_db_engine(url)
+    models.Base.metadata.create_all(bind=engine)
+    init_search(engine)
+    init_changes(engine)
+    agencies = [
+        {"id": new_id(), "megaphone_id": f"agency-{i:06d}", "name": f"{rng.choice(TITLE_WORDS).title()} Agency {i}"}
+        for i in range(max(1, size // 200))
+    ]
+    advertisers = [
+        {
+            "id": new_id(),
+            "megaphone_id": f"advertiser-{i:06d}",
+            "name": f"{rng.choice(TITLE_WORDS).title()} Advertiser {i}",
+            "agency_id": rng.choice(agencies)["id"] if rng.random() > 0.25 else None,
+            "created_at": BASE_TIME,
+            "updated_at": BASE_TIME,
+        }
+        for i in range(max(10, size // 20))
+    ]
+    advertiser_ids = [a["id"] for a in advertisers]
+    with engine.begin() as conn:
+        conn.execute(insert(models.Agency), agencies)
+        conn.execute(insert(models.Advertiser), advertisers)
+        for start in range(0, size, SEED_BATCH):
+            conn.execute(insert(models.Campaign), [
+                _campaign_row(rng, i, advertiser_ids, new_id) for i in range(start, min(size, start + SEED_BATCH))
+            ])
+    engine.dispose()
+
+
+def campaign_count(url: str) -> int:
+    if not os.path.exists(_database_path(url)):
+        return None
+    engine = create_db_engine(url)
+    try:
+        with engine.connect() as conn:
+            return conn.scalar(select(func.count(models.Campaign.id)))
+    except Exception:
+        return None
+    finally:
+        engine.dispose()
+
+
+# --- Query shapes ---
+
+def _deep_pages(size: int) -> list:
+    last_page = max(1, -(-size // PER_PAGE))
+    return sorted({page for page in (10, 100, 1000, last_page // 2, last_page) if 1 < page <= last_page})
+
+
+def build_shapes(url: str, size: int) -> list:
+    # (name, path, params(rng)) per query shape. Deep pages are sized to the dataset; each one is
+    # also requested through the equivalent keyset cursor.
+    pages = _deep_pages(size)
+    engine = create_db_engine(url)
+    with engine.connect() as conn:
+        advertiser_ids = list(conn.scalars(select(models.Advertiser.id)))
+        cursors = {}
+        for page in pages:
+            # The cursor for page N points at the last row of page N - 1
+            row = conn.execute(
+                select(models.Campaign.created_at, models.Campaign.id)
+                .order_by(*keyset_order(models.Campaign.created_at, models.Campaign.id, "desc"))
+                .offset((page - 1) * PER_PAGE - 1).limit(1)
+            ).one()
+            cursors[page] = encode_cursor("created_at", "desc", row.created_at, row.id)
+    engine.dispose()
+
+    def fixed(**params):
+        return lambda rng: {"per_page": PER_PAGE, **params}
+
+    shapes = [("advertisers", "/advertisers", lambda rng: {})]
+    for field in get_args(SortByField):
+        if field != "relevance":
+            shapes.append((f"sort_by={field}", "/campaigns", fixed(sort_by=field)))
+    shapes += [
+        ("search=<all rows>", "/campaigns", fixed(search="campaign")),
+        ("search=<word>", "/campaigns", lambda rng: {"per_page": PER_PAGE, "search": rng.choice(TITLE_WORDS)}),
+        ("search=<prefix>", "/campaigns", lambda rng: {"per_page": PER_PAGE, "search": rng.choice(TITLE_WORDS)[:3]}),
+        ("search=<2 words>&sort_by=relevance", "/campaigns", lambda rng: {
+            "per_page": PER_PAGE, "search": " ".join(rng.sample(TITLE_WORDS, 2)), "sort_by": "relevance"
+        }),
+        ("advertiser_id", "/campaigns", lambda rng: {"per_page": PER_PAGE, "advertiser_id": rng.choice(advertiser_ids)}),
+        ("archived=true", "/campaigns", fixed(archived="true")),
+    ]
+    for page in pages:
+        shapes.append((f"page={page}", "/campaigns", fixed(page=page)))
+        shapes.append((f"cursor@page={page}", "/campaigns", fixed(cursor=cursors[page])))
+    shapes.append((f"page={pages[-1]}&include_total=false", "/campaigns", fixed(page=pages[-1], include_total="false")))
+    return shapes
+
+
+# --- Load ---
+
+def percentile(sorted_values: list, pct: float) -> float:
+    # Nearest-rank percentile
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(target: str, name: str, path: str, latencies: list, errors: int, wall: float, concurrency: int) -> dict:
+    latencies = sorted(latencies)
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "target": target,
+        "shape": name,
+        "path": path,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round((len(latencies) + errors) / wall, 1) if wall else None,
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 50)),
+            "p90": ms(percentile(latencies, 90)),
+            "p99": ms(percentile(latencies, 99)),
+            "max": ms(latencies[-1] if latencies else None),
+            "mean": ms(sum(latencies) / len(latencies) if latencies else None),
+        },
+    }
+
+
+async def drive(client: httpx.AsyncClient, target: str, shapes: list, requests: int, concurrency: int, warmup: int, seed: int) -> list:
+    results = []
+    for name, path, params in shapes:
+        rng = random.Random(f"{seed}:{name}")
+        for _ in range(warmup):
+            await client.get(path, params=params(rng))
+
+        remaining = iter(range(requests))
+        latencies = []
+        errors = 0
+
+        async def worker():
+            nonlocal errors
+            # Workers share one iterator, so exactly `requests` requests are sent
+            for _ in remaining:
+                query = params(rng)
+                start = time.perf_counter()
+                try:
+                    ok = (await client.get(path, params=query)).status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        result = summarize(target, name, path, latencies, errors, time.perf_counter() - start, concurrency)
+        print(format_result(result), flush=True)
+        results.append(result)
+    return results
+
+
+@contextmanager
+def response_cache_enabled(enabled: bool):
+    maxsize = response_cache.maxsize
+    if not enabled:
+        # Every entry is evicted as soon as it is stored, so each request rebuilds its response
+        response_cache.maxsize = 0
+    response_cache.clear()
+    try:
+        yield
+    finally:
+        response_cache.maxsize = maxsize
+        response_cache.clear()
+
+
+@asynccontextmanager
+async def inprocess_client(url: str):
+    # Drives the FastAPI app over ASGI; read routes get sessions on the benchmark database
+    engine = create_async_db_engine(url)
+    session_factory = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async def bench_read_db():
+        async with session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_async_read_db] = bench_read_db
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60) as client:
+            yield client, engine
+    finally:
+        app.dependency_overrides.pop(get_async_read_db, None)
+        await engine.dispose()
+
+
+async def run_inprocess(url: str, shapes: list, requests: int, concurrency: int, warmup: int, seed: int, cache: bool = False) -> list:
+    with response_cache_enabled(cache):
+        async with inprocess_client(url) as (client, _):
+            return await drive(client, "inprocess", shapes, requests, concurrency, warmup, seed)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_uvicorn(url: str, workers: int, cache: bool):
+    # Lifespan is off: the database is already initialised and the sync scheduler must not start.
+    # The server logs as in production (app/log); its console output is dropped.
+    port = _free_port()
+    env = {**os.environ, "DATABASE_URL": url, "DATABASE_READ_URL": ""}
+    if not cache:
+        env["RESPONSE_CACHE_MAXSIZE"] = "0"
+    process = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--lifespan", "off",
+    ], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + SERVER_START_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/openapi.json", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"uvicorn did not start within {SERVER_START_SECONDS}s")
+
+
+async def run_uvicorn(url: str, shapes: list, requests: int, concurrency: int, warmup: int, seed: int, workers: int = 1, cache: bool = False) -> list:
+    process, base_url = start_uvicorn(url, workers, cache)
+    try:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            return await drive(client, "uvicorn", shapes, requests, concurrency, warmup, seed)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# --- Query plans ---
+
+def explain(conn: sqlite3.Connection, statement: str, parameters) -> list:
+    # EXPLAIN QUERY PLAN rows as indented lines, following each row's parent
+    depth = {0: -1}
+    lines = []
+    for row_id, parent, _, detail in conn.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ()):
+        depth[row_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[row_id] + detail)
+    return lines
+
+
+async def collect_plans(url: str, shapes: list, seed: int) -> dict:
+    # One uncached request per shape; every SELECT it ran is explained against the same database
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    plans = {}
+    with response_cache_enabled(False):
+        async with inprocess_client(url) as (client, engine):
+            event.listen(engine.sync_engine, "before_cursor_execute", capture)
+            for name, path, params in shapes:
+                captured.clear()
+                await client.get(path, params=params(random.Random(f"{seed}:{name}")))
+                plans[name] = list(captured)
+
+    conn = sqlite3.connect(_database_path(url))
+    try:
+        return {
+            name: [{"sql": statement, "plan": explain(conn, statement, parameters)} for statement, parameters in statements]
+            for name, statements in plans.items()
+        }
+    finally:
+        conn.close()
+
+
+# --- Report ---
+
+def format_result(result: dict) -> str:
+    latency = result["latency_ms"]
+    return (
+        f"{result['target']:<10} {result['shape']:<40} p50 {latency['p50']:>8} ms  p90 {latency['p90']:>8} ms  "
+        f"p99 {latency['p99']:>8} ms  max {latency['max']:>8} ms  {result['throughput_rps']:>8} req/s  "
+        f"{result['errors']} errors"
+    )
+
+
+def compare(baseline: dict, current: dict, max_regression: float):
+    # Returns (report lines, regressed); a shape regresses when its p99 grows by more than
+    # `max_regression` percent
+    def key(r):
+        return (r["target"], r["shape"])
+
+    previous = {key(r): r for r in baseline["results"]}
+    lines = [f"Baseline {baseline.get('commit')} -> {current.get('commit')}"]
+    regressed = False
+    for result in current["results"]:
+        before = previous.get(key(result))
+        if before is None or not before["latency_ms"]["p99"] or result["latency_ms"]["p99"] is None:
+            continue
+        change = (result["latency_ms"]["p99"] / before["latency_ms"]["p99"] - 1) * 100
+        flag = ""
+        if change > max_regression:
+            regressed = True
+            flag = "  REGRESSION"
+        lines.append(
+            f"{result['target']:<10} {result['shape']:<40} p99 {before['latency_ms']['p99']:>8} -> "
+            f"{result['latency_ms']['p99']:>8} ms ({change:+.1f}%), p50 {before['latency_ms']['p50']} -> "
+            f"{result['latency_ms']['p50']} ms, {before['throughput_rps']} -> {result['throughput_rps']} req/s{flag}"
+        )
+    return lines, regressed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Latency and throughput benchmark for the local read API")
+    parser.add_argument("--size", type=int, default=100000, help="Campaigns in the synthetic dataset")
+    parser.add_argument("--db", help=f"SQLite file for the dataset (default {RESULTS_DIR}/read_api-<size>-<seed>.db)")
+    parser.add_argument("--reseed", action="store_true", help="Rebuild the dataset even if the file already has it")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per query shape")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests per query shape")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--cache", action="store_true", help="Keep the response cache on (cache hits after the first request)")
+    parser.add_argument("--only", nargs="+", help="Only run shapes whose name contains one of these strings")
+    parser.add_argument("--show-plans", action="store_true", help="Print EXPLAIN QUERY PLAN output per shape")
+    parser.add_argument("--output", help=f"Results file (default {RESULTS_DIR}/read_api-<commit>.json)")
+    parser.add_argument("--baseline", help="Results file to compare this run against")
+    parser.add_argument("--max-regression", type=float, default=20, help="Allowed p99 increase, in percent")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Compare two results files and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.compare:
+        lines, regressed = compare(load_report(args.compare[0]), load_report(args.compare[1]), args.max_regression)
+        print("\n".join(lines))
+        return 1 if regressed else 0
+
+    path = os.path.abspath(args.db or os.path.join(RESULTS_DIR, f"read_api-{args.size}-{args.seed}.db"))
+    url = f"sqlite:///{path}"
+    if args.reseed or campaign_count(url) != args.size:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        start = time.perf_counter()
+        seed_database(url, args.size, args.seed)
+        print(f"Seeded {args.size} campaigns into {path} in {time.perf_counter() - start:.1f}s", flush=True)
+
+    shapes = build_shapes(url, args.size)
+    if args.only:
+        shapes = [shape for shape in shapes if any(term in shape[0] for term in args.only)]
+
+    plans = asyncio.run(collect_plans(url, shapes, args.seed))
+    if args.show_plans:
+        for name, statements in plans.items():
+            print(f"\n== {name}")
+            for statement in statements:
+                print(" ".join(statement["sql"].split()))
+                print("\n".join(f"    {line}" for line in statement["plan"]))
+        print()
+
+    results = []
+    load = (args.requests, args.concurrency, args.warmup, args.seed)
+    if "inprocess" in args.targets:
+        results += asyncio.run(run_inprocess(url, shapes, *load, cache=args.cache))
+    if "uvicorn" in args.targets:
+        results += asyncio.run(run_uvicorn(url, shapes, *load, workers=args.workers, cache=args.cache))
+
+    report = new_report("read_api", {
+        "size": args.size,
+        "seed": args.seed,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "warmup": args.warmup,
+        "workers": args.workers,
+        "cache": args.cache,
+        "per_page": PER_PAGE,
+    })
+    report["results"] = results
+    report["plans"] = plans
+    print(f"Results written to {write_report(report, args.output)}")
+
+    if args.baseline:
+        lines, regressed = compare(load_report(args.baseline), report, args.max_regression)
+        print("\n".join(lines))
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+import os
+import json
+import platform
+import subprocess
+from datetime import datetime
+
+# Benchmark results are JSON files named <benchmark>-<commit>.json, so runs from different commits
+# can be kept side by side and compared
+RESULTS_DIR = "bench_results"
+
+
+def _git(*args) -> str:
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def new_report(benchmark: str, settings: dict) -> dict:
+    return {
+        "benchmark": benchmark,
+        "commit": _git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": settings,
+    }
+
+
+def write_report(report: dict, output: str = None) -> str:
+    output = output or os.path.join(RESULTS_DIR, f"{report['benchmark']}-{report['commit'] or 'local'}.json")
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    return output
+
+
+def load_report(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
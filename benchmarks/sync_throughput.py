@@ -0,0 +1,307 @@
+import os
+import sys
+import time
+import argparse
+import resource
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from app import megaphone_client
+from app.db import create_db_engine
+from app.models import Base
+from app.search import init_search
+from app.changes import init_changes
+from app.rate_limiter import TokenBucket
+from app.cruds.sync import sync_all_advertisers, sync_all_campaigns
+from app.cruds.bulk_sync import bulk_sync_all_advertisers, bulk_sync_all_campaigns
+from app.cruds.sync_pipeline import run_sync_pipeline
+from benchmarks.fake_megaphone import FakeMegaphone, SyntheticOrg, ORGANIZATION_ID
+from benchmarks.results import RESULTS_DIR, new_report, write_report, load_report
+
+# Measures sync throughput against a local fake Megaphone. The fake server runs in this process;
+# every scenario runs in a fresh child process on a fresh SQLite file, so peak RSS and query counts
+# belong to that scenario alone.
+#
+#   python -m benchmarks.sync_throughput --sizes 1000 10000 --latency-ms 20 --throttle-rate 0.01
+#   python -m benchmarks.sync_throughput --baseline bench_results/sync_throughput-<commit>.json
+#   python -m benchmarks.sync_throughput --compare old.json new.json
+
+SIZES = (1000, 10000, 100000)
+# per-record: sync_all_* (the default manual sync); bulk: bulk_sync_all_* (?bulk=true / ?incremental=true);
+# pipeline: run_sync_pipeline (the scheduled sync, fetching both resources concurrently)
+PATHS = ("per-record", "bulk", "pipeline")
+MODES = ("full", "incremental")
+# Token bucket rate standing in for "no client-side rate limit"
+UNLIMITED_RATE = 1e9
+RSS_SAMPLE_SECONDS = 0.02
+
+
+def _per_record(db, incremental: bool) -> dict:
+    return {"advertisers": sync_all_advertisers(db), "campaigns": sync_all_campaigns(db)}
+
+
+def _bulk(db, incremental: bool) -> dict:
+    return {
+        "advertisers": bulk_sync_all_advertisers(db, incremental=incremental),
+        "campaigns": bulk_sync_all_campaigns(db, incremental=incremental),
+    }
+
+
+def _pipeline(db, incremental: bool) -> dict:
+    return run_sync_pipeline(db, incremental=incremental)
+
+
+SYNC_PATHS = {"per-record": _per_record, "bulk": _bulk, "pipeline": _pipeline}
+
+
+class QueryCounter:
+    # Counts statements and the time spent executing them, via engine cursor events
+    def __init__(self, engine):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.seconds = 0.0
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("bench_query_start", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["bench_query_start"].pop()
+        with self._lock:
+            self.count += 1
+            self.seconds += elapsed
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.seconds = 0.0
+
+
+def current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def max_rss_bytes() -> int:
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakRss:
+    # Samples RSS while a phase runs. Without /proc, falls back to the process-lifetime peak.
+    def __init__(self):
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="bench-rss", daemon=True)
+
+    def _sample(self):
+        while True:
+            rss = current_rss_bytes()
+            if rss is None:
+                return
+            self.peak = max(self.peak, rss)
+            if self._stop.wait(RSS_SAMPLE_SECONDS):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        if not self.peak:
+            self.peak = max_rss_bytes()
+
+
+def _point_client_at(base_url: str, settings: dict):
+    megaphone_client.BASE_URL = base_url
+    megaphone_client.ORGANIZATION_ID = ORGANIZATION_ID
+    megaphone_client.FETCH_CONCURRENCY = settings["concurrency"]
+    megaphone_client.session.mount("http://", HTTPAdapter(pool_maxsize=max(settings["concurrency"], 10)))
+    rate = settings["rate_limit"] or UNLIMITED_RATE
+    megaphone_client.rate_limiter = TokenBucket(rate=rate, capacity=settings["burst"])
+
+
+def _server_stats(base_url: str) -> dict:
+    return requests.get(f"{base_url}/_bench/stats", timeout=10).json()
+
+
+def run_scenario(base_url: str, size: int, path: str, mode: str, settings: dict) -> dict:
+    # Runs in a child process. Incremental scenarios first run an unmeasured full sync, then
+    # have the fake server edit `touch_fraction` of the records.
+    _point_client_at(base_url, settings)
+    sync = SYNC_PATHS[path]
+    with tempfile.TemporaryDirectory(prefix="megaphone-bench-") as workdir:
+        engine = create_db_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        init_search(engine)
+        init_changes(engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        queries = QueryCounter(engine)
+
+        touched = 0
+        if mode == "incremental":
+            with Session() as db:
+                sync(db, False)
+            touched = requests.post(
+                f"{base_url}/_bench/touch", params={"fraction": settings["touch_fraction"]}, timeout=60
+            ).json()["touched"]
+            queries.reset()
+
+        http_before = _server_stats(base_url)
+        limiter_before = megaphone_client.rate_limiter.stats.snapshot()
+        with PeakRss() as rss:
+            start = time.perf_counter()
+            with Session() as db:
+                result = sync(db, mode == "incremental")
+            wall = time.perf_counter() - start
+        http_after = _server_stats(base_url)
+        limiter = megaphone_client.rate_limiter.stats.snapshot()
+        engine.dispose()
+
+    counts = [result[r] for r in ("advertisers", "campaigns")]
+    records = size + SyntheticOrg(size).advertiser_count
+    return {
+        "size": size,
+        "path": path,
+        "mode": mode,
+        "records": records,
+        "touched": touched,
+        "upserted": sum(c["upserted"] for c in counts),
+        "failed": sum(c["failed"] for c in counts),
+        "deleted": sum(c["deleted"] for c in counts),
+        "wall_seconds": round(wall, 3),
+        "records_per_second": round(records / wall, 1) if wall else None,
+        "peak_rss_mb": round(rss.peak / (1024 * 1024), 1),
+        "queries": queries.count,
+        "query_seconds": round(queries.seconds, 3),
+        "http_requests": http_after["requests"] - http_before["requests"],
+        "http_throttled": http_after["throttled"] - http_before["throttled"],
+        "rate_limiter_wait_seconds": round(limiter["wait_seconds_total"] - limiter_before["wait_seconds_total"], 3),
+        "retries": limiter["retries"] - limiter_before["retries"],
+    }
+
+
+def _in_child(fn, *args):
+    # Spawned, not forked: the child must not inherit this process's memory or connections
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def _format(result: dict) -> str:
+    return (
+        f"{result['size']:>7} {result['path']:<10} {result['mode']:<11} "
+        f"{result['records_per_second']:>10} rec/s {result['wall_seconds']:>9}s "
+        f"{result['peak_rss_mb']:>8} MB {result['queries']:>9} queries "
+        f"{result['http_requests']:>6} http ({result['http_throttled']} throttled)"
+    )
+
+
+def compare(baseline: dict, current: dict, max_regression: float):
+    # Returns (report lines, regressed); a scenario regresses when records/sec drops by more than
+    # `max_regression` percent
+    def key(r):
+        return (r["size"], r["path"], r["mode"])
+
+    previous = {key(r): r for r in baseline["results"]}
+    lines = [f"Baseline {baseline.get('commit')} -> {current.get('commit')}"]
+    regressed = False
+    for result in current["results"]:
+        before = previous.get(key(result))
+        if before is None or not before["records_per_second"] or not result["records_per_second"]:
+            continue
+        change = (result["records_per_second"] / before["records_per_second"] - 1) * 100
+        flag = ""
+        if change < -max_regression:
+            regressed = True
+            flag = "  REGRESSION"
+        lines.append(
+            f"{result['size']:>7} {result['path']:<10} {result['mode']:<11} "
+            f"{before['records_per_second']:>10} -> {result['records_per_second']:>10} rec/s ({change:+.1f}%), "
+            f"queries {before['queries']} -> {result['queries']}, "
+            f"RSS {before['peak_rss_mb']} -> {result['peak_rss_mb']} MB{flag}"
+        )
+    return lines, regressed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sync throughput benchmark against a local fake Megaphone")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="Campaigns per synthetic org")
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=list(PATHS))
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--latency-ms", type=float, default=0, help="Added to every fake Megaphone response")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Extra random latency, uniform in [0, jitter]")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="Share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="Retry-After seconds sent with each 429")
+    parser.add_argument("--rate-limit", type=float, default=0, help="Client calls/second; 0 disables the limit")
+    parser.add_argument("--burst", type=int, default=megaphone_client.RATE_LIMIT_BURST)
+    parser.add_argument("--concurrency", type=int, default=megaphone_client.FETCH_CONCURRENCY)
+    parser.add_argument("--touch-fraction", type=float, default=0.01, help="Records edited before an incremental sync")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help=f"Results file (default {RESULTS_DIR}/sync_throughput-<commit>.json)")
+    parser.add_argument("--baseline", help="Results file to compare this run against")
+    parser.add_argument("--max-regression", type=float, default=10, help="Allowed records/sec drop, in percent")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Compare two results files and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.compare:
+        lines, regressed = compare(load_report(args.compare[0]), load_report(args.compare[1]), args.max_regression)
+        print("\n".join(lines))
+        return 1 if regressed else 0
+
+    settings = {
+        "latency_ms": args.latency_ms,
+        "jitter_ms": args.jitter_ms,
+        "throttle_rate": args.throttle_rate,
+        "retry_after": args.retry_after,
+        "rate_limit": args.rate_limit,
+        "burst": args.burst,
+        "concurrency": args.concurrency,
+        "touch_fraction": args.touch_fraction,
+        "seed": args.seed,
+    }
+    results = []
+    for size in args.sizes:
+        fake = FakeMegaphone(
+            SyntheticOrg(size, seed=args.seed), latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+            throttle_rate=args.throttle_rate, retry_after=args.retry_after, seed=args.seed
+        )
+        with fake:
+            for path in args.paths:
+                for mode in args.modes:
+                    if mode == "incremental" and path == "per-record":
+                        # The per-record sync has no incremental mode
+                        continue
+                    result = _in_child(run_scenario, fake.base_url, size, path, mode, settings)
+                    print(_format(result), flush=True)
+                    results.append(result)
+
+    report = new_report("sync_throughput", settings)
+    report["results"] = results
+    print(f"Results written to {write_report(report, args.output)}")
+
+    if args.baseline:
+        lines, regressed = compare(load_report(args.baseline), report, args.max_regression)
+        print("\n".join(lines))
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
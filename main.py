@@ -1,56 +1,82 @@
 from fastapi import FastAPI
 import logging
+import os
 import sys
 from contextlib import asynccontextmanager
 from datetime import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
 
-from app.db import init_db, SessionLocal
+from app.db import init_db, dispose_async_engines
 from app.apis.campaigns import router as campaign_router
 from app.apis.remote import router as remote_router
 from app.apis.sync import router as sync_router
+from app.apis.changes import router as changes_router
+from app.apis.metrics import router as metrics_router
 
-from app.cruds.sync import sync_all_campaigns, sync_all_advertisers
+from app.cruds.sync_pipeline import run_sync_pipeline
+from app.sync_coordinator import run_sync, SyncBusy
+from app import sync_jobs
 from app.logger import configure_logging
+from app.metrics import MetricsMiddleware, mark_process_dead
+from app.async_megaphone_client import client as async_megaphone_client
 
 configure_logging()
 
+SYNC_INTERVAL_MINUTES = int(os.getenv("SYNC_INTERVAL_MINUTES", "30"))
+FULL_SYNC_INTERVAL_HOURS = int(os.getenv("FULL_SYNC_INTERVAL_HOURS", "6"))
+
 # --- Initialize APScheduler ---
 scheduler = BackgroundScheduler()
 
-def sync_job():
+def sync_job(incremental: bool = False):
+    # Every worker schedules this job; the DB lease lets exactly one of them run it
+    mode = "Incremental" if incremental else "Full"
     try:
-        with SessionLocal() as db:
-            res = sync_all_advertisers(db)
+        res = run_sync(
+            "all",
+            incremental,
+            "scheduled",
+            lambda db, tracker: run_sync_pipeline(db, incremental=incremental, tracker=tracker),
+            wait_seconds=0,
+            join=False,
+        )
+        for resource in ("advertisers", "campaigns"):
+            counts = res[resource]
             logging.info(
-                f"Sync advertisers completed. "
-                f"Successful (Add/Update): {res.get('upserted', 0)}, "
-                f"Failed: {res.get('failed', 0)}, "
-                f"Deleted: {res.get('deleted', 0)}."
+                f"{mode} sync {resource} completed. "
+                f"Successful (Add/Update): {counts.get('upserted', 0)}, "
+                f"Failed: {counts.get('failed', 0)}, "
+                f"Deleted: {counts.get('deleted', 0)}."
             )
-            res = sync_all_campaigns(db)
-            logging.info(
-                f"Sync campaigns completed. "
-                f"Successful (Add/Update): {res.get('upserted', 0)}, "
-                f"Failed: {res.get('failed', 0)}, "
-                f"Deleted: {res.get('deleted', 0)}."
-
-            )
-        logging.info("Sync job completed.")
+        logging.info(f"{mode} sync timings (seconds): {res['timings']}")
+        logging.info(f"{mode} sync job completed.")
+    except SyncBusy:
+        logging.info(f"Scheduled {mode.lower()} sync skipped: another sync holds the lease")
     except Exception:
-        logging.exception("Scheduled sync failed")
+        logging.exception(f"Scheduled {mode.lower()} sync failed")
+
+# Cheap delta sync on the regular interval
+scheduler.add_job(
+    sync_job,
+    'interval',
+    minutes=SYNC_INTERVAL_MINUTES,
+    kwargs={"incremental": True}
+)
 
+# Full reconciliation (including deletions) at startup and on a slower schedule
 scheduler.add_job(
     sync_job,
     'interval',
-    minutes=30,
-    next_run_time=datetime.utcnow()
+    hours=FULL_SYNC_INTERVAL_HOURS,
+    next_run_time=datetime.utcnow(),
+    kwargs={"incremental": False}
 )
 
 # --- Automatically start scheduler ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
+    sync_jobs.fail_orphaned_jobs()
     if "pytest" not in sys.modules:
         scheduler.start()
         logging.info("Scheduler started.")
@@ -58,11 +84,18 @@ async def lifespan(app: FastAPI):
     if scheduler.running:
         scheduler.shutdown(wait=False)
         logging.info("Scheduler shut down.")
+    sync_jobs.shutdown()
+    await async_megaphone_client.aclose()
+    await dispose_async_engines()
+    mark_process_dead()
 
 # --- Create app with lifespan ---
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 # --- Add FastAPI router ---
 app.include_router(campaign_router)
 app.include_router(remote_router)
 app.include_router(sync_router)
+app.include_router(changes_router)
+app.include_router(metrics_router)
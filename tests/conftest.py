@@ -1,29 +1,47 @@
 import pytest
 from fastapi.testclient import TestClient
 from main import app as fastapi_app
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from app.models import Base
+from app.search import init_search
+from app.changes import init_changes
+from app.cache import response_cache
 import app.db
+from app.db import create_db_engine, create_async_db_engine
 import os
 
 # Use a test database
 TEST_DB_URL = "sqlite:///./test_campaign.db"
-engine = create_engine(TEST_DB_URL, connect_args={"check_same_thread": False})
+engine = create_db_engine(TEST_DB_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Each TestClient runs its own event loop, so async connections must not outlive a test
+async_engine = create_async_db_engine(TEST_DB_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 @pytest.fixture(scope="session", autouse=True)
 def setup_test_db():
     app.db.SessionLocal = TestingSessionLocal
+    app.db.AsyncSessionLocal = TestingAsyncSessionLocal
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    init_search(engine)
+    init_changes(engine)
     yield
     Base.metadata.drop_all(bind=engine)
-    if os.path.exists("./test_campaign.db"):
-        try:
-            os.remove("./test_campaign.db")
-        except PermissionError:
-            pass
+    engine.dispose()
+    for path in ("./test_campaign.db", "./test_campaign.db-wal", "./test_campaign.db-shm"):
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except PermissionError:
+                pass
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    # Tests write through db_session directly, bypassing the write paths that bump the cache generation
+    response_cache.clear()
 
 @pytest.fixture(scope="function")
 def db_session():
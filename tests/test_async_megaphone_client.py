@@ -0,0 +1,136 @@
+import asyncio
+import time
+import httpx
+import pytest
+from app.async_megaphone_client import AsyncMegaphoneClient
+from app.rate_limiter import TokenBucket
+from app.cache import AsyncReadThroughCache
+
+
+def paginated_transport(total_pages):
+    def handler(request):
+        page = int(request.url.params.get("page", "1"))
+        links = [f'<https://example.test/api/organizations/org/campaigns?per_page=100&page={total_pages}>; rel="last"']
+        if page < total_pages:
+            links.append(f'<https://example.test/api/organizations/org/campaigns?per_page=100&page={page + 1}>; rel="next"')
+        return httpx.Response(200, json=[{"id": f"c{page}"}], headers={"Link": ", ".join(links)})
+    return httpx.MockTransport(handler)
+
+
+def make_client(transport, cache=None):
+    return AsyncMegaphoneClient(
+        base_url="https://example.test/api",
+        organization_id="org",
+        rate_limiter=TokenBucket(rate=1000, capacity=100),
+        concurrency=3,
+        transport=transport,
+        cache=cache,
+    )
+
+# Test async pagination fetches all pages in order over one pooled client
+def test_async_list_campaigns():
+    async def run():
+        client = make_client(paginated_transport(5))
+        try:
+            return await client.list_campaigns()
+        finally:
+            await client.aclose()
+    assert [c["id"] for c in asyncio.run(run())] == ["c1", "c2", "c3", "c4", "c5"]
+
+# Test a 429 is retried after Retry-After instead of failing the call
+def test_async_request_retries_429():
+    calls = []
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"id": "c1"})
+    async def run():
+        client = make_client(httpx.MockTransport(handler))
+        try:
+            return await client.get_campaign("c1")
+        finally:
+            await client.aclose()
+    assert asyncio.run(run()) == {"id": "c1"}
+    assert len(calls) == 2
+
+# Test HTTP errors surface as httpx.HTTPStatusError
+def test_async_get_campaign_error():
+    transport = httpx.MockTransport(lambda request: httpx.Response(404, json={"error": "not found"}))
+    async def run():
+        client = make_client(transport)
+        try:
+            await client.get_campaign("missing")
+        finally:
+            await client.aclose()
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(run())
+
+# Test the token bucket allows a burst and then refills at the configured rate
+def test_async_token_bucket_refill():
+    async def run():
+        bucket = TokenBucket(rate=50, capacity=2)
+        start = time.monotonic()
+        for _ in range(4):
+            await bucket.acquire_async()
+        return time.monotonic() - start
+    elapsed = asyncio.run(run())
+    assert 0.03 <= elapsed < 0.5
+
+# Test 20 concurrent cache misses trigger a single upstream fetch
+def test_cache_coalesces_concurrent_misses():
+    calls = []
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json=[{"id": "c1"}])
+    async def run():
+        client = make_client(httpx.MockTransport(handler), AsyncReadThroughCache(ttl=60, stale_ttl=0))
+        try:
+            return await asyncio.gather(*[client.list_campaigns() for _ in range(20)])
+        finally:
+            await client.aclose()
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(r == [{"id": "c1"}] for r in results)
+
+# Test stale entries are served immediately while a background refresh runs
+def test_cache_stale_while_revalidate():
+    versions = iter(["v1", "v2"])
+    async def handler(request):
+        return httpx.Response(200, json={"id": "c1", "title": next(versions)})
+    async def run():
+        client = make_client(httpx.MockTransport(handler), AsyncReadThroughCache(ttl=0, stale_ttl=60))
+        try:
+            first = await client.get_campaign("c1")
+            stale = await client.get_campaign("c1")
+            await asyncio.sleep(0.01)
+            refreshed = await client.get_campaign("c1")
+            return first, stale, refreshed
+        finally:
+            await client.aclose()
+    first, stale, refreshed = asyncio.run(run())
+    assert first["title"] == "v1"
+    assert stale["title"] == "v1"
+    assert refreshed["title"] == "v2"
+
+# Test updates write through to the single-campaign entry and invalidate the list
+def test_cache_write_through_on_update():
+    calls = []
+    def handler(request):
+        calls.append(request.method)
+        if request.method == "PUT":
+            return httpx.Response(200, json={"id": "c1", "title": "Updated"})
+        return httpx.Response(200, json=[{"id": "c1", "title": "Original"}])
+    async def run():
+        client = make_client(httpx.MockTransport(handler), AsyncReadThroughCache(ttl=60, stale_ttl=0))
+        try:
+            await client.list_campaigns()
+            await client.update_campaign("c1", {"title": "Updated"})
+            single = await client.get_campaign("c1")
+            await client.list_campaigns()
+            return single
+        finally:
+            await client.aclose()
+    assert asyncio.run(run())["title"] == "Updated"
+    assert calls == ["GET", "PUT", "GET"]
@@ -0,0 +1,50 @@
+import asyncio
+from unittest.mock import patch
+from app import megaphone_client
+from app.rate_limiter import TokenBucket
+from benchmarks.fake_megaphone import FakeMegaphone, SyntheticOrg, ORGANIZATION_ID
+from benchmarks.sync_throughput import compare
+from benchmarks.read_api import seed_database, build_shapes, run_inprocess, collect_plans
+
+# Test the fake Megaphone pages through the real client, 429s included
+def test_fake_megaphone_serves_paginated_org():
+    fake = FakeMegaphone(SyntheticOrg(250), throttle_rate=0.3, retry_after=0)
+    with fake, patch.object(megaphone_client, "BASE_URL", fake.base_url), \
+            patch.object(megaphone_client, "ORGANIZATION_ID", ORGANIZATION_ID), \
+            patch.object(megaphone_client, "rate_limiter", TokenBucket(rate=1e9, capacity=10)):
+        campaigns = megaphone_client.list_campaigns()
+        advertisers = megaphone_client.list_advertisers()
+        fake.org.touch(0.1)
+        touched = megaphone_client.get_campaign(campaigns[0]["id"])
+
+    assert [c["id"] for c in campaigns] == [f"campaign-{i:07d}" for i in range(250)]
+    assert len(advertisers) == fake.org.advertiser_count
+    assert fake.throttled > 0
+    assert touched["id"] == campaigns[0]["id"]
+    assert len(fake.org.campaign_versions) == 25
+
+# Test the regression check between two result files
+def test_compare_flags_throughput_regressions():
+    def report(commit, rate):
+        return {"commit": commit, "results": [
+            {"size": 1000, "path": "bulk", "mode": "full", "records_per_second": rate, "queries": 51, "peak_rss_mb": 70.0}
+        ]}
+
+    _, regressed = compare(report("a", 1000.0), report("b", 950.0), max_regression=10)
+    assert not regressed
+    lines, regressed = compare(report("a", 1000.0), report("b", 800.0), max_regression=10)
+    assert regressed
+    assert "REGRESSION" in lines[-1]
+
+# Test the read API benchmark end to end in-process on a small seeded dataset
+def test_read_api_benchmark_inprocess(tmp_path):
+    url = f"sqlite:///{tmp_path / 'read_api.db'}"
+    seed_database(url, 200)
+    shapes = [s for s in build_shapes(url, 200) if s[0] in ("advertisers", "search=<word>", "page=10", "cursor@page=10")]
+
+    results = asyncio.run(run_inprocess(url, shapes, requests=10, concurrency=2, warmup=1, seed=0))
+    plans = asyncio.run(collect_plans(url, shapes, seed=0))
+
+    assert [r["shape"] for r in results] == [s[0] for s in shapes]
+    assert all(r["requests"] == 10 and r["errors"] == 0 and r["latency_ms"]["p99"] for r in results)
+    assert any("campaign_search" in line for s in plans["search=<word>"] for line in s["plan"])
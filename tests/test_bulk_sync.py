@@ -0,0 +1,174 @@
+import pytest
+from unittest.mock import patch
+from app.models import Campaign, Advertiser, Agency, SyncState, SyncFailure
+from sqlalchemy import insert
+from app.cruds import bulk_sync
+from app.cruds.bulk_sync import bulk_upsert_campaigns, bulk_sync_all_advertisers, bulk_sync_all_campaigns
+from app.cruds.sync import delete_missing
+
+
+def make_campaign(megaphone_id, title, advertiser_id="m-bulk-adv-1", agency=None):
+    return {
+        "id": megaphone_id,
+        "title": title,
+        "advertiserId": advertiser_id,
+        "organizationId": "org-1",
+        "totalBudgetCents": 100,
+        "totalBudgetCurrency": "USD",
+        "createdAt": "2024-01-01T00:00:00Z",
+        "updatedAt": "2024-01-01T00:00:00Z",
+        "copyNeeded": True,
+        "advertiser": {"id": advertiser_id, "name": "Bulk Adv", "agency": agency},
+    }
+
+# Test bulk upsert inserts campaigns, advertisers and agencies in one pass
+def test_bulk_upsert_campaigns_insert(db_session):
+    agency = {"id": "m-bulk-agency-1", "name": "Bulk Agency"}
+    payloads = [
+        make_campaign("m-bulk-camp-1", "Bulk 1", agency=agency),
+        make_campaign("m-bulk-camp-2", "Bulk 2", agency=agency),
+        {"id": "m-bulk-camp-bad"},
+    ]
+    upserted, failed, _ = bulk_upsert_campaigns(db_session, payloads)
+    db_session.commit()
+    assert upserted == 2
+    assert failed == 1
+
+    camp = db_session.query(Campaign).filter_by(megaphone_id="m-bulk-camp-1").one()
+    assert camp.title == "Bulk 1"
+    assert camp.copy_needed is True
+    assert camp.archived is False
+    assert camp.advertiser.megaphone_id == "m-bulk-adv-1"
+    assert camp.advertiser.agency.megaphone_id == "m-bulk-agency-1"
+    assert db_session.query(Agency).filter_by(megaphone_id="m-bulk-agency-1").count() == 1
+    assert db_session.query(SyncFailure).filter_by(resource="campaigns", megaphone_id="m-bulk-camp-bad").delete() == 1
+    db_session.commit()
+
+# Test bulk upsert updates existing rows in place
+def test_bulk_upsert_campaigns_update(db_session):
+    camp_id = db_session.query(Campaign.id).filter_by(megaphone_id="m-bulk-camp-1").scalar()
+    payload = make_campaign("m-bulk-camp-1", "Bulk 1 Updated")
+    payload["updatedAt"] = "2025-01-01T00:00:00Z"
+    upserted, failed, _ = bulk_upsert_campaigns(db_session, [payload])
+    db_session.commit()
+    db_session.expire_all()
+    assert (upserted, failed) == (1, 0)
+
+    camp = db_session.query(Campaign).filter_by(megaphone_id="m-bulk-camp-1").one()
+    assert camp.id == camp_id
+    assert camp.title == "Bulk 1 Updated"
+    assert camp.updated_at.year == 2025
+
+# Test bulk advertiser sync deletes advertisers missing upstream
+def test_bulk_sync_all_advertisers_deletes(db_session):
+    db_session.add(Advertiser(megaphone_id="m-bulk-adv-stale", name="Stale"))
+    db_session.commit()
+    remote = [
+        {"id": a.megaphone_id, "name": a.name}
+        for a in db_session.query(Advertiser).all() if a.megaphone_id != "m-bulk-adv-stale"
+    ]
+    with patch("app.cruds.bulk_sync.iter_advertiser_pages", return_value=[remote]):
+        res = bulk_sync_all_advertisers(db_session)
+    assert res == {"upserted": len(remote), "failed": 0, "deleted": 1}
+    assert db_session.query(Advertiser).filter_by(megaphone_id="m-bulk-adv-stale").count() == 0
+
+# Test incremental sync only applies records newer than the stored watermark
+def test_bulk_sync_all_campaigns_incremental(db_session):
+    old = make_campaign("m-delta-camp-1", "Delta 1")
+    new = make_campaign("m-delta-camp-2", "Delta 2")
+    new["updatedAt"] = "2030-01-01T00:00:00Z"
+    with patch("app.cruds.bulk_sync.iter_campaign_pages", return_value=[[old, new]]):
+        res = bulk_sync_all_campaigns(db_session, incremental=True)
+    assert res == {"upserted": 2, "failed": 0, "deleted": 0}
+    state = db_session.get(SyncState, "campaigns")
+    assert state.watermark.year == 2030
+    assert state.last_full_sync_at is None
+
+    # Older record is skipped even though its payload changed; a full sync would pick it up.
+    # The unchanged newer record is not rewritten, so nothing counts as upserted.
+    old_changed = dict(old, title="Delta 1 Changed")
+    with patch("app.cruds.bulk_sync.iter_campaign_pages", return_value=[[old_changed, new]]):
+        res = bulk_sync_all_campaigns(db_session, incremental=True)
+    assert res == {"upserted": 0, "failed": 0, "deleted": 0}
+    db_session.expire_all()
+    assert db_session.query(Campaign).filter_by(megaphone_id="m-delta-camp-1").one().title == "Delta 1"
+
+# Test streamed pages are written in separate chunks that share the same advertiser row
+@patch("app.cruds.sync.SYNC_CHUNK_SIZE", 1)
+def test_bulk_sync_all_campaigns_streams_chunks(db_session):
+    pages = [
+        [make_campaign("m-stream-camp-1", "Stream 1", advertiser_id="m-stream-adv")],
+        [make_campaign("m-stream-camp-2", "Stream 2", advertiser_id="m-stream-adv")],
+    ]
+    for page in pages:
+        page[0]["updatedAt"] = "2031-01-01T00:00:00Z"
+    with patch("app.cruds.bulk_sync.iter_campaign_pages", return_value=iter(pages)):
+        res = bulk_sync_all_campaigns(db_session, incremental=True)
+    assert res["upserted"] == 2
+    camps = db_session.query(Campaign).filter(Campaign.megaphone_id.in_(["m-stream-camp-1", "m-stream-camp-2"])).all()
+    assert len({c.advertiser_id for c in camps}) == 1
+    assert db_session.query(Advertiser).filter_by(megaphone_id="m-stream-adv").count() == 1
+
+# Test skip_unchanged only loads the comparison state of the chunk's own records
+def test_bulk_upsert_loads_only_chunk_rows(db_session):
+    assert db_session.query(Campaign).count() > 1
+    payload = make_campaign("m-bulk-camp-1", "Bulk 1 Updated")
+    payload["updatedAt"] = "2025-01-01T00:00:00Z"
+    upserted, failed, existing = bulk_upsert_campaigns(db_session, [payload], skip_unchanged=True)
+    db_session.commit()
+    assert (upserted, failed) == (0, 0)
+    assert list(existing) == ["m-bulk-camp-1"]
+
+# Test the set-based deletion pass removes only unseen rows, across several chunks
+@patch("app.cruds.sync.DELETE_CHUNK_SIZE", 2)
+def test_delete_missing_campaigns(db_session):
+    keep = [m for (m,) in db_session.query(Campaign.megaphone_id).all()]
+    for i in range(3):
+        db_session.add(Campaign(megaphone_id=f"m-gone-camp-{i}", title=f"Gone {i}", organization_id="org-1"))
+    db_session.commit()
+
+    assert delete_missing(db_session, Campaign, set(keep), Campaign.title) == 3
+    db_session.commit()
+    assert sorted(m for (m,) in db_session.query(Campaign.megaphone_id).all()) == sorted(keep)
+    # The temp table is dropped afterwards, so the pass can run again in the same session
+    assert delete_missing(db_session, Campaign, set(keep), Campaign.title) == 0
+
+# Test a record rejected by the database fails alone instead of aborting the batched chunk
+def test_bulk_upsert_isolates_database_errors(db_session):
+    good = make_campaign("m-bulk-iso-good", "Isolated Good", advertiser_id="m-bulk-iso-adv")
+    bad = make_campaign("m-bulk-iso-bad", None, advertiser_id="m-bulk-iso-adv")
+    upserted, failed, existing = bulk_upsert_campaigns(db_session, [good, bad])
+    db_session.commit()
+    assert (upserted, failed) == (1, 1)
+    assert db_session.query(Campaign).filter_by(megaphone_id="m-bulk-iso-good").one().advertiser.megaphone_id == "m-bulk-iso-adv"
+    assert db_session.query(Campaign).filter_by(megaphone_id="m-bulk-iso-bad").count() == 0
+    assert "m-bulk-iso-bad" not in existing
+    failure = db_session.query(SyncFailure).filter_by(resource="campaigns", megaphone_id="m-bulk-iso-bad").one()
+    assert "NOT NULL" in failure.error
+
+    # A later clean sync of the record clears its failure
+    upserted, failed, _ = bulk_upsert_campaigns(db_session, [dict(bad, title="Fixed")])
+    db_session.commit()
+    assert (upserted, failed) == (1, 0)
+    assert db_session.query(SyncFailure).filter_by(megaphone_id="m-bulk-iso-bad").count() == 0
+
+# Test campaigns point at the stored advertiser when another writer inserted it after the lookup
+def test_bulk_upsert_remaps_concurrently_inserted_parents(db_session):
+    load_existing = bulk_sync._load_existing
+
+    def load_then_race(db, model, *args, **kwargs):
+        existing = load_existing(db, model, *args, **kwargs)
+        if model is bulk_sync.Advertiser:
+            db.execute(insert(Agency).values(id="race-agency-id", megaphone_id="m-race-agency", name="Raced"))
+            db.execute(insert(Advertiser).values(id="race-adv-id", megaphone_id="m-race-adv", name="Raced"))
+        return existing
+
+    payload = make_campaign("m-race-camp", "Raced", advertiser_id="m-race-adv", agency={"id": "m-race-agency", "name": "Race Agency"})
+    with patch("app.cruds.bulk_sync._load_existing", side_effect=load_then_race):
+        upserted, failed, _ = bulk_upsert_campaigns(db_session, [payload])
+    db_session.commit()
+    assert (upserted, failed) == (1, 0)
+    camp = db_session.query(Campaign).filter_by(megaphone_id="m-race-camp").one()
+    assert camp.advertiser_id == "race-adv-id"
+    assert camp.advertiser.agency_id == "race-agency-id"
+    assert camp.advertiser.name == "Bulk Adv"
@@ -0,0 +1,52 @@
+import time
+import asyncio
+from app.cache import LRUCache, CacheEntry, AsyncReadThroughCache
+
+# Test least recently used entries are evicted first
+def test_lru_eviction():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set("a", CacheEntry(1, b"a"))
+    cache.set("b", CacheEntry(1, b"b"))
+    assert cache.get("a").body == b"a"
+    cache.set("c", CacheEntry(1, b"c"))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+# Test entries expire after the TTL
+def test_ttl_expiry():
+    cache = LRUCache(maxsize=2, ttl=0.01)
+    cache.set("a", CacheEntry(1, b"a"))
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+# Test the read-through cache keeps at most maxsize keys, evicting the least recently used
+def test_read_through_cache_eviction():
+    async def main():
+        cache = AsyncReadThroughCache(ttl=60, stale_ttl=0, maxsize=2)
+        for key in ("a", "b"):
+            await cache.get(key, lambda key=key: asyncio.sleep(0, key))
+        await cache.get("a", lambda: asyncio.sleep(0, "reloaded"))
+        await cache.get("c", lambda: asyncio.sleep(0, "c"))
+        return [await cache.get(key, lambda: asyncio.sleep(0, "reloaded")) for key in ("a", "b")]
+
+    assert asyncio.run(main()) == ["a", "reloaded"]
+
+# Test a load that started before an invalidation does not store its outdated value
+def test_read_through_cache_drops_load_started_before_invalidation():
+    async def main():
+        cache = AsyncReadThroughCache(ttl=60, stale_ttl=0)
+        release = asyncio.Event()
+
+        async def slow_load():
+            await release.wait()
+            return "before write"
+
+        pending = asyncio.ensure_future(cache.get("campaigns", slow_load))
+        await asyncio.sleep(0)
+        cache.invalidate("campaigns")
+        release.set()
+        assert await pending == "before write"
+        return await cache.get("campaigns", lambda: asyncio.sleep(0, "after write"))
+
+    assert asyncio.run(main()) == "after write"
@@ -1,6 +1,13 @@
 import pytest
+from unittest.mock import patch, AsyncMock
 from fastapi.testclient import TestClient
-from app.models import Advertiser
+from datetime import datetime
+from sqlalchemy import text
+from app.models import Advertiser, Agency, Campaign
+from app.schemas.campaigns import CampaignLocalOut, Advertiser as AdvertiserSchema
+from app.cache import bump_generation
+from app.search import init_search, search_index_consistent
+from app.async_megaphone_client import client as megaphone_client
 
 # Helper to create an advertiser
 @pytest.fixture
@@ -126,3 +133,157 @@ def test_filter_archived(client, db_session, advertiser):
     assert resp3.status_code == 200
     items = resp3.json()["items"]
     assert all(c["archived"] is False for c in items)
+
+# Test cursor pagination walks every row exactly once, including NULL sort values
+@pytest.mark.parametrize("sort_by,sort_order", [("created_at", "desc"), ("total_budget_cents", "asc"), ("title", "desc")])
+def test_list_campaigns_cursor(client, db_session, advertiser, sort_by, sort_order):
+    if not db_session.query(Campaign).filter(Campaign.megaphone_id.like("m-cursor-%")).count():
+        for i in range(7):
+            db_session.add(Campaign(
+                megaphone_id=f"m-cursor-{i}",
+                title=f"Cursor Campaign {i % 3}",
+                advertiser_id=advertiser.id,
+                organization_id="org-cursor",
+                total_budget_cents=None if i % 2 else i,
+                created_at=datetime(2024, 1, 1 + i % 4),
+            ))
+        db_session.commit()
+
+    params = {"search": "Cursor Campaign", "sort_by": sort_by, "sort_order": sort_order, "per_page": 3, "include_total": False}
+    seen = []
+    resp = client.get("/campaigns", params=params).json()
+    assert resp["meta"]["total"] is None
+    seen += [c["megaphone_id"] for c in resp["items"]]
+    while resp["meta"]["next_cursor"]:
+        resp = client.get("/campaigns", params={**params, "cursor": resp["meta"]["next_cursor"]}).json()
+        seen += [c["megaphone_id"] for c in resp["items"]]
+    assert sorted(seen) == sorted(f"m-cursor-{i}" for i in range(7))
+
+    offset_ids = [c["megaphone_id"] for c in client.get("/campaigns", params={**params, "per_page": 100}).json()["items"]]
+    assert seen == offset_ids
+
+# Test a malformed or mismatched cursor is rejected
+def test_list_campaigns_invalid_cursor(client):
+    assert client.get("/campaigns", params={"cursor": "not-a-cursor"}).status_code == 400
+
+# Test full-text search: prefix and multi-term matching over title, advertiser and agency, kept in sync on writes
+def test_list_campaigns_full_text_search(client, db_session):
+    agency = Agency(megaphone_id="m-fts-agency", name="Northwind Media")
+    adv = Advertiser(megaphone_id="m-fts-adv", name="Acme Outdoors", agency=agency)
+    db_session.add_all([
+        Campaign(megaphone_id="m-fts-1", title="Summer Podcast Promo", advertiser=adv, organization_id="org-fts"),
+        Campaign(megaphone_id="m-fts-2", title="Winter Podcast Promo", advertiser=adv, organization_id="org-fts"),
+    ])
+    db_session.commit()
+
+    def search(term, **params):
+        resp = client.get("/campaigns", params={"search": term, **params})
+        assert resp.status_code == 200
+        return [c["megaphone_id"] for c in resp.json()["items"]]
+
+    assert search("summ podc") == ["m-fts-1"]
+    assert sorted(search("acme")) == ["m-fts-1", "m-fts-2"]
+    assert sorted(search("northwind promo")) == ["m-fts-1", "m-fts-2"]
+    assert search("summer", sort_by="relevance")[0] == "m-fts-1"
+
+    adv.name = "Globex"
+    db_session.query(Campaign).filter_by(megaphone_id="m-fts-2").one().title = "Autumn Podcast Promo"
+    bump_generation(db_session)
+    db_session.commit()
+    assert search("acme") == []
+    assert sorted(search("globex")) == ["m-fts-1", "m-fts-2"]
+    assert search("autumn") == ["m-fts-2"]
+
+# Test search still finds the right campaigns after their rowids change (as VACUUM may do)
+def test_full_text_search_survives_rowid_renumbering(client, db_session):
+    db_session.add_all([
+        Campaign(megaphone_id="m-vac-1", title="Zephyr Alpha", organization_id="org-vac"),
+        Campaign(megaphone_id="m-vac-2", title="Quasar Beta", organization_id="org-vac"),
+    ])
+    db_session.commit()
+    db_session.execute(text("UPDATE campaigns SET rowid = -rowid WHERE megaphone_id LIKE 'm-vac-%'"))
+    db_session.commit()
+
+    def search(term):
+        resp = client.get("/campaigns", params={"search": term})
+        assert resp.status_code == 200
+        return [c["megaphone_id"] for c in resp.json()["items"]]
+
+    assert search("zephyr") == ["m-vac-1"]
+    assert search("quasar") == ["m-vac-2"]
+
+    # An index without keys (e.g. one keyed on campaigns.rowid) is rebuilt on startup
+    engine = db_session.get_bind()
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM campaign_search_keys"))
+        assert not search_index_consistent(conn)
+    init_search(engine)
+    with engine.connect() as conn:
+        assert search_index_consistent(conn)
+    assert search("quasar") == ["m-vac-2"]
+
+# Test list responses carry an ETag, answer 304 when unchanged and refresh after a write
+def test_list_campaigns_etag(client, db_session, advertiser):
+    params = {"search": "Etag Campaign"}
+    resp = client.get("/campaigns", params=params)
+    etag = resp.headers["etag"]
+    assert resp.json()["items"] == []
+
+    resp2 = client.get("/campaigns", params=params, headers={"If-None-Match": etag})
+    assert resp2.status_code == 304
+
+    db_session.add(Campaign(megaphone_id="m-etag-1", title="Etag Campaign", advertiser_id=advertiser.id, organization_id="org-etag"))
+    bump_generation(db_session)
+    db_session.commit()
+    resp3 = client.get("/campaigns", params=params, headers={"If-None-Match": etag})
+    assert resp3.status_code == 200
+    assert resp3.headers["etag"] != etag
+    assert [c["megaphone_id"] for c in resp3.json()["items"]] == ["m-etag-1"]
+
+# Test create and update store the Megaphone response through the async session
+def test_create_update_campaign_async_client(client, advertiser):
+    remote = {
+        "id": "m-async-1",
+        "title": "Async Campaign",
+        "advertiserId": advertiser.megaphone_id,
+        "advertiser": {"id": advertiser.megaphone_id, "name": advertiser.name, "agency": None},
+        "organizationId": "org-async",
+        "totalBudgetCents": 10,
+        "totalBudgetCurrency": "USD",
+        "createdAt": "2024-01-01T00:00:00Z",
+        "updatedAt": "2024-01-01T00:00:00Z",
+    }
+    with patch.object(megaphone_client, "create_campaign", AsyncMock(return_value=remote)):
+        resp = client.post("/campaigns", json={
+            "title": "Async Campaign", "advertiser_id": advertiser.id, "total_budget_cents": 10, "total_budget_currency": "USD"
+        })
+    assert resp.status_code == 201
+    assert resp.json()["megaphone_id"] == "m-async-1"
+    assert resp.json()["advertiser"]["id"] == advertiser.id
+
+    updated = {**remote, "title": "Async Campaign Renamed", "updatedAt": "2024-02-01T00:00:00Z"}
+    with patch.object(megaphone_client, "update_campaign", AsyncMock(return_value=updated)) as update:
+        resp = client.put(f"/campaigns/{resp.json()['id']}", json={"title": "Async Campaign Renamed"})
+    assert resp.status_code == 200
+    assert resp.json()["title"] == "Async Campaign Renamed"
+    assert update.await_args.args[0] == "m-async-1"
+
+# Test the column-tuple list path returns exactly what CampaignLocalOut would serialize, key order included
+def test_list_campaigns_matches_response_schema(client, db_session):
+    agency = Agency(megaphone_id=None, name="Fast Agency")
+    adv = Advertiser(megaphone_id="m-fast-adv", name="Fast Adv", agency=agency)
+    camp = Campaign(
+        megaphone_id="m-fast-1", title="Fast Path Campaign", advertiser=adv, organization_id="org-fast",
+        total_budget_cents=500, total_budget_currency="USD", created_at=datetime(2024, 3, 1, 12, 30),
+    )
+    db_session.add(camp)
+    db_session.commit()
+
+    items = client.get("/campaigns", params={"advertiser_id": adv.id}).json()["items"]
+    expected = CampaignLocalOut.model_validate(camp, from_attributes=True).model_dump(mode="json")
+    assert items == [expected]
+    assert list(items[0]) == list(expected)
+    assert list(items[0]["advertiser"]) == list(expected["advertiser"])
+    assert items[0]["advertiser"]["agency"]["megaphone_id"] is None
+    advertisers = client.get("/advertisers").json()
+    assert AdvertiserSchema.model_validate(adv, from_attributes=True).model_dump(mode="json") in advertisers
@@ -0,0 +1,75 @@
+import asyncio
+from app.models import Advertiser, Campaign
+from app.changes import latest_seq
+from app.change_stream import campaign_events
+from app.cache import bump_generation
+
+def test_change_feed_records_insert_update_delete(client, db_session):
+    since = latest_seq(db_session)
+    adv = Advertiser(megaphone_id="m-chg-adv", name="Change Adv")
+    camp = Campaign(megaphone_id="m-chg-1", title="Before", advertiser=adv, organization_id="org-chg")
+    db_session.add(camp)
+    db_session.commit()
+
+    camp.title = "After"
+    db_session.commit()
+    # Bookkeeping-only writes are not reported as changes
+    camp.synced_at = None
+    db_session.commit()
+    db_session.delete(camp)
+    db_session.commit()
+
+    res = client.get("/changes", params={"since": since, "entity": "campaigns"})
+    assert res.status_code == 200
+    body = res.json()
+    assert [(c["op"], c["megaphone_id"]) for c in body["items"]] == [
+        ("insert", "m-chg-1"), ("update", "m-chg-1"), ("delete", "m-chg-1")
+    ]
+    assert body["items"][1]["changed_fields"] == ["title"]
+    assert body["next_since"] == body["items"][-1]["seq"]
+    assert body["has_more"] is False
+
+    res = client.get("/changes", params={"since": body["next_since"], "entity": "campaigns"})
+    assert res.json()["items"] == []
+
+def test_change_feed_paging(client, db_session):
+    since = latest_seq(db_session)
+    db_session.add_all([Advertiser(megaphone_id=f"m-chg-page-{i}", name=f"Adv {i}") for i in range(3)])
+    db_session.commit()
+
+    first = client.get("/changes", params={"since": since, "limit": 2}).json()
+    assert len(first["items"]) == 2
+    assert first["has_more"] is True
+    rest = client.get("/changes", params={"since": first["next_since"], "limit": 2}).json()
+    assert [c["megaphone_id"] for c in rest["items"]] == ["m-chg-page-2"]
+    assert rest["has_more"] is False
+    assert rest["latest_seq"] == rest["next_since"]
+
+# Test the SSE stream replays filtered changes, then pushes a committed write without waiting a poll interval
+def test_campaign_event_stream(db_session):
+    adv = Advertiser(megaphone_id="m-sse-adv", name="Stream Adv")
+    other = Advertiser(megaphone_id="m-sse-other", name="Other Adv")
+    since = latest_seq(db_session)
+    db_session.add_all([
+        Campaign(megaphone_id="m-sse-1", title="Streamed", advertiser=adv, organization_id="org-stream"),
+        Campaign(megaphone_id="m-sse-2", title="Filtered out", advertiser=other, organization_id="org-stream"),
+    ])
+    db_session.commit()
+
+    async def run():
+        events = campaign_events(since, advertiser_id=adv.id)
+        try:
+            first = await asyncio.wait_for(anext(events), 2)
+            camp = db_session.query(Campaign).filter_by(megaphone_id="m-sse-1").one()
+            camp.archived = True
+            bump_generation(db_session)
+            db_session.commit()
+            second = await asyncio.wait_for(anext(events), 1)
+            return first, second
+        finally:
+            await events.aclose()
+
+    first, second = asyncio.run(run())
+    assert first.startswith("id: ") and "event: campaign" in first
+    assert '"op":"insert"' in first and '"megaphone_id":"m-sse-1"' in first
+    assert '"op":"update"' in second and '"changed_fields":["archived"]' in second
@@ -0,0 +1,38 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.pool import NullPool
+import app.db
+from app.db import create_db_engine, create_async_db_engine
+from app.models import Base, Campaign
+
+# Test every SQLite connection is tuned so readers don't block behind the sync writer
+def test_sqlite_pragmas(db_session):
+    pragma = lambda name: db_session.execute(text(f"PRAGMA {name}")).scalar()
+    assert pragma("journal_mode") == "wal"
+    assert pragma("synchronous") == 1  # NORMAL
+    assert pragma("busy_timeout") == 5000
+    assert pragma("cache_size") == -65536
+
+# Test reads go to the replica until the client writes, then follow it to the primary
+def test_read_your_writes_routing(client, db_session, tmp_path, monkeypatch):
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    replica = create_db_engine(replica_url)
+    Base.metadata.create_all(bind=replica)
+    async_replica = create_async_db_engine(replica_url, poolclass=NullPool)
+    monkeypatch.setattr(app.db, "AsyncReadSessionLocal", async_sessionmaker(async_replica, expire_on_commit=False))
+
+    camp = Campaign(megaphone_id="m-replica-1", title="Primary only", organization_id="org-replica")
+    db_session.add(camp)
+    db_session.commit()
+
+    # Not replicated yet
+    assert client.get(f"/campaigns/{camp.id}").status_code == 404
+
+    resp = client.put(f"/campaigns/{camp.id}/archive", json={"archived": True})
+    assert resp.status_code == 200
+    assert app.db.READ_PRIMARY_COOKIE in resp.cookies
+
+    resp = client.get(f"/campaigns/{camp.id}")
+    assert resp.status_code == 200
+    assert resp.json()["archived"] is True
+    replica.dispose()
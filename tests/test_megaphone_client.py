@@ -0,0 +1,53 @@
+import pytest
+from unittest.mock import patch
+from urllib.parse import urlparse, parse_qs
+from app import megaphone_client
+from app.megaphone_client import fetch_all_paginated, parse_link_header
+
+BASE = "https://example.test/api/campaigns?per_page=2"
+
+
+class FakeResponse:
+    def __init__(self, url, body, headers=None):
+        self.url = url
+        self._body = body
+        self.headers = headers or {}
+
+    def json(self):
+        return self._body
+
+
+def fake_pages(total_pages, with_last=True, with_total=False):
+    def request(method, url, **kwargs):
+        page = int(parse_qs(urlparse(url).query).get("page", ["1"])[0])
+        links = []
+        if page < total_pages:
+            links.append(f'<{BASE}&page={page + 1}>; rel="next"')
+        if with_last:
+            links.append(f'<{BASE}&page={total_pages}>; rel="last"')
+        headers = {"Link": ", ".join(links)} if links else {}
+        if with_total:
+            headers["X-Total"] = str(total_pages * 2)
+        return FakeResponse(url, [{"id": f"p{page}-a"}, {"id": f"p{page}-b"}], headers)
+    return request
+
+# Test Link header parsing
+def test_parse_link_header():
+    links = parse_link_header('<https://x/a?page=2>; rel="next", <https://x/a?page=9>; rel="last"')
+    assert links == {"next": "https://x/a?page=2", "last": "https://x/a?page=9"}
+    assert parse_link_header(None) == {}
+
+# Test concurrent fetching keeps page order, using rel="last" or X-Total
+@pytest.mark.parametrize("with_last,with_total", [(True, False), (False, True)])
+def test_fetch_all_paginated_concurrent(with_last, with_total):
+    with patch.object(megaphone_client, "safe_request", side_effect=fake_pages(6, with_last, with_total)) as req:
+        results = fetch_all_paginated(BASE, concurrency=3)
+    assert [r["id"] for r in results] == [f"p{p}-{s}" for p in range(1, 7) for s in "ab"]
+    assert req.call_count == 6
+
+# Test serial fallback when the total page count is unknown
+def test_fetch_all_paginated_serial_fallback():
+    with patch.object(megaphone_client, "safe_request", side_effect=fake_pages(3, with_last=False)):
+        results = fetch_all_paginated(BASE, concurrency=3)
+    assert len(results) == 6
+    assert results[-1]["id"] == "p3-b"
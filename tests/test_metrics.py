@@ -0,0 +1,68 @@
+import os
+import sys
+import subprocess
+from unittest.mock import patch, MagicMock
+from prometheus_client import REGISTRY, CollectorRegistry
+from prometheus_client.multiprocess import MultiProcessCollector
+from app import megaphone_client
+from app.metrics import endpoint_label
+from app.rate_limiter import TokenBucket
+
+# Test that requests are labeled by route template and database statements are timed
+def test_metrics_endpoint_reports_http_and_db(client):
+    before = REGISTRY.get_sample_value(
+        "http_request_duration_seconds_count", {"method": "GET", "route": "/campaigns", "status": "200"}
+    ) or 0
+    assert client.get("/campaigns").status_code == 200
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    assert REGISTRY.get_sample_value(
+        "http_request_duration_seconds_count", {"method": "GET", "route": "/campaigns", "status": "200"}
+    ) == before + 1
+    assert REGISTRY.get_sample_value("db_query_duration_seconds_count", {"operation": "SELECT"}) > 0
+    assert "threadpool_threads_limit" in resp.text
+    assert 'db_pool_size{engine="primary"}' in resp.text
+
+# Test that Megaphone URLs collapse to bounded endpoint templates
+def test_endpoint_label():
+    assert endpoint_label("https://x.test/api/organizations/org-1/campaigns?page=3") == "/organizations/{org_id}/campaigns"
+    assert endpoint_label("https://x.test/api/organizations/org-1/campaigns/abc") == "/organizations/{org_id}/campaigns/{id}"
+    assert endpoint_label("https://x.test/api/advertisers") == "/api/advertisers"
+
+# Test that each attempt of a retried call is counted with its status
+def test_safe_request_counts_attempts():
+    url = "https://x.test/api/organizations/org-1/campaigns/abc"
+    labels = {"method": "GET", "endpoint": "/organizations/{org_id}/campaigns/{id}"}
+
+    def count(status):
+        return REGISTRY.get_sample_value("megaphone_requests_total", {**labels, "status": status}) or 0
+
+    throttled = MagicMock(status_code=429, headers={"Retry-After": "0"})
+    ok = MagicMock(status_code=200, headers={})
+    before = count("429"), count("200")
+    with patch.object(megaphone_client.session, "request", side_effect=[throttled, ok]), \
+            patch.object(megaphone_client, "rate_limiter", TokenBucket(rate=1e9, capacity=10)):
+        assert megaphone_client.safe_request("GET", url) is ok
+
+    assert (count("429"), count("200")) == (before[0] + 1, before[1] + 1)
+
+# Test that in multiprocess mode a scrape sees the counters and gauges of every worker
+def test_multiprocess_metrics_aggregate_workers(tmp_path):
+    worker = (
+        "from app.metrics import MEGAPHONE_REQUESTS, SYNC_JOBS_RUNNING\n"
+        "MEGAPHONE_REQUESTS.labels('GET', '/organizations/{org_id}/campaigns', '200').inc(3)\n"
+        "SYNC_JOBS_RUNNING.inc()\n"
+    )
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", worker], env=env, check=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry, path=str(tmp_path))
+    assert registry.get_sample_value(
+        "megaphone_requests_total", {"method": "GET", "endpoint": "/organizations/{org_id}/campaigns", "status": "200"}
+    ) == 6
+    # Live gauges are summed until a worker is marked dead, which these children never were
+    assert registry.get_sample_value("sync_jobs_running") == 2
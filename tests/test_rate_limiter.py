@@ -0,0 +1,80 @@
+import asyncio
+import sqlite3
+import threading
+import pytest
+from unittest.mock import patch, MagicMock
+from app import megaphone_client
+from app.rate_limiter import TokenBucket, parse_retry_after, should_retry, backoff_delay
+
+
+def fake_response(status_code, headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    return response
+
+# Test Retry-After parsing for delta-seconds and HTTP-date values
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+
+# Test retry policy and bounded jittered backoff
+def test_retry_policy():
+    assert should_retry("POST", 429)
+    assert should_retry("GET", 503)
+    assert not should_retry("POST", 503)
+    assert not should_retry("GET", 404)
+    assert all(0 <= backoff_delay(10, 1.0, 5.0) <= 5.0 for _ in range(20))
+
+# Test two bucket instances on the same state file share one budget (as separate workers would)
+def test_shared_bucket_state(tmp_path):
+    path = str(tmp_path / "rate_limit.db")
+    worker_a = TokenBucket(rate=0.001, capacity=2, state_path=path)
+    worker_b = TokenBucket(rate=0.001, capacity=2, state_path=path)
+    assert worker_a.try_acquire() == 0
+    assert worker_b.try_acquire() == 0
+    assert worker_a.try_acquire() > 0
+    worker_b.pause(30)
+    assert worker_a.try_acquire() >= 29
+
+# Test safe_request backs off on 429 and records the retry
+def test_safe_request_retries_429():
+    bucket = TokenBucket(rate=1000, capacity=10)
+    responses = [fake_response(429, {"Retry-After": "0"}), fake_response(200)]
+    with patch.object(megaphone_client, "rate_limiter", bucket), \
+            patch.object(megaphone_client.session, "request", side_effect=responses) as request:
+        response = megaphone_client.safe_request("GET", "https://example.test/api")
+    assert response.status_code == 200
+    assert request.call_count == 2
+    stats = bucket.stats.snapshot()
+    assert stats["throttled"] == 1
+    assert stats["acquired"] == 2
+
+# Test a file-backed bucket waiting on another process's lock does not block the event loop
+def test_acquire_async_does_not_block_event_loop(tmp_path):
+    path = str(tmp_path / "bucket.db")
+    bucket = TokenBucket(rate=100, capacity=1, state_path=path)
+    bucket.try_acquire()
+    holder = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    holder.execute("BEGIN IMMEDIATE")
+    threading.Timer(0.3, lambda: holder.execute("COMMIT")).start()
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        await bucket.acquire_async()
+        await bucket.pause_async(0)
+        ticker.cancel()
+        return ticks
+
+    assert asyncio.run(main()) >= 10
+    holder.close()
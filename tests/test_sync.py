@@ -1,6 +1,9 @@
+import json
 import pytest
 from unittest.mock import patch
-from app.cruds.sync import sync_campaign, sync_advertiser
+from sqlalchemy import event, insert
+from app.models import Campaign, SyncFailure
+from app.cruds.sync import sync_campaign, sync_advertiser, SyncIdentityMap, sync_chunk, retry_failed_campaigns
 from app.cruds.sync import parse_datetime_safe
 from datetime import datetime
 
@@ -115,3 +118,60 @@ def test_sync_campaign_update(mock_sync_adv, db_session):
     assert camp2.megaphone_id == "m-camp-2"
     assert camp2.title == "Updated Title"
     assert camp2.updated_at.year == 2025
+
+# Test a shared advertiser and agency are resolved once per run, not once per campaign
+def test_sync_campaign_identity_map(db_session):
+    agency = {"id": "m-idmap-agency", "name": "IdMap Agency"}
+    advertiser = {"id": "m-idmap-adv", "name": "IdMap Adv", "agency": agency}
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+    try:
+        identities = SyncIdentityMap()
+        for i in range(10):
+            camp = sync_campaign(db_session, {
+                "id": f"m-idmap-{i}", "title": f"IdMap {i}", "organizationId": "org-idmap", "advertiser": advertiser
+            }, identities)
+            assert camp.advertiser.megaphone_id == "m-idmap-adv"
+        db_session.commit()
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+    lookups = [s for s in statements if s.lstrip().startswith("SELECT") and ("FROM advertisers" in s or "FROM agencies" in s)]
+    assert len(lookups) == 2
+    assert db_session.query(Campaign).filter(Campaign.megaphone_id.like("m-idmap-%")).count() == 10
+
+# Test a record that fails to flush rolls back alone and is recorded for retry
+def test_sync_chunk_isolates_failures(db_session):
+    advertiser = {"id": "m-sp-adv", "name": "Savepoint Adv", "agency": None}
+    good = {"id": "m-sp-good", "title": "Good", "organizationId": "org-sp", "advertiser": advertiser}
+    bad = {"id": "m-sp-bad", "title": None, "organizationId": "org-sp", "advertiser": advertiser}
+    upserted, failed = sync_chunk(db_session, "campaigns", sync_campaign, [good, bad], SyncIdentityMap())
+    db_session.commit()
+    assert (upserted, failed) == (1, 1)
+    assert db_session.query(Campaign).filter_by(megaphone_id="m-sp-good").count() == 1
+    failure = db_session.query(SyncFailure).filter_by(resource="campaigns", megaphone_id="m-sp-bad").one()
+    assert failure.attempts == 1
+    assert json.loads(failure.payload)["id"] == "m-sp-bad"
+
+    # Retry re-fetches only the failed campaign and clears it once it syncs
+    fixed = {**bad, "title": "Fixed"}
+    with patch("app.cruds.sync.get_campaign", return_value=fixed) as fetch:
+        res = retry_failed_campaigns(db_session)
+    fetch.assert_called_once_with("m-sp-bad")
+    assert res == {"upserted": 1, "failed": 0, "deleted": 0}
+    assert db_session.query(Campaign).filter_by(megaphone_id="m-sp-bad").one().title == "Fixed"
+    assert db_session.query(SyncFailure).filter_by(megaphone_id="m-sp-bad").count() == 0
+
+# Test a sync write succeeds after another connection (e.g. the lease heartbeat) committed since its last read
+def test_sync_chunk_after_concurrent_commit(db_session):
+    assert db_session.query(Campaign).filter_by(megaphone_id="m-snap").count() == 0
+    with db_session.get_bind().connect() as other:
+        other.execute(insert(SyncFailure).values(resource="snapshot-test", error="heartbeat", attempts=1))
+        other.commit()
+
+    payload = {"id": "m-snap", "title": "Snapshot", "organizationId": "org-snap", "advertiser": None}
+    upserted, failed = sync_chunk(db_session, "campaigns", sync_campaign, [payload], SyncIdentityMap())
+    db_session.commit()
+    assert (upserted, failed) == (1, 0)
+    db_session.query(SyncFailure).filter_by(resource="snapshot-test").delete()
+    db_session.commit()
@@ -0,0 +1,236 @@
+import json
+import sys
+import time
+import socket
+import threading
+import subprocess
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from sqlalchemy import update
+from app import db as database, sync_jobs
+from app.apis import sync as sync_api
+from app.models import Campaign, SyncLease, SyncRun
+from app.sync_coordinator import try_acquire_lease, release_lease, run_sync, SyncBusy, SyncLeaseLost, PROCESS_ID, _record_joined
+
+
+def make_campaign(megaphone_id):
+    return {
+        "id": megaphone_id,
+        "title": f"Coordinated {megaphone_id}",
+        "organizationId": "org-1",
+        "updatedAt": "2031-06-01T00:00:00Z",
+        "advertiser": {"id": "m-coord-adv", "name": "Coordinated Adv"},
+    }
+
+# Test only one owner holds the lease until it is released or expires
+def test_sync_lease_exclusive():
+    assert try_acquire_lease("worker-a")
+    assert not try_acquire_lease("worker-b")
+    release_lease("worker-a")
+    assert try_acquire_lease("worker-b", ttl=-1)
+    # worker-b's lease is already expired, so it can be taken over
+    assert try_acquire_lease("worker-c")
+    release_lease("worker-c")
+
+# Test taking over an expired lease fails the run its dead leader left running
+def test_lease_takeover_fails_abandoned_run(db_session):
+    run = SyncRun(resource="campaigns", mode="full", trigger="manual", owner="dead-host:1:abcd", status="running")
+    db_session.add(run)
+    db_session.commit()
+    assert try_acquire_lease("dead-host:1:abcd", ttl=-1)
+    db_session.execute(update(SyncLease).where(SyncLease.name == "sync").values(run_id=run.id))
+    db_session.commit()
+
+    assert try_acquire_lease("worker-d")
+    db_session.expire_all()
+    assert run.status == "failed"
+    assert run.error == "lease_expired"
+    assert run.finished_at is not None
+    release_lease("worker-d")
+    db_session.delete(run)
+    db_session.commit()
+
+# Test a second request for the same resource joins the in-flight run instead of syncing again
+@patch("app.sync_coordinator.SYNC_POLL_SECONDS", 0.01)
+def test_run_sync_coalesces_requests():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    results = {}
+
+    def slow_sync(db, tracker):
+        calls.append(1)
+        list(tracker.track([[1], [2]]))
+        started.set()
+        release.wait(5)
+        return {"campaigns": {"upserted": 2, "failed": 0, "deleted": 0}}
+
+    def request(name, **kwargs):
+        results[name] = run_sync("campaigns", False, "manual", slow_sync, **kwargs)
+
+    leader = threading.Thread(target=request, args=("leader",))
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=request, args=("follower",))
+    follower.start()
+
+    # A different resource cannot start while the lease is held
+    with pytest.raises(SyncBusy):
+        run_sync("advertisers", False, "manual", slow_sync, wait_seconds=0)
+
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert len(calls) == 1
+    assert results["leader"] == results["follower"] == {"upserted": 2, "failed": 0, "deleted": 0}
+
+# Test a run that loses its lease stops writing and is recorded as failed
+@patch("app.sync_coordinator.SYNC_PROGRESS_SECONDS", 0.02)
+def test_run_sync_aborts_when_lease_lost(db_session):
+    trackers = []
+
+    def sync(db, tracker):
+        trackers.append(tracker)
+        list(tracker.track([[1]]))
+        db.add(Campaign(megaphone_id="m-lost-1", title="Before loss", organization_id="org-1"))
+        db.commit()
+        # Another worker takes the lease over, as after an expiry
+        with database.SessionLocal() as other:
+            other.execute(update(SyncLease).values(owner="other-worker"))
+            other.commit()
+        assert tracker.lease_lost.wait(5)
+        db.add(Campaign(megaphone_id="m-lost-2", title="After loss", organization_id="org-1"))
+        db.commit()
+        return {"campaigns": {"upserted": 2, "failed": 0, "deleted": 0}}
+
+    with pytest.raises(SyncLeaseLost):
+        run_sync("campaigns", False, "manual", sync)
+    with pytest.raises(SyncLeaseLost):
+        list(trackers[0].track([[2]]))
+
+    assert db_session.query(Campaign).filter_by(megaphone_id="m-lost-1").count() == 1
+    assert db_session.query(Campaign).filter_by(megaphone_id="m-lost-2").count() == 0
+    run = db_session.query(SyncRun).order_by(SyncRun.id.desc()).first()
+    assert run.status == "failed"
+    assert "lease_lost" in run.error
+    # The new holder keeps the lease
+    assert db_session.get(SyncLease, "sync").owner == "other-worker"
+    release_lease("other-worker")
+
+def wait_for_job(client, job_id):
+    for _ in range(200):
+        job = client.get(f"/sync/jobs/{job_id}").json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"sync job {job_id} did not finish")
+
+# Test manual syncs run in the background and report progress and the final result by job ID
+def test_sync_job_lifecycle(client):
+    syncers = dict(sync_api.SYNCERS)
+    syncers["campaigns"] = (lambda: iter([[make_campaign("m-coord-camp-1")]]),) + syncers["campaigns"][1:]
+    with patch.dict(sync_api.SYNCERS, syncers):
+        response = client.post("/sync/campaigns?incremental=true")
+        assert response.status_code == 202
+        accepted = response.json()
+        assert response.headers["Location"] == f"/sync/jobs/{accepted['job_id']}"
+        job = wait_for_job(client, accepted["job_id"])
+
+    assert job["status"] == "success"
+    assert job["pages_fetched"] == 1
+    assert job["result"]["upserted"] == 1
+    assert job["result"]["status"] == "success"
+    assert client.get("/sync/jobs/999999").status_code == 404
+
+    runs = client.get("/sync/runs", params={"resource": "campaigns", "limit": 1}).json()
+    assert runs[0]["id"] == accepted["job_id"]
+    assert runs[0]["mode"] == "incremental"
+    assert runs[0]["trigger"] == "manual"
+    assert runs[0]["finished_at"] is not None
+
+# Test queued jobs that can never run are failed, on shutdown and on the next startup
+def test_queued_jobs_failed_on_shutdown_and_startup(db_session):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    old = datetime.utcnow() - timedelta(seconds=2 * sync_jobs.SYNC_JOB_WAIT_SECONDS + 60)
+    runs = {
+        "mine": SyncRun(resource="campaigns", mode="full", trigger="manual", owner=PROCESS_ID, status="queued"),
+        "dead": SyncRun(resource="campaigns", mode="full", trigger="manual", owner=f"{socket.gethostname()}:{dead.pid}", status="queued"),
+        "live": SyncRun(resource="campaigns", mode="full", trigger="manual", owner="other-host:1", status="queued"),
+        "stale": SyncRun(resource="campaigns", mode="full", trigger="manual", owner="other-host:1", status="queued", started_at=old),
+    }
+    db_session.add_all(runs.values())
+    db_session.commit()
+
+    sync_jobs.shutdown()
+    db_session.expire_all()
+    assert runs["mine"].status == "failed"
+    assert "cancelled" in runs["mine"].error
+    assert runs["dead"].status == "queued"
+
+    assert sync_jobs.fail_orphaned_jobs() == 2
+    db_session.expire_all()
+    assert {name: run.status for name, run in runs.items()} == {
+        "mine": "failed", "dead": "failed", "live": "queued", "stale": "failed"
+    }
+    db_session.delete(runs["live"])
+    db_session.commit()
+
+# Test a run left "running" by a leader that died is failed at startup, while the live run is kept
+def test_running_jobs_of_dead_leader_failed_on_startup(db_session):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    runs = {
+        "expired": SyncRun(resource="all", mode="full", trigger="scheduled", owner="other-host:1:aaaa", status="running"),
+        "dead": SyncRun(resource="campaigns", mode="full", trigger="manual", owner=f"{socket.gethostname()}:{dead.pid}:bbbb", status="running"),
+        "unleased": SyncRun(resource="campaigns", mode="full", trigger="manual", owner="other-host:2:cccc", status="running"),
+    }
+    db_session.add_all(runs.values())
+    db_session.commit()
+
+    # The leader of "expired" died: its lease ran out without being taken over
+    assert try_acquire_lease("other-host:1:aaaa", ttl=-1)
+    assert sync_jobs.fail_orphaned_jobs() == 3
+    db_session.expire_all()
+    assert {name: run.status for name, run in runs.items()} == {"expired": "failed", "dead": "failed", "unleased": "failed"}
+    assert runs["expired"].error == "lease_expired"
+    assert runs["expired"].finished_at is not None
+    release_lease("other-host:1:aaaa")
+
+    # A run whose owner holds a live lease is still in flight
+    live = SyncRun(resource="campaigns", mode="full", trigger="manual", owner="other-host:2:dddd", status="running")
+    db_session.add(live)
+    db_session.commit()
+    assert try_acquire_lease("other-host:2:dddd")
+    assert sync_jobs.fail_orphaned_jobs() == 0
+    db_session.expire_all()
+    assert live.status == "running"
+    release_lease("other-host:2:dddd")
+    for run in [*runs.values(), live]:
+        db_session.delete(run)
+    db_session.commit()
+
+# Test a per-resource job that joined an "all" run reports only its own resource's counts
+def test_joined_job_reports_own_resource(client, db_session):
+    details = {
+        "advertisers": {"upserted": 7, "failed": 2, "deleted": 1},
+        "campaigns": {"upserted": 3, "failed": 0, "deleted": 4},
+    }
+    joined = SyncRun(
+        resource="all", mode="full", trigger="scheduled", owner="other-host:1:eeee", status="partial_failure", finished_at=datetime.utcnow(),
+        upserted=10, failed=2, deleted=5, details=json.dumps(details)
+    )
+    job = SyncRun(resource="campaigns", mode="full", trigger="manual", owner=PROCESS_ID, status="queued")
+    db_session.add_all([joined, job])
+    db_session.commit()
+
+    _record_joined(job.id, joined)
+    body = client.get(f"/sync/jobs/{job.id}").json()
+    assert body["status"] == "success"
+    assert body["coalesced_into"] == joined.id
+    assert (body["upserted"], body["failed"], body["deleted"]) == (3, 0, 4)
+    assert body["result"]["status"] == "success"
+    db_session.delete(job)
+    db_session.delete(joined)
+    db_session.commit()
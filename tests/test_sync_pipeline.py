@@ -0,0 +1,74 @@
+import threading
+import pytest
+from unittest.mock import patch
+from app.models import Campaign, Advertiser
+from app.cruds.bulk_sync import bulk_sync_all_advertisers
+from app.cruds.sync_pipeline import run_sync_pipeline
+
+
+def logged_pages(name, pages, events):
+    for i, page in enumerate(pages):
+        events.append(f"{name} fetched {i}")
+        yield page
+
+
+def make_campaign(megaphone_id, advertiser_id):
+    return {
+        "id": megaphone_id,
+        "title": f"Pipeline {megaphone_id}",
+        "organizationId": "org-1",
+        "updatedAt": "2032-01-01T00:00:00Z",
+        "advertiser": {"id": advertiser_id, "name": "Pipeline Adv"},
+    }
+
+# Test both resources are fetched concurrently and written in order, with per-stage timings
+def test_run_sync_pipeline_overlaps_fetches(db_session):
+    advertiser_pages = [[{"id": f"m-pipe-adv-{i}", "name": f"Pipe Adv {i}", "updatedAt": "2032-01-01T00:00:00Z"}] for i in range(3)]
+    campaign_pages = [[make_campaign(f"m-pipe-camp-{i}", f"m-pipe-adv-{i}")] for i in range(3)]
+    events = []
+    campaigns_fetched = threading.Event()
+    overlapped = []
+
+    def advertiser_fetch():
+        yield from logged_pages("advertisers", advertiser_pages[:-1], events)
+        # With serial fetching, no campaign page could be fetched before the advertisers are done
+        overlapped.append(campaigns_fetched.wait(timeout=5))
+        yield from logged_pages("advertisers", advertiser_pages[-1:], events)
+
+    def campaign_fetch():
+        yield from logged_pages("campaigns", campaign_pages, events)
+        campaigns_fetched.set()
+
+    def write_advertisers(*args, **kwargs):
+        result = bulk_sync_all_advertisers(*args, **kwargs)
+        events.append("advertisers written")
+        return result
+
+    with patch("app.cruds.sync_pipeline.iter_advertiser_pages", return_value=advertiser_fetch()), \
+            patch("app.cruds.sync_pipeline.iter_campaign_pages", return_value=campaign_fetch()), \
+            patch("app.cruds.sync_pipeline.bulk_sync_all_advertisers", side_effect=write_advertisers):
+        res = run_sync_pipeline(db_session, incremental=True)
+
+    assert res["advertisers"]["upserted"] == 3
+    assert res["campaigns"]["upserted"] == 3
+    # Campaign pages were fetched while advertisers were still being fetched and written
+    assert overlapped == [True]
+    assert events.index("campaigns fetched 2") < events.index("advertisers written")
+    timings = res["timings"]
+    assert timings["campaigns"]["pages"] == 3
+    assert {"fetch_seconds", "wait_seconds", "write_seconds", "total_seconds"} <= set(timings["advertisers"])
+
+    camp = db_session.query(Campaign).filter_by(megaphone_id="m-pipe-camp-1").one()
+    assert camp.advertiser.megaphone_id == "m-pipe-adv-1"
+
+# Test a failed campaign fetch aborts the run after advertisers were committed
+def test_run_sync_pipeline_fetch_error(db_session):
+    def failing_pages():
+        yield [make_campaign("m-pipe-camp-fail", "m-pipe-adv-fail")]
+        raise RuntimeError("Megaphone unavailable")
+    advertiser_pages = [[{"id": "m-pipe-adv-committed", "name": "Committed"}]]
+    with patch("app.cruds.sync_pipeline.iter_advertiser_pages", return_value=iter(advertiser_pages)), \
+            patch("app.cruds.sync_pipeline.iter_campaign_pages", return_value=failing_pages()):
+        with pytest.raises(RuntimeError):
+            run_sync_pipeline(db_session, incremental=True)
+    assert db_session.query(Advertiser).filter_by(megaphone_id="m-pipe-adv-committed").count() == 1